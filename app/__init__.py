@@ -56,6 +56,9 @@ def create_app(config_class=None):
 
     _register_error_handlers(app)
 
+    from app.utils.key_rotation import rotate_keys_command
+    app.cli.add_command(rotate_keys_command)
+
     return app
 
 
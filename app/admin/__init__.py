@@ -2,4 +2,4 @@ from flask import Blueprint
 
 admin_bp = Blueprint('admin', __name__, template_folder='../templates/admin')
 
-from app.admin import routes  # noqa: E402, F401
+from app.admin import routes, commands  # noqa: E402, F401
@@ -0,0 +1,59 @@
+import click
+from flask import current_app
+
+from app.admin import admin_bp
+from app.extensions import db
+
+
+@admin_bp.cli.command('audit-maintain')
+@click.option('--months-ahead', type=int, default=None,
+              help='Monthly audit partitions to create ahead of the current month.')
+def audit_maintain_command(months_ahead):
+    """Create upcoming audit log partitions and apply the retention policy."""
+    from app.utils.audit_retention import (
+        PARTITION_MONTHS_AHEAD, AuditPartitioningError, apply_audit_retention,
+        ensure_audit_partitions,
+    )
+
+    if months_ahead is None:
+        months_ahead = PARTITION_MONTHS_AHEAD
+    created = ensure_audit_partitions(db.session.connection(), months_ahead=months_ahead)
+    db.session.commit()
+    if created:
+        click.echo(f"Created audit partitions: {', '.join(created)}")
+
+    retention_days = current_app.config['AUDIT_RETENTION_DAYS']
+    if retention_days <= 0:
+        click.echo('Audit retention disabled; keeping all entries.')
+        return
+    archive = current_app.config['AUDIT_ARCHIVE']
+    try:
+        result = apply_audit_retention(
+            retention_days, archive=archive,
+            batch_size=current_app.config['AUDIT_RETENTION_BATCH_SIZE'],
+        )
+    except AuditPartitioningError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    verb = 'Archived' if archive else 'Deleted'
+    click.echo(
+        f"{verb} {result['partitions']} monthly partitions and {result['rows']} entries "
+        f"older than {retention_days} days."
+    )
+
+
+@admin_bp.cli.command('audit-partition')
+def audit_partition_command():
+    """Convert existing audit tables to monthly partitions (PostgreSQL).
+
+    Needed once for databases not created by db.create_all(). Copies every
+    entry and locks the audit log while it runs, so schedule a quiet time.
+    """
+    from app.utils.audit_retention import partition_audit_tables
+
+    converted = partition_audit_tables(db.session.connection())
+    db.session.commit()
+    if converted:
+        click.echo(f"Partitioned {', '.join(converted)}.")
+    else:
+        click.echo('Audit tables are already partitioned, or the database is not PostgreSQL.')
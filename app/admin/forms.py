@@ -2,7 +2,7 @@ from flask_wtf import FlaskForm
 from wtforms import (
     StringField, SelectField, BooleanField, SubmitField, PasswordField, IntegerField,
 )
-from wtforms.validators import DataRequired, Length, Optional
+from wtforms.validators import DataRequired, Length, Optional, Regexp
 
 
 class EditUserForm(FlaskForm):
@@ -44,6 +44,11 @@ class DefaultAWSForm(FlaskForm):
         ('ap-southeast-2', 'Asia Pacific (Sydney)'),
         ('ap-northeast-1', 'Asia Pacific (Tokyo)'),
     ])
+    discovery_regions = StringField('Discovery Regions', validators=[
+        Optional(), Length(max=1024),
+        Regexp(r'^\s*(all|[a-z0-9\-]+(\s*,\s*[a-z0-9\-]+)*)\s*$',
+               message='Comma-separated region names, or "all" for every enabled region.')
+    ])
     submit = SubmitField('Save Default AWS')
 
 
@@ -1,5 +1,8 @@
-from flask import render_template, redirect, url_for, flash, request
+import uuid
+
+from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required
+from sqlalchemy.orm import joinedload
 
 from app.admin import admin_bp
 from app.admin.forms import (
@@ -12,6 +15,11 @@ from app.models.audit_log import AuditLog
 from app.models.system_setting import SystemSetting
 from app.utils.decorators import admin_required
 from app.utils.audit import log_action
+from app.utils.keyset import paginate_keyset
+
+
+AUDIT_PAGE_SIZE = 50
+AUDIT_TARGET_TYPES = ['user', 'cloud_connection']
 
 
 @admin_bp.route('/users')
@@ -77,17 +85,22 @@ def system_settings():
         form.ldap_bind_user_dn.data = SystemSetting.get('ldap_bind_user_dn', '')
 
     if form.validate_on_submit():
-        SystemSetting.set('registration_enabled', str(form.registration_enabled.data).lower())
-        SystemSetting.set('ldap_enabled', str(form.ldap_enabled.data).lower())
-        SystemSetting.set('ldap_host', form.ldap_host.data or '')
-        SystemSetting.set('ldap_port', str(form.ldap_port.data or 389))
-        SystemSetting.set('ldap_use_ssl', str(form.ldap_use_ssl.data).lower())
-        SystemSetting.set('ldap_base_dn', form.ldap_base_dn.data or '')
-        SystemSetting.set('ldap_user_dn', form.ldap_user_dn.data or '')
-        SystemSetting.set('ldap_user_login_attr', form.ldap_user_login_attr.data or 'sAMAccountName')
-        SystemSetting.set('ldap_bind_user_dn', form.ldap_bind_user_dn.data or '')
+        values = {
+            'registration_enabled': str(form.registration_enabled.data).lower(),
+            'ldap_enabled': str(form.ldap_enabled.data).lower(),
+            'ldap_host': form.ldap_host.data or '',
+            'ldap_port': str(form.ldap_port.data or 389),
+            'ldap_use_ssl': str(form.ldap_use_ssl.data).lower(),
+            'ldap_base_dn': form.ldap_base_dn.data or '',
+            'ldap_user_dn': form.ldap_user_dn.data or '',
+            'ldap_user_login_attr': form.ldap_user_login_attr.data or 'sAMAccountName',
+            'ldap_bind_user_dn': form.ldap_bind_user_dn.data or '',
+        }
+        encrypted = []
         if form.ldap_bind_user_password.data:
-            SystemSetting.set('ldap_bind_user_password', form.ldap_bind_user_password.data, encrypted=True)
+            values['ldap_bind_user_password'] = form.ldap_bind_user_password.data
+            encrypted.append('ldap_bind_user_password')
+        SystemSetting.set_many(values, encrypted=encrypted)
 
         log_action('update_settings')
         flash('Settings saved.', 'success')
@@ -96,16 +109,68 @@ def system_settings():
     return render_template('admin/settings.html', form=form)
 
 
+@admin_bp.route('/ldap-pool')
+@login_required
+@admin_required
+def ldap_pool_status():
+    # Pools are per worker process, so this reports the worker that served it
+    from app.utils.ldap_pool import ldap_pool_metrics
+    return jsonify({'pool': ldap_pool_metrics()})
+
+
+@admin_bp.route('/rate-limits')
+@login_required
+@admin_required
+def rate_limit_status():
+    # Per worker process, like the LDAP pool metrics
+    from app.utils.rate_limit import rate_limit_metrics
+    return jsonify({'rate_limits': rate_limit_metrics()})
+
+
 @admin_bp.route('/audit-log')
 @login_required
 @admin_required
 def audit_log_view():
-    page = request.args.get('page', 1, type=int)
-    per_page = 50
-    pagination = AuditLog.query.order_by(
-        AuditLog.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
-    return render_template('admin/audit_log.html', pagination=pagination)
+    user_id = request.args.get('user_id')
+    action = request.args.get('action', '').strip()
+    target_type = request.args.get('target_type')
+    target_id = request.args.get('target_id', '').strip()
+
+    query = AuditLog.query.options(joinedload(AuditLog.user))
+    try:
+        if user_id:
+            query = query.filter(AuditLog.user_id == uuid.UUID(user_id))
+        if target_id:
+            query = query.filter(AuditLog.target_id == uuid.UUID(target_id))
+    except ValueError:
+        flash('Invalid user or target ID.', 'danger')
+        return redirect(url_for('admin.audit_log_view'))
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if target_type:
+        query = query.filter(AuditLog.target_type == target_type)
+
+    # Keyset pagination: no COUNT(*) or OFFSET over the whole table
+    page = paginate_keyset(
+        query, (AuditLog.created_at, AuditLog.id), lambda e: (e.created_at, e.id),
+        AUDIT_PAGE_SIZE,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=True,
+    )
+    users = User.query.with_entities(User.id, User.username).order_by(User.username).all()
+    return render_template(
+        'admin/audit_log.html',
+        page=page,
+        users=users,
+        target_types=AUDIT_TARGET_TYPES,
+        filters={
+            'user_id': user_id or '',
+            'action': action,
+            'target_type': target_type or '',
+            'target_id': target_id,
+        },
+    )
 
 
 @admin_bp.route('/defaults/aws', methods=['GET', 'POST'])
@@ -120,6 +185,7 @@ def default_aws():
     if request.method == 'GET' and existing:
         form.name.data = existing.name
         form.aws_default_region.data = existing.region
+        form.discovery_regions.data = existing.get_discovery_regions_text()
 
     if form.validate_on_submit():
         if existing is None:
@@ -130,6 +196,7 @@ def default_aws():
 
         existing.name = form.name.data
         existing.region = form.aws_default_region.data
+        existing.set_discovery_regions(form.discovery_regions.data)
         existing.set_credentials({
             'aws_access_key_id': form.aws_access_key_id.data,
             'aws_secret_access_key': form.aws_secret_access_key.data,
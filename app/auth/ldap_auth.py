@@ -3,47 +3,61 @@ from flask import current_app
 
 from app.extensions import db
 from app.models.user import User
+from app.utils.ldap_pool import get_ldap_pool
+
+
+USER_ATTRIBUTES = ['mail', 'cn', 'sAMAccountName']
 
 
 def try_ldap_login(username, password):
     config = current_app.config
-    server = ldap3.Server(
-        config['LDAP_HOST'],
-        port=config['LDAP_PORT'],
-        use_ssl=config['LDAP_USE_SSL'],
-        get_info=ldap3.NONE,
-    )
+    pool = get_ldap_pool(config)
 
-    user_dn = f"{config['LDAP_USER_RDN_ATTR']}={username},{config['LDAP_USER_DN']},{config['LDAP_BASE_DN']}"
+    # Search for the user to get their email and display info
+    search_base = f"{config['LDAP_USER_DN']},{config['LDAP_BASE_DN']}"
+    search_filter = f"({config['LDAP_USER_LOGIN_ATTR']}={ldap3.utils.conv.escape_filter_chars(username)})"
+    lookup = (search_base, search_filter, USER_ATTRIBUTES)
 
     try:
-        conn = ldap3.Connection(server, user=user_dn, password=password)
-        if conn.bind():
-            # Search for the user to get their email and display info
-            search_base = f"{config['LDAP_USER_DN']},{config['LDAP_BASE_DN']}"
-            search_filter = f"({config['LDAP_USER_LOGIN_ATTR']}={ldap3.utils.conv.escape_filter_chars(username)})"
-            conn.search(
-                search_base,
-                search_filter,
-                attributes=['mail', 'cn', 'sAMAccountName'],
-            )
-            if conn.entries:
-                entry = conn.entries[0]
-                return {
-                    'username': username,
-                    'email': str(entry.mail) if hasattr(entry, 'mail') else f'{username}@ldap.local',
-                    'display_name': str(entry.cn) if hasattr(entry, 'cn') else username,
-                }
-            conn.unbind()
-            return {'username': username, 'email': f'{username}@ldap.local'}
-    except ldap3.core.exceptions.LDAPException:
+        if pool.has_service_account:
+            entry = pool.find_user(*lookup)
+            if entry is None:
+                current_app.logger.warning(f'LDAP authentication failed for user: {username}')
+                return None
+            ok, _ = pool.check_password(entry['dn'], password)
+        else:
+            user_dn = f"{config['LDAP_USER_RDN_ATTR']}={username},{config['LDAP_USER_DN']},{config['LDAP_BASE_DN']}"
+            ok, entry = pool.check_password(user_dn, password, lookup=lookup)
+    except ldap3.core.exceptions.LDAPException as e:
+        current_app.logger.warning(f'LDAP error during login for user {username}: {e}')
+        return None
+
+    if not ok:
         current_app.logger.warning(f'LDAP authentication failed for user: {username}')
+        return None
+    if entry is None:
+        return {'username': username, 'email': f'{username}@ldap.local'}
+    attributes = entry['attributes']
+    return {
+        'username': username,
+        'email': _first_value(attributes.get('mail')) or f'{username}@ldap.local',
+        'display_name': _first_value(attributes.get('cn')) or username,
+    }
 
-    return None
 
+def _first_value(value):
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    return str(value) if value else None
 
-def sync_ldap_user(ldap_result):
-    user = User.query.filter_by(username=ldap_result['username']).first()
+
+def sync_ldap_user(ldap_result, user=None):
+    """Return the local user for an LDAP login, creating it on first login.
+
+    Pass the user if the caller already looked it up, to skip the query.
+    """
+    if user is None:
+        user = User.query.filter_by(username=ldap_result['username']).first()
     if user is None:
         user = User(
             username=ldap_result['username'],
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 
 from app.auth import auth_bp
@@ -8,6 +8,8 @@ from app.auth.forms import LoginForm, RegistrationForm, ChangePasswordForm
 from app.extensions import db
 from app.models.user import User
 from app.utils.audit import log_action
+from app.utils.login_throttle import get_login_throttle
+from app.utils.password_hashing import HashingBusy
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -17,34 +19,46 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
+        throttle = get_login_throttle(current_app.config)
+        if throttle.locked_for(form.username.data):
+            flash('Too many failed sign-in attempts. Please try again later.', 'danger')
+            return render_template('auth/login.html', form=form), 429
 
-        # Local authentication
-        if user and user.is_active and user.auth_method == 'local':
-            if user.check_password(form.password.data):
-                login_user(user, remember=form.remember_me.data)
-                user.last_login = datetime.now(timezone.utc)
-                db.session.commit()
-                log_action('login')
-                next_page = request.args.get('next')
-                return redirect(next_page or url_for('main.dashboard'))
-
-        # LDAP authentication (if enabled)
-        from flask import current_app
-        if current_app.config.get('LDAP_ENABLED'):
-            from app.auth.ldap_auth import try_ldap_login, sync_ldap_user
-            ldap_result = try_ldap_login(
-                form.username.data, form.password.data
-            )
-            if ldap_result:
-                user = sync_ldap_user(ldap_result)
-                login_user(user, remember=form.remember_me.data)
-                user.last_login = datetime.now(timezone.utc)
-                db.session.commit()
-                log_action('login_ldap')
-                next_page = request.args.get('next')
-                return redirect(next_page or url_for('main.dashboard'))
+        user = User.query.filter_by(username=form.username.data).first()
 
+        try:
+            # Local authentication
+            if user and user.is_active and user.auth_method == 'local':
+                if user.check_password(form.password.data):
+                    throttle.record_success(form.username.data)
+                    login_user(user, remember=form.remember_me.data)
+                    user.last_login = datetime.now(timezone.utc)
+                    db.session.commit()
+                    log_action('login')
+                    next_page = request.args.get('next')
+                    return redirect(next_page or url_for('main.dashboard'))
+
+            # LDAP authentication (if enabled), unless the name belongs to a local account
+            elif current_app.config.get('LDAP_ENABLED') and (user is None or user.auth_method == 'ldap'):
+                from app.auth.ldap_auth import try_ldap_login, sync_ldap_user
+                ldap_result = try_ldap_login(
+                    form.username.data, form.password.data
+                )
+                if ldap_result and (user is None or user.is_active):
+                    throttle.record_success(form.username.data)
+                    user = sync_ldap_user(ldap_result, user)
+                    login_user(user, remember=form.remember_me.data)
+                    user.last_login = datetime.now(timezone.utc)
+                    db.session.commit()
+                    log_action('login_ldap')
+                    next_page = request.args.get('next')
+                    return redirect(next_page or url_for('main.dashboard'))
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html', form=form), 503
+
+        if throttle.record_failure(form.username.data):
+            current_app.logger.warning(f'Sign-in locked out after repeated failures: {form.username.data}')
         flash('Invalid username or password.', 'danger')
 
     return render_template('auth/login.html', form=form)
@@ -96,7 +110,12 @@ def change_password():
 
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        if not current_user.check_password(form.current_password.data):
+        try:
+            password_ok = current_user.check_password(form.current_password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/change_password.html', form=form), 503
+        if not password_ok:
             flash('Current password is incorrect.', 'danger')
         else:
             current_user.set_password(form.new_password.data)
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 cloud_bp = Blueprint('cloud', __name__, template_folder='../templates/cloud')
 
-from app.cloud import routes  # noqa: E402, F401
+from app.cloud import routes, commands  # noqa: E402, F401
@@ -1,99 +1,133 @@
-from app.utils.cli_runner import run_aws_command
+import threading
+import time
 
+from flask import current_app
 
+from app.cloud.discovery import discovers
+from app.utils.providers import get_backend
+
+ALL_REGIONS = 'all'
+
+# Enabled regions per access key: {access_key_id: (expires_at, [regions])}
+_enabled_regions_cache = {}
+_enabled_regions_lock = threading.Lock()
+
+
+def get_enabled_regions(credentials):
+    """Return the regions enabled for the account, cached per access key."""
+    key = credentials['aws_access_key_id']
+    now = time.monotonic()
+    with _enabled_regions_lock:
+        cached = _enabled_regions_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    data = get_backend().aws_call('ec2', 'describe_regions', credentials)
+    regions = sorted(r['RegionName'] for r in data.get('Regions', []))
+
+    ttl = current_app.config['AWS_REGION_CACHE_SECONDS']
+    with _enabled_regions_lock:
+        _enabled_regions_cache[key] = (now + ttl, regions)
+    return regions
+
+
+def get_discovery_regions(connection, credentials):
+    default_region = credentials.get('aws_default_region', 'us-east-1')
+    regions = connection.discovery_regions or []
+    if ALL_REGIONS in regions:
+        return get_enabled_regions(credentials) or [default_region]
+    return regions or [default_region]
+
+
+@discovers('ec2_instance')
 def discover_ec2_instances(credentials):
-    data = run_aws_command(['ec2', 'describe-instances'], credentials)
-    resources = []
-    for reservation in data.get('Reservations', []):
-        for instance in reservation.get('Instances', []):
-            name = ''
-            for tag in instance.get('Tags', []):
-                if tag['Key'] == 'Name':
-                    name = tag['Value']
-                    break
-            resources.append({
-                'resource_type': 'ec2_instance',
-                'resource_id': instance['InstanceId'],
-                'resource_name': name,
-                'region': credentials.get('aws_default_region', 'us-east-1'),
-                'raw_data': instance,
-            })
-    return resources
+    for page in get_backend().aws_pages('ec2', 'describe_instances', credentials):
+        for reservation in page.get('Reservations', []):
+            for instance in reservation.get('Instances', []):
+                name = ''
+                for tag in instance.get('Tags', []):
+                    if tag['Key'] == 'Name':
+                        name = tag['Value']
+                        break
+                yield {
+                    'resource_type': 'ec2_instance',
+                    'resource_id': instance['InstanceId'],
+                    'resource_name': name,
+                    'region': credentials.get('aws_default_region', 'us-east-1'),
+                    'raw_data': instance,
+                }
 
 
+@discovers('s3_bucket')
 def discover_s3_buckets(credentials):
-    data = run_aws_command(['s3api', 'list-buckets'], credentials)
-    resources = []
+    # One call: bucket counts are capped per account, and CLIs older than
+    # late 2024 reject --max-items for list-buckets
+    data = get_backend().aws_call('s3', 'list_buckets', credentials)
     for bucket in data.get('Buckets', []):
-        resources.append({
+        yield {
             'resource_type': 's3_bucket',
             'resource_id': bucket['Name'],
             'resource_name': bucket['Name'],
-            'region': credentials.get('aws_default_region', 'us-east-1'),
+            'region': bucket.get('BucketRegion', 'global'),
             'raw_data': bucket,
-        })
-    return resources
+        }
 
 
+@discovers('rds_instance')
 def discover_rds_instances(credentials):
-    data = run_aws_command(['rds', 'describe-db-instances'], credentials)
-    resources = []
-    for db_inst in data.get('DBInstances', []):
-        resources.append({
-            'resource_type': 'rds_instance',
-            'resource_id': db_inst.get('DBInstanceArn', db_inst['DBInstanceIdentifier']),
-            'resource_name': db_inst['DBInstanceIdentifier'],
-            'region': credentials.get('aws_default_region', 'us-east-1'),
-            'raw_data': db_inst,
-        })
-    return resources
+    for page in get_backend().aws_pages('rds', 'describe_db_instances', credentials):
+        for db_inst in page.get('DBInstances', []):
+            yield {
+                'resource_type': 'rds_instance',
+                'resource_id': db_inst.get('DBInstanceArn', db_inst['DBInstanceIdentifier']),
+                'resource_name': db_inst['DBInstanceIdentifier'],
+                'region': credentials.get('aws_default_region', 'us-east-1'),
+                'raw_data': db_inst,
+            }
 
 
+@discovers('lambda_function')
 def discover_lambda_functions(credentials):
-    data = run_aws_command(['lambda', 'list-functions'], credentials)
-    resources = []
-    for func in data.get('Functions', []):
-        resources.append({
-            'resource_type': 'lambda_function',
-            'resource_id': func.get('FunctionArn', func['FunctionName']),
-            'resource_name': func['FunctionName'],
-            'region': credentials.get('aws_default_region', 'us-east-1'),
-            'raw_data': func,
-        })
-    return resources
+    for page in get_backend().aws_pages('lambda', 'list_functions', credentials):
+        for func in page.get('Functions', []):
+            yield {
+                'resource_type': 'lambda_function',
+                'resource_id': func.get('FunctionArn', func['FunctionName']),
+                'resource_name': func['FunctionName'],
+                'region': credentials.get('aws_default_region', 'us-east-1'),
+                'raw_data': func,
+            }
 
 
+@discovers('iam_user')
 def discover_iam_users(credentials):
-    data = run_aws_command(['iam', 'list-users'], credentials)
-    resources = []
-    for user in data.get('Users', []):
-        resources.append({
-            'resource_type': 'iam_user',
-            'resource_id': user.get('Arn', user['UserName']),
-            'resource_name': user['UserName'],
-            'region': 'global',
-            'raw_data': user,
-        })
-    return resources
+    for page in get_backend().aws_pages('iam', 'list_users', credentials):
+        for user in page.get('Users', []):
+            yield {
+                'resource_type': 'iam_user',
+                'resource_id': user.get('Arn', user['UserName']),
+                'resource_name': user['UserName'],
+                'region': 'global',
+                'raw_data': user,
+            }
 
 
+@discovers('vpc')
 def discover_vpcs(credentials):
-    data = run_aws_command(['ec2', 'describe-vpcs'], credentials)
-    resources = []
-    for vpc in data.get('Vpcs', []):
-        name = ''
-        for tag in vpc.get('Tags', []):
-            if tag['Key'] == 'Name':
-                name = tag['Value']
-                break
-        resources.append({
-            'resource_type': 'vpc',
-            'resource_id': vpc['VpcId'],
-            'resource_name': name or vpc['VpcId'],
-            'region': credentials.get('aws_default_region', 'us-east-1'),
-            'raw_data': vpc,
-        })
-    return resources
+    for page in get_backend().aws_pages('ec2', 'describe_vpcs', credentials):
+        for vpc in page.get('Vpcs', []):
+            name = ''
+            for tag in vpc.get('Tags', []):
+                if tag['Key'] == 'Name':
+                    name = tag['Value']
+                    break
+            yield {
+                'resource_type': 'vpc',
+                'resource_id': vpc['VpcId'],
+                'resource_name': name or vpc['VpcId'],
+                'region': credentials.get('aws_default_region', 'us-east-1'),
+                'raw_data': vpc,
+            }
 
 
 AWS_DISCOVERY_FUNCTIONS = [
@@ -104,3 +138,9 @@ AWS_DISCOVERY_FUNCTIONS = [
     discover_iam_users,
     discover_vpcs,
 ]
+
+# Account-wide services: run once per discovery rather than once per region
+AWS_GLOBAL_DISCOVERY_FUNCTIONS = {
+    discover_s3_buckets,
+    discover_iam_users,
+}
@@ -0,0 +1,62 @@
+import click
+
+from app.cloud import cloud_bp
+from app.extensions import db
+
+
+@cloud_bp.cli.command('rebuild-search-index')
+@click.option('--batch-size', default=1000, show_default=True)
+def rebuild_search_index_command(batch_size):
+    """Recompute the search index for all cached resources."""
+    from app.cloud.search import rebuild_search_index
+    count = rebuild_search_index(batch_size=batch_size)
+    click.echo(f'Reindexed {count} resources.')
+
+
+@cloud_bp.cli.command('init-search')
+@click.option('--batch-size', default=1000, show_default=True)
+def init_search_command(batch_size):
+    """Create the search index if missing and index all cached resources.
+
+    Needed once for databases not created by db.create_all(); safe to rerun.
+    """
+    from app.cloud.search import init_search_index
+    count = init_search_index(batch_size=batch_size)
+    click.echo(f'Search index ready; indexed {count} resources.')
+
+
+@cloud_bp.cli.command('recompute-stats')
+def recompute_stats_command():
+    """Rebuild the per-connection resource counts shown on the dashboard."""
+    from app.cloud.stats import refresh_resource_stats
+    count = refresh_resource_stats()
+    db.session.commit()
+    click.echo(f'Recomputed {count} resource stats.')
+
+
+@cloud_bp.cli.command('run-scheduler')
+@click.option('--once', is_flag=True, help='Run a single scheduling pass and exit.')
+def run_scheduler_command(once):
+    """Run scheduled discovery in the foreground.
+
+    For deployments not served by gunicorn (see deploy/gunicorn.conf.py).
+    Several copies may run; only the lease holder starts jobs.
+    """
+    import time
+
+    from flask import current_app
+
+    from app.cloud.jobs import shutdown_discovery_jobs
+    from app.cloud.scheduler import DiscoveryScheduler
+
+    scheduler = DiscoveryScheduler(current_app._get_current_object())
+    try:
+        while True:
+            for job in scheduler.tick():
+                click.echo(f'Started discovery job {job.id} for connection {job.connection_id}.')
+            if once:
+                break
+            time.sleep(current_app.config['DISCOVERY_SCHEDULER_TICK_SECONDS'])
+    finally:
+        scheduler.stop()
+        shutdown_discovery_jobs()
@@ -1,53 +1,349 @@
+import hashlib
+import json
+import queue
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+
 from flask import current_app
 
+from app.cloud.search import build_search_text
+from app.cloud.stats import refresh_resource_stats
 from app.extensions import db
 from app.models.cached_resource import CachedResource
-from app.utils.cli_runner import CLIError
+from app.utils.bulk import bulk_insert
+from app.utils.providers import ProviderError
 
+# region is None for tasks that cover every region (global services, Azure)
+DiscoveryTask = namedtuple('DiscoveryTask', ['label', 'fn', 'credentials', 'region'])
 
-def run_discovery(connection):
-    credentials = connection.get_credentials()
+DELETE_CHUNK_SIZE = 500
+
+
+def discovers(resource_type):
+    """Mark the resource type a discovery function returns.
+
+    Reconciliation uses it to know which slice of the cache a successful
+    call is authoritative for, even when the call returns nothing.
+    """
+    def decorator(fn):
+        fn.resource_type = resource_type
+        return fn
+    return decorator
+
+
+def get_discovery_functions(provider, resource_types=None):
+    """Return the discovery functions for a provider.
 
-    if connection.provider == 'aws':
-        from app.cloud.aws_service import AWS_DISCOVERY_FUNCTIONS
-        discovery_functions = AWS_DISCOVERY_FUNCTIONS
-    elif connection.provider == 'azure':
-        from app.cloud.azure_service import AZURE_DISCOVERY_FUNCTIONS
-        discovery_functions = AZURE_DISCOVERY_FUNCTIONS
+    With resource_types, only the functions discovering those types.
+    """
+    if provider == 'aws':
+        from app.cloud.aws_service import AWS_DISCOVERY_FUNCTIONS as functions
+    elif provider == 'azure':
+        from app.cloud.azure_service import AZURE_DISCOVERY_FUNCTIONS as functions
     else:
-        raise ValueError(f"Unknown provider: {connection.provider}")
+        raise ValueError(f"Unknown provider: {provider}")
+    if resource_types is None:
+        return functions
+    return [fn for fn in functions if getattr(fn, 'resource_type', None) in resource_types]
 
-    # Clear old cached resources for this connection
-    CachedResource.query.filter_by(connection_id=connection.id).delete()
 
-    total = 0
-    errors = []
+def discoverable_types(provider):
+    """Resource types that can be discovered selectively for a provider."""
+    return [fn.resource_type for fn in get_discovery_functions(provider)
+            if getattr(fn, 'resource_type', None) is not None]
 
-    for discover_fn in discovery_functions:
-        try:
-            resources = discover_fn(credentials)
-            for res_data in resources:
-                resource = CachedResource(
-                    connection_id=connection.id,
-                    resource_type=res_data['resource_type'],
-                    resource_id=res_data['resource_id'],
-                    resource_name=res_data.get('resource_name'),
-                    region=res_data.get('region'),
-                    raw_data=res_data['raw_data'],
-                )
-                db.session.add(resource)
-                total += 1
-        except CLIError as e:
-            errors.append(f"{discover_fn.__name__}: {e}")
-            current_app.logger.warning(
-                f"Discovery error for {connection.name}: {discover_fn.__name__}: {e}"
-            )
 
-    db.session.commit()
+def plan_discovery(connection, credentials, resource_types=None):
+    """Return the DiscoveryTasks to run for a connection.
+
+    AWS regional services are fanned out once per discovery region, with
+    the region swapped into the credentials; global services run once.
+    resource_types limits the plan to the functions for those types.
+    """
+    discovery_functions = get_discovery_functions(connection.provider, resource_types)
+    if not discovery_functions:
+        raise ValueError(f"Nothing to discover for {', '.join(sorted(resource_types))}")
+    if connection.provider != 'aws':
+        return [DiscoveryTask(fn.__name__, fn, credentials, None) for fn in discovery_functions]
+
+    from app.cloud.aws_service import AWS_GLOBAL_DISCOVERY_FUNCTIONS, get_discovery_regions
+    if all(fn in AWS_GLOBAL_DISCOVERY_FUNCTIONS for fn in discovery_functions):
+        # Spare the region lookup when only global services are refreshed
+        regions = []
+    else:
+        regions = get_discovery_regions(connection, credentials)
 
-    if errors and total == 0:
+    tasks = []
+    for fn in discovery_functions:
+        if fn in AWS_GLOBAL_DISCOVERY_FUNCTIONS:
+            tasks.append(DiscoveryTask(fn.__name__, fn, credentials, None))
+            continue
+        for region in regions:
+            label = fn.__name__ if len(regions) == 1 else f"{fn.__name__}[{region}]"
+            tasks.append(DiscoveryTask(
+                label, fn, {**credentials, 'aws_default_region': region}, region,
+            ))
+    return tasks
+
+
+def run_discovery(connection, resource_types=None, on_plan=None, on_progress=None):
+    """Discover resources for a connection and reconcile its cache.
+
+    resource_types, if given, limits discovery to the functions for those
+    types, and only their slices of the cache are replaced; cached
+    resources of other types are left untouched.
+
+    Returns a dict with total/added/changed/removed counts. on_plan, if
+    given, is called with the list of task labels before any work starts.
+    on_progress is called as on_progress(label, count, error) from the
+    calling thread each time a task finishes.
+    """
+    if resource_types is not None:
+        resource_types = set(resource_types)
+    credentials = connection.get_credentials()
+    tasks = plan_discovery(connection, credentials, resource_types)
+    if on_plan:
+        on_plan([task.label for task in tasks])
+
+    reconciler = ResourceReconciler(connection.id, resource_types)
+    outcomes, seen_types, errors = _run_concurrently(tasks, reconciler.add, on_progress)
+
+    for error in errors:
+        current_app.logger.warning(f"Discovery error for {connection.name}: {error}")
+
+    if errors and not any(outcomes):
+        db.session.rollback()
+        # Pages received before the failures may already be committed
+        refresh_resource_stats(connection.id, resource_types)
+        db.session.commit()
         raise RuntimeError(
             f"All discoveries failed. Errors: {'; '.join(errors)}"
         )
 
-    return total
+    return reconciler.finish(_replace_scopes(tasks, outcomes, seen_types))
+
+
+class ResourceReconciler:
+    """Apply one discovery run to the cache for a connection, incrementally.
+
+    Resources are matched on (resource_type, resource_id) as they stream
+    in: new ones are inserted, ones whose raw_data hash or region changed
+    are updated, and unchanged ones are left alone. Writes are flushed and
+    committed every batch, so only the key/hash index of the existing cache
+    and one batch of resources are held in memory. finish() then deletes
+    cached resources that were not reported, within the given scopes.
+    With resource_types, only the cache for those types is loaded.
+    """
+
+    def __init__(self, connection_id, resource_types=None):
+        self.connection_id = connection_id
+        self.resource_types = resource_types
+        self.batch_size = current_app.config['DISCOVERY_INSERT_BATCH_SIZE']
+        self.use_copy = current_app.config['DISCOVERY_USE_PG_COPY']
+        self.now = datetime.now(timezone.utc)
+        existing = db.session.query(
+            CachedResource.id, CachedResource.resource_type, CachedResource.resource_id,
+            CachedResource.region, CachedResource.content_hash,
+        ).filter(CachedResource.connection_id == connection_id)
+        if resource_types is not None:
+            existing = existing.filter(CachedResource.resource_type.in_(resource_types))
+        self.existing = {(row.resource_type, row.resource_id): row for row in existing}
+        self.seen = set()
+        self.inserts = []
+        self.updates = []
+        self.added = 0
+        self.changed = 0
+
+    def add(self, resources):
+        for res_data in resources:
+            key = (res_data['resource_type'], res_data['resource_id'])
+            if key in self.seen:
+                continue
+            self.seen.add(key)
+
+            content_hash = content_hash_of(res_data['raw_data'])
+            row = self.existing.get(key)
+            if row is None:
+                self.inserts.append(_insert_row(self.connection_id, res_data, content_hash, self.now))
+            elif row.content_hash != content_hash or row.region != res_data.get('region'):
+                self.updates.append({
+                    'id': row.id,
+                    'resource_name': res_data.get('resource_name'),
+                    'region': res_data.get('region'),
+                    'raw_data': res_data['raw_data'],
+                    'content_hash': content_hash,
+                    'search_text': build_search_text(res_data),
+                    'discovered_at': self.now,
+                })
+            if len(self.inserts) + len(self.updates) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self.inserts:
+            self.added += bulk_insert(
+                CachedResource.__table__, self.inserts,
+                batch_size=self.batch_size, use_copy=self.use_copy,
+            )
+            self.inserts = []
+        if self.updates:
+            db.session.execute(db.update(CachedResource), self.updates)
+            self.changed += len(self.updates)
+            self.updates = []
+        db.session.commit()
+
+    def finish(self, scopes):
+        """Flush pending writes and delete vanished resources.
+
+        scopes maps resource_type to the set of regions this run was
+        authoritative for, or None for every region. Types not in scopes
+        (e.g. because their discovery failed) keep their cached resources.
+        """
+        self.flush()
+
+        vanished = [
+            row.id for key, row in self.existing.items()
+            if key not in self.seen and row.resource_type in scopes
+            and (scopes[row.resource_type] is None or row.region in scopes[row.resource_type])
+        ]
+        for start in range(0, len(vanished), DELETE_CHUNK_SIZE):
+            CachedResource.query.filter(
+                CachedResource.id.in_(vanished[start:start + DELETE_CHUNK_SIZE])
+            ).delete(synchronize_session=False)
+        refresh_resource_stats(self.connection_id, self.resource_types)
+        db.session.commit()
+
+        return {
+            'total': len(self.seen),
+            'added': self.added,
+            'changed': self.changed,
+            'removed': len(vanished),
+        }
+
+
+def _replace_scopes(tasks, outcomes, seen_types):
+    """Work out which cache slices a run may delete from.
+
+    A task that succeeded is authoritative for its resource type in its
+    region (or everywhere, for global tasks). A resource type whose tasks
+    all succeeded is replaced across every region, which also clears
+    regions that have been dropped from the connection.
+    """
+    scopes = {}  # resource_type -> set of regions, or None for all regions
+    failed_types = set()
+    for task, succeeded, types in zip(tasks, outcomes, seen_types):
+        declared = getattr(task.fn, 'resource_type', None)
+        task_types = {declared} if declared is not None else types
+        if not succeeded:
+            failed_types.update(task_types)
+            continue
+        for resource_type in task_types:
+            if task.region is None:
+                scopes[resource_type] = None
+            elif scopes.get(resource_type, set()) is not None:
+                scopes.setdefault(resource_type, set()).add(task.region)
+    for resource_type in list(scopes):
+        if resource_type not in failed_types:
+            scopes[resource_type] = None
+    return scopes
+
+
+def _insert_row(connection_id, res_data, content_hash, discovered_at):
+    return {
+        'id': uuid.uuid4(),
+        'connection_id': connection_id,
+        'resource_type': res_data['resource_type'],
+        'resource_id': res_data['resource_id'],
+        'resource_name': res_data.get('resource_name'),
+        'region': res_data.get('region'),
+        'raw_data': res_data['raw_data'],
+        'content_hash': content_hash,
+        'search_text': build_search_text(res_data),
+        'discovered_at': discovered_at,
+    }
+
+
+def content_hash_of(raw_data):
+    encoded = json.dumps(raw_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _run_concurrently(tasks, consume, on_progress=None):
+    """Run discovery tasks in a bounded thread pool, streaming their results.
+
+    Each task blocks on CLI subprocesses or provider HTTP calls, so
+    threads give us real parallelism. Workers push pages of resources
+    onto a bounded queue and consume(page) is called for each one on the
+    calling thread, which is the only thread that touches the database.
+    Because the queue is bounded, a slow consumer stalls the workers
+    instead of letting pages pile up in memory.
+
+    Returns (outcomes, seen_types, errors): outcomes[i] is True if task i
+    succeeded, seen_types[i] the resource types it produced.
+    """
+    app = current_app._get_current_object()
+    max_workers = max(1, min(app.config['DISCOVERY_MAX_WORKERS'], len(tasks)))
+    page_size = app.config['DISCOVERY_PAGE_SIZE']
+    pages = queue.Queue(maxsize=max_workers * 2)
+    cancelled = threading.Event()
+
+    def put(message):
+        while not cancelled.is_set():
+            try:
+                pages.put(message, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def call(index, task):
+        with app.app_context():
+            count = 0
+            try:
+                resources = iter(task.fn(task.credentials))
+                while True:
+                    page = list(islice(resources, page_size))
+                    if not page:
+                        break
+                    count += len(page)
+                    if not put(('page', index, page)):
+                        return
+            except ProviderError as e:
+                put(('error', index, e))
+            except Exception as e:
+                put(('crash', index, e))
+            else:
+                put(('done', index, count))
+
+    outcomes = [False] * len(tasks)
+    seen_types = [set() for _ in tasks]
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nf-discovery') as pool:
+        for index, task in enumerate(tasks):
+            pool.submit(call, index, task)
+        try:
+            remaining = len(tasks)
+            while remaining:
+                kind, index, payload = pages.get()
+                label = tasks[index].label
+                if kind == 'page':
+                    seen_types[index].update(res_data['resource_type'] for res_data in payload)
+                    consume(payload)
+                    continue
+                remaining -= 1
+                if kind == 'done':
+                    outcomes[index] = True
+                    if on_progress:
+                        on_progress(label, payload, None)
+                elif kind == 'error':
+                    errors.append(f"{label}: {payload}")
+                    if on_progress:
+                        on_progress(label, 0, payload)
+                else:
+                    raise payload
+        finally:
+            cancelled.set()
+    return outcomes, seen_types, errors
@@ -1,8 +1,8 @@
 from flask_wtf import FlaskForm
 from wtforms import (
-    StringField, SelectField, SubmitField, PasswordField, BooleanField,
+    StringField, SelectField, SubmitField, PasswordField, BooleanField, IntegerField,
 )
-from wtforms.validators import DataRequired, Length, Regexp, Optional
+from wtforms.validators import DataRequired, Length, NumberRange, Regexp, Optional
 
 
 class AWSConnectionForm(FlaskForm):
@@ -30,6 +30,14 @@ class AWSConnectionForm(FlaskForm):
         ('ca-central-1', 'Canada (Central)'),
         ('sa-east-1', 'South America (Sao Paulo)'),
     ], validators=[DataRequired()])
+    discovery_regions = StringField('Discovery Regions', validators=[
+        Optional(), Length(max=1024),
+        Regexp(r'^\s*(all|[a-z0-9\-]+(\s*,\s*[a-z0-9\-]+)*)\s*$',
+               message='Comma-separated region names, or "all" for every enabled region.')
+    ])
+    discovery_interval_minutes = IntegerField('Discovery Interval (minutes)', validators=[
+        Optional(), NumberRange(min=0, max=43200)
+    ])
     is_default = BooleanField('Set as server-wide default')
     submit = SubmitField('Save Connection')
 
@@ -51,6 +59,9 @@ class AzureConnectionForm(FlaskForm):
     subscription_id = StringField('Subscription ID', validators=[
         DataRequired(), Length(max=100)
     ])
+    discovery_interval_minutes = IntegerField('Discovery Interval (minutes)', validators=[
+        Optional(), NumberRange(min=0, max=43200)
+    ])
     is_default = BooleanField('Set as server-wide default')
     submit = SubmitField('Save Connection')
 
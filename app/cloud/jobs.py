@@ -0,0 +1,308 @@
+"""Background discovery jobs.
+
+Discovery runs on a small per-process thread pool so the request that
+starts it can return immediately. Job state lives in the discovery_jobs
+table, which the resources page polls for progress.
+
+Each job records the process it was submitted to, and a heartbeat thread
+in that process refreshes its queued and running jobs every
+DISCOVERY_JOB_HEARTBEAT_SECONDS. A job whose heartbeat is older than
+DISCOVERY_JOB_STALE_SECONDS belonged to a process that died (a recycled or
+killed gunicorn worker) and no longer counts as active; such jobs are
+marked failed the next time a job is submitted for the connection or the
+scheduler runs. A process shutting down cleanly fails its own jobs at once
+(atexit, and gunicorn's worker_exit hook).
+"""
+import atexit
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func, update
+
+from app.extensions import db
+from app.models.cloud_connection import CloudConnection
+from app.models.discovery_job import DiscoveryJob
+from app.utils.audit import log_action
+
+# How long a job queued behind an overlapping one waits before checking again
+OVERLAP_POLL_SECONDS = 2
+
+_executor = None
+_heartbeat = None
+_executor_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def submit_discovery_job(connection, user, resource_types=None):
+    """Queue discovery for a connection, returning the DiscoveryJob.
+
+    resource_types limits the job to those types (None for all). If a job
+    already queued or running for the connection refreshes every requested
+    type, that job is returned instead of starting a second one. Otherwise
+    a new job is queued; it runs alongside jobs for disjoint types, but
+    waits for any that overlap it to finish so the two do not reconcile
+    the same resources at once.
+    """
+    if resource_types is not None:
+        resource_types = sorted(set(resource_types))
+    fail_orphaned_jobs(connection.id)
+    for existing in get_active_jobs(connection.id):
+        if existing.covers(resource_types):
+            return existing
+
+    job = DiscoveryJob(
+        connection_id=connection.id,
+        user_id=user.id if user is not None else None,
+        resource_types=resource_types,
+        progress={},
+        errors=[],
+        owner=job_owner(),
+        heartbeat_at=datetime.now(timezone.utc),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _get_executor(app).submit(_run_job, app, job.id)
+    return job
+
+
+def get_active_jobs(connection_id):
+    """Queued or running jobs for a connection whose process is alive, newest first."""
+    return DiscoveryJob.query.filter(
+        DiscoveryJob.connection_id == connection_id, *live_job_filter(),
+    ).order_by(DiscoveryJob.created_at.desc()).all()
+
+
+def live_job_filter():
+    """Criteria matching queued or running jobs with a recent heartbeat."""
+    return (
+        DiscoveryJob.status.in_(DiscoveryJob.ACTIVE_STATUSES),
+        _last_heartbeat() >= _stale_cutoff(),
+    )
+
+
+def fail_orphaned_jobs(connection_id=None):
+    """Mark queued or running jobs whose process died as failed.
+
+    Limited to one connection if connection_id is given. Returns how many
+    jobs were failed.
+    """
+    query = DiscoveryJob.query.filter(
+        DiscoveryJob.status.in_(DiscoveryJob.ACTIVE_STATUSES),
+        _last_heartbeat() < _stale_cutoff(),
+    )
+    if connection_id is not None:
+        query = query.filter(DiscoveryJob.connection_id == connection_id)
+    return _fail_jobs(query, 'The worker process running this job stopped')
+
+
+def job_owner():
+    """Identify this process in DiscoveryJob.owner."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _last_heartbeat():
+    # Jobs from before heartbeats were recorded fall back to their creation time
+    return func.coalesce(DiscoveryJob.heartbeat_at, DiscoveryJob.created_at)
+
+
+def _stale_cutoff():
+    seconds = current_app.config['DISCOVERY_JOB_STALE_SECONDS']
+    return datetime.now(timezone.utc) - timedelta(seconds=seconds)
+
+
+def _fail_jobs(query, reason):
+    failed = 0
+    now = datetime.now(timezone.utc)
+    for job in query.all():
+        job.status = DiscoveryJob.STATUS_FAILED
+        job.errors = (job.errors or []) + [reason]
+        job.finished_at = now
+        failed += 1
+    if failed:
+        db.session.commit()
+    return failed
+
+
+def _blocking_jobs(job):
+    """Older live jobs that share a resource type with job.
+
+    job must not start until they are done, so the two do not reconcile the
+    same resources at once. Only jobs whose process is alive count, so one
+    orphaned by a dead worker stops blocking once its heartbeat goes stale.
+    """
+    order = (job.created_at, str(job.id))
+    return [
+        other for other in get_active_jobs(job.connection_id)
+        if (other.created_at, str(other.id)) < order
+        and _overlaps(other.resource_types, job.resource_types)
+    ]
+
+
+def _requeue(app, job_id):
+    """Submit job_id to the pool again after OVERLAP_POLL_SECONDS.
+
+    A blocked job waits off the pool, so it does not hold a thread that the
+    job it waits for (or an unrelated one) may need.
+    """
+    def resubmit():
+        with _executor_lock:
+            executor = _executor
+        # After shutdown_discovery_jobs the job has already been failed
+        if executor is not None:
+            try:
+                executor.submit(_run_job, app, job_id)
+            except RuntimeError:
+                pass
+
+    timer = threading.Timer(OVERLAP_POLL_SECONDS, resubmit)
+    timer.daemon = True
+    timer.start()
+
+
+def _overlaps(types, other_types):
+    if types is None or other_types is None:
+        return True
+    return bool(set(types) & set(other_types))
+
+
+def _get_executor(app):
+    global _executor, _heartbeat
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config['DISCOVERY_JOB_WORKERS'],
+                thread_name_prefix='nf-discovery-job',
+            )
+            _heartbeat = JobHeartbeat(app)
+            atexit.register(shutdown_discovery_jobs)
+        return _executor
+
+
+def shutdown_discovery_jobs():
+    """Stop this process's job pool and fail the jobs it still owns.
+
+    Jobs not yet started are dropped from the pool; running ones are left
+    to finish if the process lives long enough, which then records their
+    real outcome.
+    """
+    global _executor, _heartbeat
+    with _executor_lock:
+        executor, _executor = _executor, None
+        heartbeat, _heartbeat = _heartbeat, None
+    if executor is None:
+        return
+    heartbeat.stop()
+    executor.shutdown(wait=False, cancel_futures=True)
+    with heartbeat.app.app_context():
+        try:
+            _fail_jobs(DiscoveryJob.query.filter(
+                DiscoveryJob.owner == heartbeat.owner,
+                DiscoveryJob.status.in_(DiscoveryJob.ACTIVE_STATUSES),
+            ), 'The worker process running this job shut down')
+        except Exception:
+            db.session.rollback()
+            logger.exception('Failed to mark discovery jobs of %s failed', heartbeat.owner)
+
+
+class JobHeartbeat:
+    """Background thread refreshing heartbeat_at on this process's active jobs."""
+
+    def __init__(self, app):
+        self.app = app
+        self.owner = job_owner()
+        self.interval = app.config['DISCOVERY_JOB_HEARTBEAT_SECONDS']
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='nf-discovery-heartbeat', daemon=True)
+        self._thread.start()
+
+    def beat(self):
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    update(DiscoveryJob)
+                    .where(
+                        DiscoveryJob.owner == self.owner,
+                        DiscoveryJob.status.in_(DiscoveryJob.ACTIVE_STATUSES),
+                    )
+                    .values(heartbeat_at=datetime.now(timezone.utc))
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Discovery job heartbeat failed')
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.beat()
+
+
+def _run_job(app, job_id):
+    from app.cloud.discovery import run_discovery
+
+    with app.app_context():
+        job = db.session.get(DiscoveryJob, job_id)
+        # A job failed as orphaned in the meantime is not started
+        if job is None or job.status != DiscoveryJob.STATUS_QUEUED:
+            return
+        if _blocking_jobs(job):
+            db.session.rollback()
+            _requeue(app, job_id)
+            return
+        conn = db.session.get(CloudConnection, job.connection_id)
+
+        job.status = DiscoveryJob.STATUS_RUNNING
+        job.started_at = job.heartbeat_at = datetime.now(timezone.utc)
+        db.session.commit()
+
+        def on_plan(labels):
+            job.progress = {label: 'pending' for label in labels}
+            db.session.commit()
+
+        def on_progress(label, count, error):
+            job.progress = {**job.progress, label: 'failed' if error else 'succeeded'}
+            if error:
+                job.errors = job.errors + [f"{label}: {error}"[:500]]
+            db.session.commit()
+
+        try:
+            if conn is None or not conn.is_active:
+                raise RuntimeError('Connection no longer exists')
+            stats = run_discovery(conn, resource_types=job.resource_types,
+                                  on_plan=on_plan, on_progress=on_progress)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception(f"Discovery job {job_id} failed")
+            job.status = DiscoveryJob.STATUS_FAILED
+            job.errors = job.errors + [str(e)[:500]]
+            job.finished_at = datetime.now(timezone.utc)
+            db.session.commit()
+            log_action('discover_resources_failed', target_type='cloud_connection',
+                       target_id=job.connection_id, user_id=job.user_id,
+                       details={'job_id': str(job.id), 'resource_types': job.resource_types,
+                                'error': str(e)[:500]})
+        else:
+            job.status = DiscoveryJob.STATUS_SUCCEEDED
+            job.resources_found = stats['total']
+            job.resources_added = stats['added']
+            job.resources_changed = stats['changed']
+            job.resources_removed = stats['removed']
+            job.finished_at = datetime.now(timezone.utc)
+            db.session.commit()
+            log_action('discover_resources', target_type='cloud_connection',
+                       target_id=job.connection_id, user_id=job.user_id,
+                       details={'job_id': str(job.id), 'resource_types': job.resource_types,
+                                'resources_found': stats['total'],
+                                'added': stats['added'], 'changed': stats['changed'],
+                                'removed': stats['removed']})
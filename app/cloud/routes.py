@@ -1,17 +1,24 @@
+import uuid
 from datetime import datetime, timezone
 
 from flask import (
-    render_template, redirect, url_for, flash, request, jsonify,
+    render_template, redirect, url_for, flash, request, jsonify, current_app,
 )
 from flask_login import login_required, current_user
 
 from app.cloud import cloud_bp
 from app.cloud.forms import AWSConnectionForm, AzureConnectionForm
+from app.cloud.search import parse_terms, search_filter
+from app.cloud.stats import resource_type_counts
 from app.extensions import db
 from app.models.cloud_connection import CloudConnection
 from app.models.cached_resource import CachedResource
 from app.utils.audit import log_action
 from app.utils.decorators import admin_required
+from app.utils.keyset import paginate_keyset
+from app.utils.visibility import (
+    get_visible_connection_ids, get_visible_connections, visible_connection_ids_query,
+)
 
 
 @cloud_bp.route('/connections')
@@ -56,9 +63,11 @@ def create_connection(provider):
             conn.user_id = None
         else:
             conn.user_id = current_user.id
+        conn.discovery_interval_minutes = form.discovery_interval_minutes.data
 
         if provider == 'aws':
             conn.region = form.aws_default_region.data
+            conn.set_discovery_regions(form.discovery_regions.data)
             conn.set_credentials({
                 'aws_access_key_id': form.aws_access_key_id.data,
                 'aws_secret_access_key': form.aws_secret_access_key.data,
@@ -90,6 +99,8 @@ def edit_connection(conn_id):
 
     if conn.provider == 'aws':
         form = AWSConnectionForm(obj=conn)
+        if request.method == 'GET':
+            form.discovery_regions.data = conn.get_discovery_regions_text()
     else:
         form = AzureConnectionForm(obj=conn)
 
@@ -98,9 +109,11 @@ def edit_connection(conn_id):
         if current_user.is_admin:
             conn.is_default = form.is_default.data
             conn.user_id = None if conn.is_default else current_user.id
+        conn.discovery_interval_minutes = form.discovery_interval_minutes.data
 
         if conn.provider == 'aws':
             conn.region = form.aws_default_region.data
+            conn.set_discovery_regions(form.discovery_regions.data)
             conn.set_credentials({
                 'aws_access_key_id': form.aws_access_key_id.data,
                 'aws_secret_access_key': form.aws_secret_access_key.data,
@@ -142,12 +155,13 @@ def test_connection(conn_id):
     conn = _get_connection_or_404(conn_id)
     creds = conn.get_credentials()
 
-    from app.utils.cli_runner import test_aws_connection, test_azure_connection
+    from app.utils.providers import get_backend
 
+    backend = get_backend()
     if conn.provider == 'aws':
-        success, result = test_aws_connection(creds)
+        success, result = backend.test_aws_connection(creds)
     else:
-        success, result = test_azure_connection(creds)
+        success, result = backend.test_azure_connection(creds)
 
     if success:
         conn.last_tested = datetime.now(timezone.utc)
@@ -160,74 +174,209 @@ def test_connection(conn_id):
         return jsonify({'status': 'error', 'message': str(result)}), 400
 
 
+_RESOURCE_NAME_KEY = db.func.coalesce(CachedResource.resource_name, '')
+_RESOURCE_REGION_KEY = db.func.coalesce(CachedResource.region, '')
+
+# Sort options for the resource list: sort columns (unique, ending in the
+# primary key) and how to read the same key back off a result row.
+RESOURCE_SORTS = {
+    'type': (
+        [CachedResource.resource_type, _RESOURCE_NAME_KEY, CachedResource.id],
+        lambda r: (r.resource_type, r.resource_name or '', r.id),
+    ),
+    'name': (
+        [_RESOURCE_NAME_KEY, CachedResource.id],
+        lambda r: (r.resource_name or '', r.id),
+    ),
+    'region': (
+        [_RESOURCE_REGION_KEY, CachedResource.id],
+        lambda r: (r.region or '', r.id),
+    ),
+    'discovered': (
+        [CachedResource.discovered_at, CachedResource.id],
+        lambda r: (r.discovered_at, r.id),
+    ),
+}
+
+
 @cloud_bp.route('/resources')
 @login_required
 def list_resources():
     connection_id = request.args.get('connection_id')
     resource_type = request.args.get('resource_type')
     provider = request.args.get('provider')
-
-    # Get connections visible to user
-    visible_ids = _get_visible_connection_ids()
-
-    query = CachedResource.query.filter(
+    search = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'type')
+    if sort not in RESOURCE_SORTS:
+        sort = 'type'
+    direction = 'desc' if request.args.get('dir') == 'desc' else 'asc'
+    per_page = request.args.get('per_page', current_app.config['RESOURCE_PAGE_SIZE'], type=int)
+    per_page = max(1, min(per_page, current_app.config['RESOURCE_PAGE_SIZE_MAX']))
+
+    visible_ids = visible_connection_ids_query()
+
+    # Only the columns the list displays; raw_data is never loaded here
+    query = db.session.query(
+        CachedResource.id,
+        CachedResource.resource_type,
+        CachedResource.resource_id,
+        CachedResource.resource_name,
+        CachedResource.region,
+        CachedResource.discovered_at,
+    ).filter(
         CachedResource.connection_id.in_(visible_ids)
     )
 
     if connection_id:
-        query = query.filter_by(connection_id=connection_id)
+        try:
+            query = query.filter(CachedResource.connection_id == uuid.UUID(connection_id))
+        except ValueError:
+            connection_id = None
     if resource_type:
-        query = query.filter_by(resource_type=resource_type)
+        query = query.filter(CachedResource.resource_type == resource_type)
+    if search:
+        # A query with no searchable terms (only quotes, say) matches nothing
+        query = query.filter(search_filter(search) if parse_terms(search) else db.false())
 
     # Filter by provider via join
     if provider:
         query = query.join(CloudConnection).filter(CloudConnection.provider == provider)
 
-    resources = query.order_by(CachedResource.resource_type, CachedResource.resource_name).all()
+    sort_columns, key_of = RESOURCE_SORTS[sort]
+    page = paginate_keyset(
+        query, sort_columns, key_of, per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=direction == 'desc',
+    )
 
     # Get unique resource types for filter dropdown
-    type_counts = db.session.query(
-        CachedResource.resource_type, db.func.count(CachedResource.id)
-    ).filter(
-        CachedResource.connection_id.in_(visible_ids)
-    ).group_by(CachedResource.resource_type).all()
+    type_counts = resource_type_counts(visible_ids)
 
     # Get connections for filter dropdown
-    connections = CloudConnection.query.filter(
-        CloudConnection.id.in_(visible_ids)
-    ).all()
+    connections = get_visible_connections()
+
+    # Connections the selected type can be refreshed on by itself
+    refresh_connections = []
+    if resource_type:
+        from app.cloud.discovery import discoverable_types
+        refresh_connections = [
+            conn for conn in connections
+            if resource_type in discoverable_types(conn.provider)
+            and (not connection_id or str(conn.id) == connection_id)
+        ]
 
     return render_template(
         'cloud/resources.html',
-        resources=resources,
+        resources=page.items,
+        page=page,
         type_counts=type_counts,
         connections=connections,
+        refresh_connections=refresh_connections,
         selected_connection=connection_id,
         selected_type=resource_type,
         selected_provider=provider,
+        search=search,
+        sort=sort,
+        direction=direction,
+        per_page=per_page,
     )
 
 
+@cloud_bp.route('/resources/search')
+@login_required
+def search_resources():
+    search = request.args.get('q', '').strip()
+    if not parse_terms(search):
+        return jsonify({'status': 'error', 'message': 'No search query'}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int),
+                       current_app.config['RESOURCE_PAGE_SIZE_MAX']))
+
+    rows = db.session.query(
+        CachedResource.id,
+        CachedResource.connection_id,
+        CachedResource.resource_type,
+        CachedResource.resource_id,
+        CachedResource.resource_name,
+        CachedResource.region,
+    ).filter(
+        CachedResource.connection_id.in_(visible_connection_ids_query()),
+        search_filter(search),
+    ).order_by(
+        CachedResource.resource_type, CachedResource.resource_name, CachedResource.id
+    ).limit(limit).all()
+
+    return jsonify({
+        'status': 'ok',
+        'query': search,
+        'results': [{
+            'id': str(r.id),
+            'connection_id': str(r.connection_id),
+            'resource_type': r.resource_type,
+            'resource_id': r.resource_id,
+            'resource_name': r.resource_name,
+            'region': r.region,
+            'url': url_for('cloud.resource_detail', resource_id=r.id),
+        } for r in rows],
+    })
+
+
 @cloud_bp.route('/resources/discover', methods=['POST'])
 @login_required
 def discover_resources():
-    connection_id = request.json.get('connection_id') if request.is_json else request.form.get('connection_id')
+    if request.is_json:
+        connection_id = request.json.get('connection_id')
+        resource_types = request.json.get('resource_types')
+    else:
+        connection_id = request.form.get('connection_id')
+        resource_types = request.form.getlist('resource_types')
 
     if not connection_id:
         return jsonify({'status': 'error', 'message': 'No connection specified'}), 400
+    try:
+        connection_id = uuid.UUID(str(connection_id))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid connection id'}), 400
+    if isinstance(resource_types, str):
+        resource_types = [resource_types]
+    if resource_types is not None and not isinstance(resource_types, list):
+        return jsonify({'status': 'error', 'message': 'resource_types must be a list'}), 400
 
     conn = _get_connection_or_404(connection_id)
 
-    from app.cloud.discovery import run_discovery
-    try:
-        count = run_discovery(conn)
-        log_action('discover_resources', target_type='cloud_connection', target_id=conn.id,
-                   details={'resources_found': count})
-        return jsonify({'status': 'ok', 'message': f'Discovered {count} resources', 'count': count})
-    except Exception as e:
-        log_action('discover_resources_failed', target_type='cloud_connection', target_id=conn.id,
-                   details={'error': str(e)[:500]})
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    from app.cloud.discovery import discoverable_types
+    if resource_types:
+        unknown = sorted(set(map(str, resource_types)) - set(discoverable_types(conn.provider)))
+        if unknown:
+            return jsonify({
+                'status': 'error',
+                'message': f"Cannot discover {', '.join(unknown)} on a {conn.provider.upper()} connection",
+            }), 400
+    else:
+        resource_types = None
+
+    from app.cloud.jobs import submit_discovery_job
+    job = submit_discovery_job(conn, current_user, resource_types)
+    log_action('discover_resources_queued', target_type='cloud_connection', target_id=conn.id,
+               details={'job_id': str(job.id), 'resource_types': job.resource_types})
+    return jsonify({
+        'status': 'ok',
+        'message': 'Discovery queued',
+        'job_id': str(job.id),
+        'job_url': url_for('cloud.discovery_job_status', job_id=job.id),
+    }), 202
+
+
+@cloud_bp.route('/jobs/<uuid:job_id>')
+@login_required
+def discovery_job_status(job_id):
+    from app.models.discovery_job import DiscoveryJob
+    job = db.session.get(DiscoveryJob, job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    if job.user_id != current_user.id and not current_user.is_admin:
+        _get_connection_or_404(job.connection_id)
+    return jsonify(job.to_dict())
 
 
 @cloud_bp.route('/resources/<uuid:resource_id>')
@@ -238,8 +387,7 @@ def resource_detail(resource_id):
         flash('Resource not found.', 'danger')
         return redirect(url_for('cloud.list_resources'))
 
-    visible_ids = _get_visible_connection_ids()
-    if resource.connection_id not in visible_ids:
+    if resource.connection_id not in get_visible_connection_ids():
         flash('Access denied.', 'danger')
         return redirect(url_for('cloud.list_resources'))
 
@@ -257,16 +405,6 @@ def get_effective_connection(user, provider):
     ).first()
 
 
-def _get_visible_connection_ids():
-    own = CloudConnection.query.filter_by(
-        user_id=current_user.id, is_active=True
-    ).with_entities(CloudConnection.id).all()
-    defaults = CloudConnection.query.filter_by(
-        user_id=None, is_default=True, is_active=True
-    ).with_entities(CloudConnection.id).all()
-    return [c.id for c in own + defaults]
-
-
 def _get_connection_or_404(conn_id):
     from flask import abort
     conn = db.session.get(CloudConnection, conn_id)
@@ -0,0 +1,240 @@
+"""Scheduled discovery.
+
+Every active connection is rediscovered DISCOVERY_SCHEDULE_MINUTES after
+its last full discovery job started (scheduled or manual), or on its own
+discovery_interval_minutes; 0 leaves it to the Discover button.
+
+A connection's first run is delayed by up to
+DISCOVERY_SCHEDULE_JITTER_SECONDS, and each later one moved by up to that
+much either way, so connections added or last discovered together do not
+keep firing together. The jitter is derived from the connection ID and the
+previous start, so it is stable between passes but differs from run to
+run, and on average connections still run every interval. A pass starts
+due connections most-overdue first, while fewer than
+DISCOVERY_SCHEDULE_MAX_CONCURRENT jobs (DISCOVERY_SCHEDULE_MAX_PER_PROVIDER
+per provider) are queued or running, manual ones included, and skips
+connections that already have a job in flight. Jobs run on the usual
+discovery job pool (see app.cloud.jobs) of the process holding the lease,
+so a pass also stops once that process has DISCOVERY_JOB_WORKERS jobs in
+flight; scheduled concurrency is effectively the smaller of the two. When
+the holder exits, its unfinished jobs are failed (see
+shutdown_discovery_jobs) rather than left to occupy the caps.
+
+Every gunicorn worker runs a scheduler thread (see deploy/gunicorn.conf.py),
+but only the one holding the scheduler_leases row acts; it renews the lease
+on each pass and another worker takes over once it lapses. Each worker
+still polls: every DISCOVERY_SCHEDULER_TICK_SECONDS it runs one UPDATE on
+the lease, plus a primary key lookup if it is not the holder, so the cost
+grows with the worker count but stays a few cheap statements per tick.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.cloud.jobs import fail_orphaned_jobs, job_owner, live_job_filter, submit_discovery_job
+from app.extensions import db
+from app.models.cloud_connection import CloudConnection
+from app.models.discovery_job import DiscoveryJob
+from app.models.scheduler_lease import SchedulerLease
+
+LEASE_NAME = 'discovery-scheduler'
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class DiscoveryScheduler:
+    def __init__(self, app, clock=_utcnow, holder=None):
+        self.app = app
+        self.clock = clock
+        self.holder = holder or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.is_leader = False
+        # Connections never discovered are due from the first pass as leader
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def tick(self):
+        """Run one scheduling pass, returning the DiscoveryJobs it started.
+
+        Needs an application context.
+        """
+        now = self.clock()
+        try:
+            leader = self._hold_lease(now)
+            if leader != self.is_leader:
+                logger.info('Discovery scheduler %s %s leadership',
+                            self.holder, 'took' if leader else 'lost')
+                self.is_leader = leader
+                self.started_at = now if leader else None
+            if not leader:
+                return []
+            return self._start_due(now)
+        except Exception:
+            db.session.rollback()
+            logger.exception('Discovery scheduler pass failed')
+            return []
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='nf-discovery-scheduler', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the thread and hand the lease back so another worker can take over."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        if self.is_leader:
+            with self.app.app_context():
+                try:
+                    SchedulerLease.query.filter_by(name=LEASE_NAME, holder=self.holder).delete()
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+            self.is_leader = False
+
+    def _run(self):
+        interval = self.app.config['DISCOVERY_SCHEDULER_TICK_SECONDS']
+        while not self._stop.is_set():
+            with self.app.app_context():
+                self.tick()
+            self._stop.wait(interval)
+
+    def _hold_lease(self, now):
+        expires_at = now + timedelta(seconds=self.app.config['DISCOVERY_SCHEDULER_LEASE_SECONDS'])
+        renewed = db.session.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == LEASE_NAME,
+                or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now),
+            )
+            .values(holder=self.holder, expires_at=expires_at)
+        ).rowcount
+        if renewed:
+            db.session.commit()
+            return True
+        if db.session.get(SchedulerLease, LEASE_NAME) is not None:
+            db.session.rollback()
+            return False
+        db.session.add(SchedulerLease(name=LEASE_NAME, holder=self.holder, expires_at=expires_at))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.session.rollback()
+            return False
+        return True
+
+    def _start_due(self, now):
+        config = self.app.config
+        max_total = config['DISCOVERY_SCHEDULE_MAX_CONCURRENT']
+        max_per_provider = config['DISCOVERY_SCHEDULE_MAX_PER_PROVIDER']
+        fail_orphaned_jobs()
+
+        # Refreshing a single resource type does not reset the schedule
+        last_started = dict(
+            db.session.query(DiscoveryJob.connection_id, func.max(DiscoveryJob.created_at))
+            .filter(DiscoveryJob.resource_types.is_(None))
+            .group_by(DiscoveryJob.connection_id)
+        )
+        max_local = config['DISCOVERY_JOB_WORKERS']
+        in_flight = (
+            db.session.query(DiscoveryJob.connection_id, CloudConnection.provider, DiscoveryJob.owner)
+            .join(CloudConnection, CloudConnection.id == DiscoveryJob.connection_id)
+            .filter(*live_job_filter())
+            .all()
+        )
+        busy = {connection_id for connection_id, _, _ in in_flight}
+        running = len(in_flight)
+        # More than the pool can run would only sit queued in this process
+        owner = job_owner()
+        local = sum(1 for row in in_flight if row.owner == owner)
+        per_provider = {}
+        for _, provider, _ in in_flight:
+            per_provider[provider] = per_provider.get(provider, 0) + 1
+
+        due = []
+        for conn in CloudConnection.query.filter_by(is_active=True):
+            due_at = self.due_at(conn, last_started.get(conn.id))
+            if due_at is not None and due_at <= now and conn.id not in busy:
+                due.append((due_at, conn))
+        due.sort(key=lambda item: item[0])
+
+        started = []
+        for _, conn in due:
+            if running >= max_total or local >= max_local:
+                break
+            if per_provider.get(conn.provider, 0) >= max_per_provider:
+                continue
+            started.append(submit_discovery_job(conn, None))
+            running += 1
+            local += 1
+            per_provider[conn.provider] = per_provider.get(conn.provider, 0) + 1
+        if started or due:
+            logger.info('Discovery scheduler started %d of %d due connections', len(started), len(due))
+        return started
+
+    def due_at(self, conn, last_started):
+        """When conn is next due, or None if it is not scheduled."""
+        minutes = conn.discovery_interval_minutes
+        if minutes is None:
+            minutes = self.app.config['DISCOVERY_SCHEDULE_MINUTES']
+        if minutes <= 0:
+            return None
+        interval = timedelta(minutes=minutes)
+        jitter = self.app.config['DISCOVERY_SCHEDULE_JITTER_SECONDS']
+        if last_started is None:
+            window = min(jitter, interval.total_seconds())
+            return (self.started_at or self.clock()) + timedelta(seconds=window * _spread(conn.id))
+        if last_started.tzinfo is None:
+            last_started = last_started.replace(tzinfo=timezone.utc)
+        # Centred on the interval, so the jitter does not add up over runs
+        window = min(jitter, interval.total_seconds() / 2)
+        spread = _spread(conn.id, last_started.isoformat())
+        return last_started + interval + timedelta(seconds=window * (2 * spread - 1))
+
+
+def _spread(*parts):
+    """A stable fraction in [0, 1) for the given values."""
+    digest = hashlib.sha256('\0'.join(str(p) for p in parts).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(app):
+    """Start this process's scheduler thread, unless DISCOVERY_SCHEDULER_ENABLED is off."""
+    global _scheduler
+    if not app.config['DISCOVERY_SCHEDULER_ENABLED']:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DiscoveryScheduler(app)
+            _scheduler.start()
+            atexit.register(stop_scheduler)
+        return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        scheduler.stop()
@@ -0,0 +1,170 @@
+"""Search over cached resources.
+
+Each resource gets a search_text document built at discovery time from
+its type, IDs, name, region, tags (as key=value) and a fixed set of
+raw_data attributes such as IP addresses and sizes. Queries are split into
+whitespace-separated terms, each matched as a phrase and all required, so
+"team=payments" or "10.2.3.4" match the tag or address exactly as written.
+
+PostgreSQL uses the GIN-indexed tsvector, SQLite uses the FTS5 table
+maintained by triggers (see app.models.cached_resource), and anything
+else falls back to LIKE. db.create_all() builds the index with the table;
+other databases need `flask cloud init-search` once.
+"""
+import shlex
+
+from sqlalchemy import event, select
+
+from app.extensions import db
+from app.models.cached_resource import CachedResource, create_search_index
+
+# Dotted paths into raw_data worth searching; lists are walked through.
+SEARCH_FIELDS = [
+    # AWS
+    'InstanceType', 'State.Name', 'PrivateIpAddress', 'PublicIpAddress',
+    'PrivateDnsName', 'PublicDnsName', 'VpcId', 'SubnetId', 'ImageId',
+    'NetworkInterfaces.PrivateIpAddresses.PrivateIpAddress',
+    'NetworkInterfaces.Ipv6Addresses.Ipv6Address',
+    'CidrBlock', 'DBInstanceClass', 'Engine', 'Endpoint.Address',
+    'Runtime', 'Handler', 'Role', 'Arn', 'UserName',
+    # Azure
+    'location', 'kind', 'resourceGroup', 'vmId', 'hardwareProfile.vmSize',
+    'sku.name', 'fullyQualifiedDomainName', 'defaultHostName',
+    'addressSpace.addressPrefixes', 'subnets.addressPrefix', 'privateIps', 'publicIps',
+]
+
+_sqlite_fts_cache = {}
+
+
+def build_search_text(res_data):
+    raw = res_data.get('raw_data') or {}
+    parts = [
+        res_data.get('resource_type'),
+        res_data.get('resource_id'),
+        res_data.get('resource_name'),
+        res_data.get('region'),
+    ]
+    parts.extend(f'{key}={value}' for key, value in _iter_tags(raw))
+    for path in SEARCH_FIELDS:
+        parts.extend(_lookup(raw, path.split('.')))
+    return ' '.join(str(p) for p in parts if p not in (None, ''))
+
+
+def parse_terms(query_text):
+    try:
+        terms = shlex.split(query_text or '')
+    except ValueError:
+        terms = (query_text or '').split()
+    return [t for t in terms if t.strip()]
+
+
+def search_filter(query_text):
+    """Return a filter clause restricting CachedResource to matches, or None."""
+    terms = parse_terms(query_text)
+    if not terms:
+        return None
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        document = db.func.to_tsvector('simple', db.func.coalesce(CachedResource.search_text, ''))
+        tsquery = db.func.phraseto_tsquery('simple', terms[0])
+        for term in terms[1:]:
+            tsquery = tsquery.op('&&')(db.func.phraseto_tsquery('simple', term))
+        return document.op('@@')(tsquery)
+
+    if dialect == 'sqlite' and _sqlite_has_fts():
+        match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        matching_rowids = select(db.literal_column('rowid')).select_from(
+            db.table('cached_resources_fts')
+        ).where(db.literal_column('cached_resources_fts').op('MATCH')(match))
+        return db.literal_column('cached_resources.rowid').in_(matching_rowids.scalar_subquery())
+
+    return db.and_(*[
+        db.func.lower(CachedResource.search_text).contains(term.lower(), autoescape=True)
+        for term in terms
+    ])
+
+
+def rebuild_search_index(batch_size=1000):
+    """Recompute search_text for every cached resource; returns the count.
+
+    Use after changing SEARCH_FIELDS, for rows cached before search
+    existed, or to resync SQLite's FTS table.
+    """
+    count = 0
+    last_id = None
+    while True:
+        query = db.session.query(
+            CachedResource.id, CachedResource.resource_type, CachedResource.resource_id,
+            CachedResource.resource_name, CachedResource.region, CachedResource.raw_data,
+        )
+        if last_id is not None:
+            query = query.filter(CachedResource.id > last_id)
+        rows = query.order_by(CachedResource.id).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(db.update(CachedResource), [
+            {'id': row.id, 'search_text': build_search_text(row._asdict())} for row in rows
+        ])
+        db.session.commit()
+        count += len(rows)
+        last_id = rows[-1].id
+
+    if db.engine.dialect.name == 'sqlite' and _sqlite_has_fts():
+        db.session.execute(db.text("DELETE FROM cached_resources_fts"))
+        db.session.execute(db.text(
+            "INSERT INTO cached_resources_fts(rowid, search_text) "
+            "SELECT rowid, search_text FROM cached_resources"
+        ))
+        db.session.commit()
+    return count
+
+
+def init_search_index(batch_size=1000):
+    """Create the search index if missing and backfill it; returns the count.
+
+    For databases not created by db.create_all(), which builds the index
+    along with the table. Safe to run repeatedly.
+    """
+    create_search_index(db.session.connection())
+    db.session.commit()
+    _sqlite_fts_cache.clear()
+    return rebuild_search_index(batch_size=batch_size)
+
+
+def _iter_tags(raw):
+    tags = raw.get('Tags') or raw.get('tags')
+    if isinstance(tags, list):  # AWS: [{'Key': ..., 'Value': ...}]
+        for tag in tags:
+            if isinstance(tag, dict) and 'Key' in tag:
+                yield tag['Key'], tag.get('Value', '')
+    elif isinstance(tags, dict):  # Azure: {key: value}
+        yield from tags.items()
+
+
+def _lookup(value, parts):
+    if isinstance(value, list):
+        for item in value:
+            yield from _lookup(item, parts)
+        return
+    if not parts:
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            yield value
+        return
+    if isinstance(value, dict) and parts[0] in value:
+        yield from _lookup(value[parts[0]], parts[1:])
+
+
+def _sqlite_has_fts():
+    key = str(db.engine.url)
+    if key not in _sqlite_fts_cache:
+        _sqlite_fts_cache[key] = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cached_resources_fts'"
+        )).first() is not None
+    return _sqlite_fts_cache[key]
+
+
+@event.listens_for(CachedResource.__table__, 'after_create')
+@event.listens_for(CachedResource.__table__, 'after_drop')
+def _reset_fts_cache(*args, **kwargs):
+    _sqlite_fts_cache.clear()
@@ -0,0 +1,57 @@
+"""Precomputed resource counts for the dashboard and resource filters.
+
+resource_stats holds one row per (connection, resource type). Discovery
+refreshes a connection's rows in the same transaction as its cache
+changes; `flask cloud recompute-stats` rebuilds them all if they drift.
+"""
+from datetime import datetime, timezone
+
+from app.extensions import db
+from app.models.cached_resource import CachedResource
+from app.models.resource_stat import ResourceStat
+
+
+def refresh_resource_stats(connection_id=None, resource_types=None):
+    """Recount cached resources for one connection, or all if None.
+
+    resource_types limits the recount to those types. Does not commit.
+    Returns the number of stat rows written.
+    """
+    delete = db.delete(ResourceStat)
+    counts = db.session.query(
+        CachedResource.connection_id,
+        CachedResource.resource_type,
+        db.func.count(),
+    )
+    if connection_id is not None:
+        delete = delete.where(ResourceStat.connection_id == connection_id)
+        counts = counts.filter(CachedResource.connection_id == connection_id)
+    if resource_types is not None:
+        delete = delete.where(ResourceStat.resource_type.in_(resource_types))
+        counts = counts.filter(CachedResource.resource_type.in_(resource_types))
+
+    now = datetime.now(timezone.utc)
+    rows = [
+        {'connection_id': conn_id, 'resource_type': resource_type, 'count': count, 'updated_at': now}
+        for conn_id, resource_type, count in counts.group_by(
+            CachedResource.connection_id, CachedResource.resource_type
+        )
+    ]
+    db.session.execute(delete)
+    if rows:
+        db.session.execute(db.insert(ResourceStat), rows)
+    return len(rows)
+
+
+def resource_type_counts(connection_ids):
+    """Return [(resource_type, count)] summed over connection_ids, largest first.
+
+    connection_ids may be a list or a select of IDs.
+    """
+    total = db.cast(db.func.sum(ResourceStat.count), db.Integer)
+    return db.session.query(ResourceStat.resource_type, total).filter(
+        ResourceStat.connection_id.in_(connection_ids),
+        ResourceStat.count > 0,
+    ).group_by(ResourceStat.resource_type).order_by(
+        total.desc(), ResourceStat.resource_type
+    ).all()
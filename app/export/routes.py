@@ -1,47 +1,67 @@
 import csv
 import io
 import json
+import textwrap
+import uuid
 
-from flask import request, Response, jsonify
-from flask_login import login_required, current_user
+from flask import abort, jsonify, request, Response, stream_with_context
+from flask_login import login_required
 
 from app.export import export_bp
 from app.extensions import db
 from app.models.cached_resource import CachedResource
 from app.models.cloud_connection import CloudConnection
 from app.utils.audit import log_action
+from app.utils.visibility import visible_connection_filter
+
+
+# Rows fetched per round trip, and bytes buffered before a chunk is sent
+EXPORT_YIELD_PER = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+CSV_HEADER = [
+    'Resource Type', 'Resource ID', 'Name', 'Region',
+    'Connection', 'Provider', 'Discovered At',
+]
 
 
 @export_bp.route('/csv')
 @login_required
 def export_csv():
-    resources = _get_filtered_resources()
-
-    si = io.StringIO()
-    writer = csv.writer(si)
-    writer.writerow([
-        'Resource Type', 'Resource ID', 'Name', 'Region',
-        'Connection', 'Provider', 'Discovered At',
-    ])
-    for r in resources:
-        writer.writerow([
-            r.resource_type,
-            r.resource_id,
-            r.resource_name or '',
-            r.region or '',
-            r.connection.name,
-            r.connection.provider,
-            r.discovered_at.isoformat(),
-        ])
-
-    log_action('export_csv', details={'count': len(resources)})
-
-    return Response(
-        si.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=native-form-resources.csv'},
+    query = _get_filtered_resources(
+        CachedResource.resource_type,
+        CachedResource.resource_id,
+        CachedResource.resource_name,
+        CachedResource.region,
+        CachedResource.discovered_at,
     )
 
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(CSV_HEADER)
+        yield _drain(buf)
+        count = 0
+        try:
+            for r in query:
+                writer.writerow([
+                    r.resource_type,
+                    r.resource_id,
+                    r.resource_name or '',
+                    r.region or '',
+                    r.connection_name,
+                    r.provider,
+                    r.discovered_at.isoformat(),
+                ])
+                count += 1
+                if buf.tell() >= EXPORT_CHUNK_SIZE:
+                    yield _drain(buf)
+            yield _drain(buf)
+        finally:
+            _log_export('export_csv', count)
+
+    return _stream(generate(), 'text/csv', 'native-form-resources.csv')
+
 
 @export_bp.route('/json')
 @login_required
@@ -49,7 +69,7 @@ def export_json():
     resource_id = request.args.get('resource_id')
 
     if resource_id:
-        resource = db.session.get(CachedResource, resource_id)
+        resource = db.session.get(CachedResource, _parse_uuid(resource_id))
         if resource is None:
             return jsonify({'error': 'Resource not found'}), 404
         data = {
@@ -61,53 +81,101 @@ def export_json():
             'raw_data': resource.raw_data,
         }
         log_action('export_json', details={'resource_id': resource_id})
-    else:
-        resources = _get_filtered_resources()
-        data = []
-        for r in resources:
-            data.append({
-                'resource_type': r.resource_type,
-                'resource_id': r.resource_id,
-                'resource_name': r.resource_name,
-                'region': r.region,
-                'connection': r.connection.name,
-                'provider': r.connection.provider,
-                'discovered_at': r.discovered_at.isoformat(),
-                'raw_data': r.raw_data,
-            })
-        log_action('export_json', details={'count': len(data)})
-
-    output = json.dumps(data, indent=2, default=str)
-    return Response(
-        output,
-        mimetype='application/json',
-        headers={'Content-Disposition': 'attachment; filename=native-form-resources.json'},
+        return Response(
+            json.dumps(data, indent=2, default=str),
+            mimetype='application/json',
+            headers={'Content-Disposition': 'attachment; filename=native-form-resources.json'},
+        )
+
+    query = _get_filtered_resources(
+        CachedResource.resource_type,
+        CachedResource.resource_id,
+        CachedResource.resource_name,
+        CachedResource.region,
+        CachedResource.discovered_at,
+        CachedResource.raw_data,
     )
 
-
-def _get_filtered_resources():
+    def generate():
+        # Same layout as json.dumps(list, indent=2), one element at a time
+        buf = io.StringIO()
+        yield '['
+        count = 0
+        try:
+            for r in query:
+                item = json.dumps({
+                    'resource_type': r.resource_type,
+                    'resource_id': r.resource_id,
+                    'resource_name': r.resource_name,
+                    'region': r.region,
+                    'connection': r.connection_name,
+                    'provider': r.provider,
+                    'discovered_at': r.discovered_at.isoformat(),
+                    'raw_data': r.raw_data,
+                }, indent=2, default=str)
+                buf.write(',\n' if count else '\n')
+                buf.write(textwrap.indent(item, '  '))
+                count += 1
+                if buf.tell() >= EXPORT_CHUNK_SIZE:
+                    yield _drain(buf)
+            buf.write('\n]' if count else ']')
+            yield _drain(buf)
+        finally:
+            _log_export('export_json', count)
+
+    return _stream(generate(), 'application/json', 'native-form-resources.json')
+
+
+def _get_filtered_resources(*columns):
+    """Build a streaming query of the given columns plus connection_name and provider."""
     connection_id = request.args.get('connection_id')
     resource_type = request.args.get('resource_type')
 
     # Only export resources the user can see
-    visible_ids = _get_visible_connection_ids()
-
-    query = CachedResource.query.filter(
-        CachedResource.connection_id.in_(visible_ids)
+    query = db.session.query(
+        *columns,
+        CloudConnection.name.label('connection_name'),
+        CloudConnection.provider,
+    ).join(CloudConnection, CachedResource.connection_id == CloudConnection.id).filter(
+        visible_connection_filter()
     )
     if connection_id:
-        query = query.filter_by(connection_id=connection_id)
+        query = query.filter(CachedResource.connection_id == _parse_uuid(connection_id))
     if resource_type:
-        query = query.filter_by(resource_type=resource_type)
+        query = query.filter(CachedResource.resource_type == resource_type)
+
+    # yield_per streams rows through a server-side cursor where the driver
+    # supports one, so memory does not grow with the size of the export.
+    return query.execution_options(yield_per=EXPORT_YIELD_PER)
+
+
+def _stream(chunks, mimetype, filename):
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            # Send chunks on as they are produced rather than buffering in nginx
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+
+def _drain(buf):
+    data = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return data
+
 
-    return query.all()
+def _log_export(action, count):
+    # Runs when the stream ends, including when the client disconnects
+    # part way, so partial downloads are audited too.
+    log_action(action, details={'count': count})
 
 
-def _get_visible_connection_ids():
-    own = CloudConnection.query.filter_by(
-        user_id=current_user.id, is_active=True
-    ).with_entities(CloudConnection.id).all()
-    defaults = CloudConnection.query.filter_by(
-        user_id=None, is_default=True, is_active=True
-    ).with_entities(CloudConnection.id).all()
-    return [c.id for c in own + defaults]
+def _parse_uuid(value):
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        abort(404)
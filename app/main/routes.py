@@ -1,11 +1,10 @@
 from flask import render_template, redirect, url_for
 from flask_login import login_required, current_user
 
+from app.cloud.stats import resource_type_counts
 from app.main import main_bp
-from app.extensions import db
-from app.models.cloud_connection import CloudConnection
-from app.models.cached_resource import CachedResource
 from app.models.audit_log import AuditLog
+from app.utils.visibility import get_visible_connections, visible_connection_ids_query
 
 
 @main_bp.route('/')
@@ -18,35 +17,17 @@ def index():
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
-    # Connections visible to user
-    own_conns = CloudConnection.query.filter_by(
-        user_id=current_user.id, is_active=True
-    ).all()
-    default_conns = CloudConnection.query.filter_by(
-        user_id=None, is_default=True, is_active=True
-    ).all()
-    all_conns = own_conns + default_conns
-    conn_ids = [c.id for c in all_conns]
+    all_conns = get_visible_connections()
 
     # Count by provider
     aws_count = sum(1 for c in all_conns if c.provider == 'aws')
     azure_count = sum(1 for c in all_conns if c.provider == 'azure')
 
-    # Resource counts
-    total_resources = 0
+    # Resource counts, from the per-connection stats discovery maintains
     resource_by_type = []
-    if conn_ids:
-        total_resources = CachedResource.query.filter(
-            CachedResource.connection_id.in_(conn_ids)
-        ).count()
-
-        resource_by_type = db.session.query(
-            CachedResource.resource_type, db.func.count(CachedResource.id)
-        ).filter(
-            CachedResource.connection_id.in_(conn_ids)
-        ).group_by(CachedResource.resource_type).order_by(
-            db.func.count(CachedResource.id).desc()
-        ).all()
+    if all_conns:
+        resource_by_type = resource_type_counts(visible_connection_ids_query())
+    total_resources = sum(count for _, count in resource_by_type)
 
     # Recent audit entries
     recent_activity = AuditLog.query.filter_by(
@@ -1,7 +1,13 @@
 from app.models.user import User
 from app.models.cloud_connection import CloudConnection
 from app.models.cached_resource import CachedResource
-from app.models.audit_log import AuditLog
+from app.models.audit_log import AuditLog, AuditLogArchive
 from app.models.system_setting import SystemSetting
+from app.models.discovery_job import DiscoveryJob
+from app.models.resource_stat import ResourceStat
+from app.models.scheduler_lease import SchedulerLease
 
-__all__ = ['User', 'CloudConnection', 'CachedResource', 'AuditLog', 'SystemSetting']
+__all__ = [
+    'User', 'CloudConnection', 'CachedResource', 'AuditLog', 'AuditLogArchive',
+    'SystemSetting', 'DiscoveryJob', 'ResourceStat', 'SchedulerLease',
+]
@@ -1,6 +1,8 @@
 import uuid
 from datetime import datetime, timezone
 
+from sqlalchemy import event
+
 from app.extensions import db
 
 
@@ -8,8 +10,15 @@ class AuditLog(db.Model):
     __tablename__ = 'audit_log'
     __table_args__ = (
         db.Index('idx_audit_log_user', 'user_id', 'created_at'),
+        db.Index('idx_audit_log_created', 'created_at', 'id'),
+        db.Index('idx_audit_log_action', 'action', 'created_at'),
+        db.Index('idx_audit_log_target', 'target_type', 'target_id', 'created_at'),
+        # Monthly partitions on PostgreSQL; see app.utils.audit_retention
+        {'postgresql_partition_by': 'RANGE (created_at)'},
     )
 
+    # created_at is part of the key because PostgreSQL requires the
+    # partition column in every unique constraint of a partitioned table.
     id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.Uuid, db.ForeignKey('users.id'), nullable=True)
     action = db.Column(db.String(100), nullable=False)
@@ -18,9 +27,46 @@ class AuditLog(db.Model):
     details = db.Column(db.JSON, nullable=True)
     ip_address = db.Column(db.String(45), nullable=True)
     created_at = db.Column(
-        db.DateTime, nullable=False,
+        db.DateTime, primary_key=True,
         default=lambda: datetime.now(timezone.utc)
     )
 
     def __repr__(self):
         return f'<AuditLog {self.action} by {self.user_id}>'
+
+
+class AuditLogArchive(db.Model):
+    """Audit entries past AUDIT_RETENTION_DAYS, moved out of audit_log.
+
+    On PostgreSQL whole monthly partitions of audit_log are re-attached
+    here, so this table is partitioned the same way.
+    """
+    __tablename__ = 'audit_log_archive'
+    __table_args__ = (
+        db.Index('idx_audit_log_archive_created', 'created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+    # No foreign key on user_id: archived entries must not pin user rows
+    id = db.Column(db.Uuid, primary_key=True)
+    user_id = db.Column(db.Uuid, nullable=True)
+    action = db.Column(db.String(100), nullable=False)
+    target_type = db.Column(db.String(50), nullable=True)
+    target_id = db.Column(db.Uuid, nullable=True)
+    details = db.Column(db.JSON, nullable=True)
+    ip_address = db.Column(db.String(45), nullable=True)
+    created_at = db.Column(db.DateTime, primary_key=True)
+
+    def __repr__(self):
+        return f'<AuditLogArchive {self.action} by {self.user_id}>'
+
+
+@event.listens_for(AuditLog.__table__, 'after_create')
+@event.listens_for(AuditLogArchive.__table__, 'after_create')
+def _create_partitions(table, connection, **kw):
+    if connection.dialect.name != 'postgresql':
+        return
+    from app.utils.audit_retention import create_default_partition, ensure_audit_partitions
+    create_default_partition(connection, table.name)
+    if table.name == AuditLog.__tablename__:
+        ensure_audit_partitions(connection)
@@ -1,6 +1,8 @@
 import uuid
 from datetime import datetime, timezone
 
+from sqlalchemy import DDL, event
+
 from app.extensions import db
 
 
@@ -9,6 +11,15 @@ class CachedResource(db.Model):
     __table_args__ = (
         db.Index('idx_cached_resources_type', 'connection_id', 'resource_type'),
         db.Index('idx_cached_resources_discovered', 'discovered_at'),
+        # Keyset pagination of the resource list sorts on these
+        db.Index(
+            'idx_cached_resources_listing',
+            'resource_type', db.text("coalesce(resource_name, '')"), 'id',
+        ),
+        db.UniqueConstraint(
+            'connection_id', 'resource_type', 'resource_id',
+            name='uq_cached_resource_identity',
+        ),
     )
 
     id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
@@ -20,6 +31,10 @@ class CachedResource(db.Model):
     resource_name = db.Column(db.String(256), nullable=True)
     region = db.Column(db.String(50), nullable=True)
     raw_data = db.Column(db.JSON, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of raw_data
+    # Names, IDs, tags and selected raw_data fields; see app.cloud.search
+    search_text = db.Column(db.Text, nullable=True)
+    # When the resource was first discovered or last changed
     discovered_at = db.Column(
         db.DateTime, nullable=False,
         default=lambda: datetime.now(timezone.utc)
@@ -27,3 +42,52 @@ class CachedResource(db.Model):
 
     def __repr__(self):
         return f'<CachedResource {self.resource_type}:{self.resource_id}>'
+
+
+# Full-text search index over search_text. PostgreSQL gets a GIN index on
+# the tsvector; SQLite gets an FTS5 table keyed by rowid and kept in sync
+# by triggers, so bulk inserts and updates are indexed without extra work.
+# (An explicit VACUUM can renumber rowids; run `flask cloud
+# rebuild-search-index` afterwards.)
+_SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cached_resources_fts USING fts5(search_text)",
+    """CREATE TRIGGER IF NOT EXISTS cached_resources_fts_insert
+       AFTER INSERT ON cached_resources BEGIN
+           INSERT INTO cached_resources_fts(rowid, search_text) VALUES (new.rowid, new.search_text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS cached_resources_fts_delete
+       AFTER DELETE ON cached_resources BEGIN
+           DELETE FROM cached_resources_fts WHERE rowid = old.rowid;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS cached_resources_fts_update
+       AFTER UPDATE OF search_text ON cached_resources BEGIN
+           UPDATE cached_resources_fts SET search_text = new.search_text WHERE rowid = old.rowid;
+       END""",
+]
+
+_POSTGRESQL_SEARCH_DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_cached_resources_search ON cached_resources "
+    "USING gin (to_tsvector('simple', coalesce(search_text, '')))",
+]
+
+
+def create_search_index(connection):
+    """Create the search index for the connection's dialect if it is missing.
+
+    Runs as part of db.create_all(); databases set up any other way get it
+    from `flask cloud init-search`. Safe to run repeatedly.
+    """
+    statements = {'sqlite': _SQLITE_SEARCH_DDL, 'postgresql': _POSTGRESQL_SEARCH_DDL}
+    for statement in statements.get(connection.dialect.name, []):
+        connection.execute(DDL(statement))
+
+
+@event.listens_for(CachedResource.__table__, 'after_create')
+def _create_search_index(target, connection, **kwargs):
+    create_search_index(connection)
+
+
+event.listen(
+    CachedResource.__table__, 'after_drop',
+    DDL("DROP TABLE IF EXISTS cached_resources_fts").execute_if(dialect='sqlite'),
+)
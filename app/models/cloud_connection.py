@@ -17,6 +17,12 @@ class CloudConnection(db.Model):
     is_default = db.Column(db.Boolean, nullable=False, default=False)
     credentials_encrypted = db.Column(db.Text, nullable=False)
     region = db.Column(db.String(50), nullable=True)
+    # AWS only: regions to discover, ['all'] for every enabled region,
+    # or None for just the default region
+    discovery_regions = db.Column(db.JSON, nullable=True)
+    # Minutes between scheduled discoveries: None for DISCOVERY_SCHEDULE_MINUTES,
+    # 0 to only discover on demand
+    discovery_interval_minutes = db.Column(db.Integer, nullable=True)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
     last_tested = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(
@@ -35,12 +41,25 @@ class CloudConnection(db.Model):
     )
 
     def set_credentials(self, credentials_dict):
-        from app.utils.crypto import encrypt_credentials
+        from app.utils.crypto import encrypt_credentials, forget_secret
         self.credentials_encrypted = encrypt_credentials(credentials_dict)
+        if self.id is not None:
+            forget_secret(self._secret_cache_key())
 
     def get_credentials(self):
         from app.utils.crypto import decrypt_credentials
-        return decrypt_credentials(self.credentials_encrypted)
+        cache_key = self._secret_cache_key() if self.id is not None else None
+        return decrypt_credentials(self.credentials_encrypted, cache_key=cache_key)
+
+    def _secret_cache_key(self):
+        return ('cloud_connection', self.id)
+
+    def set_discovery_regions(self, text):
+        regions = [r.strip() for r in (text or '').split(',') if r.strip()]
+        self.discovery_regions = regions or None
+
+    def get_discovery_regions_text(self):
+        return ', '.join(self.discovery_regions or [])
 
     def __repr__(self):
         return f'<CloudConnection {self.name} ({self.provider})>'
@@ -0,0 +1,77 @@
+import uuid
+from datetime import datetime, timezone
+
+from app.extensions import db
+
+
+class DiscoveryJob(db.Model):
+    __tablename__ = 'discovery_jobs'
+    __table_args__ = (
+        db.Index('idx_discovery_jobs_connection', 'connection_id', 'created_at'),
+    )
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
+    connection_id = db.Column(
+        db.Uuid, db.ForeignKey('cloud_connections.id'), nullable=False
+    )
+    user_id = db.Column(db.Uuid, db.ForeignKey('users.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED)
+    # Resource types to refresh, or NULL for a full discovery
+    resource_types = db.Column(db.JSON(none_as_null=True), nullable=True)
+    progress = db.Column(db.JSON, nullable=False, default=dict)  # function name -> state
+    resources_found = db.Column(db.Integer, nullable=False, default=0)
+    resources_added = db.Column(db.Integer, nullable=False, default=0)
+    resources_changed = db.Column(db.Integer, nullable=False, default=0)
+    resources_removed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.JSON, nullable=False, default=list)
+    created_at = db.Column(
+        db.DateTime, nullable=False,
+        default=lambda: datetime.now(timezone.utc)
+    )
+    started_at = db.Column(db.DateTime, nullable=True)
+    # host:pid of the process the job was submitted to; while the job is
+    # queued or running that process refreshes heartbeat_at
+    owner = db.Column(db.String(255), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    connection = db.relationship('CloudConnection')
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def covers(self, resource_types):
+        """Whether this job refreshes every one of resource_types (None for all)."""
+        if self.resource_types is None:
+            return True
+        return resource_types is not None and set(resource_types) <= set(self.resource_types)
+
+    def to_dict(self):
+        progress = self.progress or {}
+        return {
+            'id': str(self.id),
+            'connection_id': str(self.connection_id),
+            'status': self.status,
+            'resource_types': self.resource_types,
+            'progress': progress,
+            'functions_total': len(progress),
+            'functions_done': sum(1 for state in progress.values() if state != 'pending'),
+            'resources_found': self.resources_found,
+            'resources_added': self.resources_added,
+            'resources_changed': self.resources_changed,
+            'resources_removed': self.resources_removed,
+            'errors': self.errors or [],
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<DiscoveryJob {self.id} {self.status}>'
@@ -0,0 +1,26 @@
+from datetime import datetime, timezone
+
+from app.extensions import db
+
+
+class ResourceStat(db.Model):
+    """Cached resource count per connection and resource type.
+
+    Maintained by discovery (see app.cloud.stats) so the dashboard does not
+    have to aggregate cached_resources on every load.
+    """
+    __tablename__ = 'resource_stats'
+
+    connection_id = db.Column(
+        db.Uuid, db.ForeignKey('cloud_connections.id'), primary_key=True
+    )
+    resource_type = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime, nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+    def __repr__(self):
+        return f'<ResourceStat {self.connection_id}:{self.resource_type}={self.count}>'
@@ -0,0 +1,18 @@
+from app.extensions import db
+
+
+class SchedulerLease(db.Model):
+    """A named lease held by one process at a time.
+
+    Used by app.cloud.scheduler so that only one gunicorn worker schedules
+    discovery; the holder renews expires_at on every tick, and any other
+    process may take over once it has passed.
+    """
+    __tablename__ = 'scheduler_leases'
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<SchedulerLease {self.name} held by {self.holder}>'
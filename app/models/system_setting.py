@@ -1,7 +1,22 @@
+import threading
+import time
+import uuid
 from datetime import datetime, timezone
 
+from flask import current_app
+from sqlalchemy import event
+
 from app.extensions import db
 
+# Settings are read from a per-process snapshot of the whole table. Every
+# write stores a new random token under VERSION_KEY in the same
+# transaction; other workers compare it with their snapshot's token (at
+# most every SETTINGS_VERSION_CHECK_SECONDS) and reload when it differs.
+VERSION_KEY = '_version'
+
+_snapshot = None  # (version, {key: (value, is_encrypted)}, checked_at)
+_snapshot_lock = threading.Lock()
+
 
 class SystemSetting(db.Model):
     __tablename__ = 'system_settings'
@@ -17,32 +32,78 @@ class SystemSetting(db.Model):
 
     @staticmethod
     def get(key, default=None):
-        setting = db.session.get(SystemSetting, key)
-        if setting is None:
+        entry = _load_snapshot().get(key)
+        if entry is None:
             return default
-        if setting.is_encrypted:
+        value, is_encrypted = entry
+        if is_encrypted:
             from app.utils.crypto import decrypt_value
-            return decrypt_value(setting.value)
-        return setting.value
+            return decrypt_value(value, cache_key=('system_setting', key))
+        return value
 
     @staticmethod
     def set(key, value, encrypted=False):
-        if encrypted:
-            from app.utils.crypto import encrypt_value
-            store_value = encrypt_value(value)
-        else:
-            store_value = value
-
-        setting = db.session.get(SystemSetting, key)
-        if setting is None:
-            setting = SystemSetting(
-                key=key, value=store_value, is_encrypted=encrypted
-            )
-            db.session.add(setting)
-        else:
-            setting.value = store_value
-            setting.is_encrypted = encrypted
+        SystemSetting.set_many({key: value}, encrypted=[key] if encrypted else ())
+
+    @staticmethod
+    def set_many(values, encrypted=()):
+        """Store several settings in one transaction; keys in encrypted are encrypted."""
+        from app.utils.crypto import encrypt_value, forget_secret
+
+        encrypted = set(encrypted)
+        for key, value in values.items():
+            is_encrypted = key in encrypted
+            store_value = encrypt_value(value) if is_encrypted else value
+            if is_encrypted:
+                forget_secret(('system_setting', key))
+            _upsert(key, store_value, is_encrypted)
+        _upsert(VERSION_KEY, uuid.uuid4().hex, False)
         db.session.commit()
+        invalidate_settings_cache()
 
     def __repr__(self):
         return f'<SystemSetting {self.key}>'
+
+
+def invalidate_settings_cache():
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+def _upsert(key, value, is_encrypted):
+    setting = db.session.get(SystemSetting, key)
+    if setting is None:
+        db.session.add(SystemSetting(key=key, value=value, is_encrypted=is_encrypted))
+    else:
+        setting.value = value
+        setting.is_encrypted = is_encrypted
+
+
+def _load_snapshot():
+    global _snapshot
+    now = time.monotonic()
+    with _snapshot_lock:
+        snapshot = _snapshot
+    if snapshot is not None:
+        version, values, checked_at = snapshot
+        if now - checked_at < current_app.config['SETTINGS_VERSION_CHECK_SECONDS']:
+            return values
+        current = db.session.query(SystemSetting.value).filter_by(key=VERSION_KEY).scalar()
+        if current == version:
+            with _snapshot_lock:
+                _snapshot = (version, values, now)
+            return values
+
+    rows = db.session.query(SystemSetting.key, SystemSetting.value, SystemSetting.is_encrypted).all()
+    values = {key: (value, is_encrypted) for key, value, is_encrypted in rows if key != VERSION_KEY}
+    version = next((value for key, value, _ in rows if key == VERSION_KEY), None)
+    with _snapshot_lock:
+        _snapshot = (version, values, now)
+    return values
+
+
+@event.listens_for(SystemSetting.__table__, 'after_create')
+@event.listens_for(SystemSetting.__table__, 'after_drop')
+def _reset_snapshot(*args, **kwargs):
+    invalidate_settings_cache()
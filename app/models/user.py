@@ -1,10 +1,12 @@
 import uuid
 from datetime import datetime, timezone
 
+from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
 
 from app.extensions import db
+from app.utils.password_hashing import verify_password
 
 
 class User(UserMixin, db.Model):
@@ -41,7 +43,7 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         if self.password_hash is None:
             return False
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password, current_app.config)
 
     @property
     def is_admin(self):
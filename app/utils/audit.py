@@ -1,18 +1,170 @@
-from flask import request
+"""Audit logging.
+
+Security-critical actions (logins, account and permission changes,
+connection and credential changes) are written synchronously, in the
+request that performs them. Everything else goes onto an in-process queue
+that a background writer flushes in batches, every AUDIT_BATCH_SIZE
+entries or AUDIT_FLUSH_SECONDS, whichever comes first. Set AUDIT_MODE=sync
+to write every entry synchronously.
+
+The queue is drained when the process exits (atexit, and gunicorn's
+worker_exit hook), so recycled workers do not lose entries. If the queue
+is full, entries are written synchronously rather than dropped.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import current_app, request, has_request_context
 from flask_login import current_user
 
 from app.extensions import db
 from app.models.audit_log import AuditLog
 
+SYNC_ACTIONS = frozenset({
+    'login', 'login_ldap', 'logout', 'register', 'change_password',
+    'edit_user', 'deactivate_user', 'update_settings',
+    'update_default_aws', 'update_default_azure',
+    'create_connection', 'edit_connection', 'delete_connection',
+})
+
+_STOP = object()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def log_action(action, target_type=None, target_id=None, details=None, user_id=None, sync=None):
+    # Background jobs have no request; they pass the acting user explicitly.
+    if user_id is None and has_request_context() and current_user.is_authenticated:
+        user_id = current_user.id
+    entry = {
+        'id': uuid.uuid4(),
+        'user_id': user_id,
+        'action': action,
+        'target_type': target_type,
+        'target_id': target_id,
+        'details': details,
+        'ip_address': request.remote_addr if has_request_context() else None,
+        'created_at': datetime.now(timezone.utc),
+    }
 
-def log_action(action, target_type=None, target_id=None, details=None):
-    entry = AuditLog(
-        user_id=current_user.id if current_user.is_authenticated else None,
-        action=action,
-        target_type=target_type,
-        target_id=target_id,
-        details=details,
-        ip_address=request.remote_addr if request else None,
-    )
-    db.session.add(entry)
+    if sync is None:
+        sync = current_app.config['AUDIT_MODE'] == 'sync' or action in SYNC_ACTIONS
+    if not sync and get_audit_writer(current_app._get_current_object()).submit(entry):
+        return
+    db.session.add(AuditLog(**entry))
     db.session.commit()
+
+
+def get_audit_writer(app):
+    """Return this process's AuditWriter, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        # A writer inherited across fork has no thread behind it
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = AuditWriter(
+                app,
+                batch_size=app.config['AUDIT_BATCH_SIZE'],
+                flush_interval=app.config['AUDIT_FLUSH_SECONDS'],
+                max_queue=app.config['AUDIT_QUEUE_SIZE'],
+            )
+        return _writer
+
+
+def flush_audit_log(timeout=None):
+    """Block until queued audit entries have been written."""
+    with _writer_lock:
+        writer = _writer
+    if writer is not None and writer.pid == os.getpid():
+        writer.flush(timeout)
+
+
+def shutdown_audit_writer(timeout=10):
+    """Write out everything queued and stop the writer thread."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None and writer.pid == os.getpid():
+        writer.shutdown(timeout)
+
+
+atexit.register(shutdown_audit_writer)
+
+
+class AuditWriter:
+    """Background thread writing queued audit entries in batches."""
+
+    def __init__(self, app, batch_size=100, flush_interval=1.0, max_queue=10000):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='nf-audit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, entry):
+        """Queue an entry; returns False if the queue is full or stopped."""
+        if not self._thread.is_alive():
+            return False
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        if self._thread.is_alive():
+            self._queue.put(done)
+            done.wait(timeout)
+
+    def shutdown(self, timeout=None):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            wait = None if not batch else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, dict):
+                batch.append(item)
+                if len(batch) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+
+            self._write(batch)
+            batch = []
+            if item is _STOP:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        with self.app.app_context():
+            try:
+                db.session.execute(db.insert(AuditLog), batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Keep the entries somewhere rather than losing them
+                self.app.logger.exception(
+                    f"Failed to write {len(batch)} audit entries: "
+                    + json.dumps(batch, default=str)
+                )
@@ -0,0 +1,239 @@
+"""Audit log partitioning and retention.
+
+On PostgreSQL a freshly created audit_log is partitioned by month on
+created_at (audit_log_YYYY_MM), with a default partition for anything
+outside the monthly ranges. `flask admin audit-maintain`, run daily,
+creates partitions PARTITION_MONTHS_AHEAD months ahead and applies the
+retention policy.
+
+Tables that were not created by db.create_all() (an existing deployment,
+or one set up with `flask db upgrade`) are not partitioned; `flask admin
+audit-partition` converts them once, copying the existing entries, and
+retention refuses to run on PostgreSQL until it has.
+
+Retention removes entries older than AUDIT_RETENTION_DAYS. With
+AUDIT_ARCHIVE enabled they are moved to audit_log_archive, otherwise they
+are deleted. On a partitioned table this happens a whole month at a time:
+expired partitions are detached and either attached to the (identically
+partitioned) archive table or dropped, which costs the same however many
+rows they hold. Rows in the default partition, and everything on SQLite,
+are moved in batches of AUDIT_RETENTION_BATCH_SIZE.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError
+
+from app.extensions import db
+from app.models.audit_log import AuditLog, AuditLogArchive
+
+PARTITION_MONTHS_AHEAD = 3
+
+_MONTH_SUFFIX = re.compile(r'_(\d{4})_(\d{2})$')
+
+
+class AuditPartitioningError(Exception):
+    """The PostgreSQL audit tables are not partitioned as retention expects."""
+
+
+def create_default_partition(connection, table_name):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT"
+    ))
+
+
+def is_partitioned(connection, table_name=AuditLog.__tablename__):
+    if connection.dialect.name != 'postgresql':
+        return False
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+        {'name': table_name},
+    ).scalar()
+    return relkind == 'p'
+
+
+def check_audit_partitioning(connection, archive=True):
+    """Raise AuditPartitioningError unless the audit tables are partitioned.
+
+    Only PostgreSQL is checked; the archive table only matters when
+    archiving.
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    tables = [AuditLog.__tablename__]
+    if archive:
+        tables.append(AuditLogArchive.__tablename__)
+    unpartitioned = [name for name in tables if not is_partitioned(connection, name)]
+    if unpartitioned:
+        raise AuditPartitioningError(
+            f"{' and '.join(unpartitioned)} not partitioned; "
+            "run `flask admin audit-partition` once to convert."
+        )
+
+
+def partition_audit_tables(connection):
+    """Convert the audit tables to monthly partitioned ones; return the names converted.
+
+    Each unpartitioned table is renamed aside, recreated partitioned, and
+    its rows copied back (older months land in the default partition). A
+    missing table is just created. Takes an exclusive lock on the tables
+    while it runs. Does nothing on other databases or when already done.
+    """
+    if connection.dialect.name != 'postgresql':
+        return []
+    converted = []
+    for table in (AuditLog.__table__, AuditLogArchive.__table__):
+        if is_partitioned(connection, table.name):
+            continue
+        if not _table_exists(connection, table.name):
+            table.create(connection)
+            converted.append(table.name)
+            continue
+        old = f"{table.name}_unpartitioned"
+        connection.execute(text(f"ALTER TABLE {table.name} RENAME TO {old}"))
+        # Free the primary key and index names for the new table
+        connection.execute(text(f"ALTER TABLE {old} DROP CONSTRAINT IF EXISTS {table.name}_pkey"))
+        for index in table.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        table.create(connection)
+        columns = ', '.join(c.name for c in table.columns)
+        connection.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}"))
+        connection.execute(text(f"DROP TABLE {old}"))
+        converted.append(table.name)
+    return converted
+
+
+def ensure_audit_partitions(connection, months_ahead=PARTITION_MONTHS_AHEAD, now=None):
+    """Create audit_log's monthly partitions up to months_ahead; return their names."""
+    if not is_partitioned(connection):
+        return []
+
+    this_month = _month_start(now or _utcnow())
+    existing = set(_monthly_partitions(connection, AuditLog.__tablename__))
+    created = []
+    for offset in range(months_ahead + 1):
+        start = _add_months(this_month, offset)
+        if start in existing:
+            continue
+        name = _partition_name(AuditLog.__tablename__, start)
+        try:
+            with connection.begin_nested():
+                connection.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {AuditLog.__tablename__} "
+                    f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{_add_months(start, 1):%Y-%m-%d}')"
+                ))
+        except DBAPIError as e:
+            # The default partition already holds rows for this month, so
+            # they keep living there; only future months can be split out.
+            current_app.logger.warning(f"Could not create audit partition {name}: {e}")
+            continue
+        created.append(name)
+    return created
+
+
+def apply_audit_retention(retention_days, archive=True, batch_size=5000, now=None):
+    """Archive or delete audit entries older than retention_days.
+
+    Returns {'partitions': n, 'rows': n}: whole monthly partitions and
+    individual rows moved. retention_days <= 0 keeps everything.
+    """
+    result = {'partitions': 0, 'rows': 0}
+    if retention_days <= 0:
+        return result
+    cutoff = (now or _utcnow()) - timedelta(days=retention_days)
+
+    row_cutoff = cutoff
+    connection = db.session.connection()
+    check_audit_partitioning(connection, archive)
+    if is_partitioned(connection):
+        for start in sorted(_monthly_partitions(connection, AuditLog.__tablename__)):
+            end = _add_months(start, 1)
+            if end > cutoff:
+                # This month is kept whole, so anything older than it can
+                # only be in the default partition.
+                row_cutoff = min(cutoff, start)
+                break
+            _retire_partition(connection, start, end, archive)
+            result['partitions'] += 1
+        db.session.commit()
+
+    columns = [c.name for c in AuditLog.__table__.columns]
+    while True:
+        batch = db.session.query(AuditLog.id).filter(
+            AuditLog.created_at < row_cutoff
+        ).order_by(AuditLog.created_at).limit(batch_size).all()
+        if not batch:
+            break
+        expired = db.and_(
+            AuditLog.id.in_([row.id for row in batch]),
+            AuditLog.created_at < row_cutoff,
+        )
+        if archive:
+            db.session.execute(AuditLogArchive.__table__.insert().from_select(
+                columns, select(*[AuditLog.__table__.c[name] for name in columns]).where(expired)
+            ))
+        db.session.execute(db.delete(AuditLog).where(expired))
+        db.session.commit()
+        result['rows'] += len(batch)
+    return result
+
+
+def _retire_partition(connection, start, end, archive):
+    name = _partition_name(AuditLog.__tablename__, start)
+    connection.execute(text(f"ALTER TABLE {AuditLog.__tablename__} DETACH PARTITION {name}"))
+    if not archive:
+        connection.execute(text(f"DROP TABLE {name}"))
+        return
+    # The partition keeps audit_log's user_id foreign key once detached;
+    # archived entries must not pin user rows
+    constraints = connection.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:name) AND contype = 'f'"
+    ), {'name': name}).scalars().all()
+    for constraint in constraints:
+        connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+    archived = _partition_name(AuditLogArchive.__tablename__, start)
+    connection.execute(text(f"ALTER TABLE {name} RENAME TO {archived}"))
+    connection.execute(text(
+        f"ALTER TABLE {AuditLogArchive.__tablename__} ATTACH PARTITION {archived} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+
+def _table_exists(connection, table_name):
+    return connection.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"), {'name': table_name}
+    ).scalar()
+
+
+def _monthly_partitions(connection, table_name):
+    """Return the month starts of table_name's monthly partitions."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:name)"
+    ), {'name': table_name}).scalars()
+    months = []
+    for name in names:
+        match = _MONTH_SUFFIX.search(name)
+        if match and name == _partition_name(table_name, datetime(int(match[1]), int(match[2]), 1)):
+            months.append(datetime(int(match[1]), int(match[2]), 1))
+    return months
+
+
+def _partition_name(table_name, month):
+    return f"{table_name}_{month:%Y_%m}"
+
+
+def _utcnow():
+    # created_at is stored as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(month, count):
+    year, index = divmod(month.year * 12 + month.month - 1 + count, 12)
+    return month.replace(year=year, month=index + 1)
@@ -0,0 +1,135 @@
+"""Reusable Azure CLI login sessions.
+
+`az login --service-principal` is slow, so instead of logging in for every
+command we keep one AZURE_CONFIG_DIR per credential set and reuse its token
+cache until the session's TTL runs out. Sessions are evicted LRU-first,
+and their directories are wiped when evicted or at process exit.
+"""
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _AzureSession:
+    def __init__(self, config_dir, created_at):
+        self.config_dir = config_dir
+        self.created_at = created_at
+        self.lock = threading.Lock()
+        self.logged_in = False
+        self.users = 0
+        self.retired = False
+
+
+class AzureSessionCache:
+    def __init__(self, ttl, max_entries, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @contextmanager
+    def session(self, credentials, login):
+        """Yield a logged-in config dir for these credentials.
+
+        login(config_dir) is called at most once per session; concurrent
+        callers with the same credentials wait for that single login.
+        """
+        key = credential_fingerprint(credentials)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry.created_at >= self.ttl:
+                self._retire(key)
+                entry = None
+            if entry is None:
+                entry = _AzureSession(tempfile.mkdtemp(prefix='nf-az-'), self._clock())
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry.users += 1
+            while len(self._entries) > self.max_entries:
+                self._retire(next(iter(self._entries)))
+
+        try:
+            with entry.lock:
+                if not entry.logged_in:
+                    try:
+                        login(entry.config_dir)
+                    except Exception:
+                        with self._lock:
+                            if self._entries.get(key) is entry:
+                                self._retire(key)
+                        raise
+                    entry.logged_in = True
+            yield entry.config_dir
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.retired and entry.users == 0:
+                    _secure_rmtree(entry.config_dir)
+
+    def invalidate(self, credentials):
+        with self._lock:
+            key = credential_fingerprint(credentials)
+            if key in self._entries:
+                self._retire(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._retire(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _retire(self, key):
+        # Caller holds self._lock. Directories still in use are removed
+        # when their last user releases them.
+        entry = self._entries.pop(key)
+        entry.retired = True
+        if entry.users == 0:
+            _secure_rmtree(entry.config_dir)
+
+
+def credential_fingerprint(credentials):
+    material = '\0'.join(
+        credentials.get(k, '') for k in ('tenant_id', 'client_id', 'client_secret')
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _secure_rmtree(path):
+    """Overwrite files before removing them; the dir holds tokens and the SP secret."""
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            try:
+                size = os.path.getsize(file_path)
+                with open(file_path, 'r+b') as f:
+                    f.write(b'\0' * size)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError:
+                pass
+    shutil.rmtree(path, ignore_errors=True)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_session_cache(config):
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AzureSessionCache(
+                ttl=config['AZURE_SESSION_TTL_SECONDS'],
+                max_entries=config['AZURE_SESSION_MAX_ENTRIES'],
+            )
+            atexit.register(_cache.clear)
+        return _cache
@@ -0,0 +1,94 @@
+"""Batched bulk inserts that bypass the ORM unit of work.
+
+Rows are consumed from an iterable in fixed-size batches, so memory is
+bounded by the batch size rather than the number of rows. On PostgreSQL
+with psycopg2 each batch is streamed with COPY; elsewhere a Core
+insert() executemany is used, which SQLAlchemy turns into multi-row
+VALUES statements on drivers that support it.
+"""
+import io
+import json
+import uuid
+from datetime import date, datetime
+from itertools import islice
+
+from app.extensions import db
+
+
+def bulk_insert(table, rows, batch_size=1000, use_copy=True):
+    """Insert an iterable of row dicts into table; returns the row count.
+
+    Runs on the current session's connection, so the caller controls the
+    transaction and commits as usual.
+    """
+    conn = db.session.connection()
+    copy = use_copy and conn.dialect.name == 'postgresql' and conn.dialect.driver == 'psycopg2'
+
+    total = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        if copy:
+            _copy_batch(conn, table, [_with_defaults(table, row) for row in batch])
+        else:
+            conn.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+
+def _with_defaults(table, row):
+    # COPY skips SQLAlchemy's Python-side defaults, so apply them here.
+    row = dict(row)
+    for column in table.columns:
+        if column.key in row or column.default is None:
+            continue
+        if column.default.is_callable:
+            row[column.key] = column.default.arg(None)
+        elif column.default.is_scalar:
+            row[column.key] = column.default.arg
+    return row
+
+
+def _copy_batch(conn, table, batch):
+    columns = [c for c in table.columns if c.key in batch[0]]
+    buf = io.StringIO()
+    for row in batch:
+        buf.write('\t'.join(_copy_value(row.get(c.key), c.type) for c in columns))
+        buf.write('\n')
+    buf.seek(0)
+
+    column_list = ', '.join(conn.dialect.identifier_preparer.quote(c.name) for c in columns)
+    table_name = conn.dialect.identifier_preparer.format_table(table)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {table_name} ({column_list}) FROM STDIN', buf)
+    finally:
+        cursor.close()
+
+
+def _copy_value(value, column_type):
+    """Encode one value in PostgreSQL COPY text format."""
+    if isinstance(column_type, db.JSON):
+        # Match the executemany path: None is the JSON null unless the
+        # column stores it as SQL NULL
+        if value is None and column_type.none_as_null:
+            return r'\N'
+        value = json.dumps(value, default=str)
+    elif value is None:
+        return r'\N'
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif isinstance(value, uuid.UUID):
+        value = str(value)
+    else:
+        value = str(value)
+    return (
+        value.replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
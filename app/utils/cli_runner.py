@@ -1,13 +1,20 @@
 import json
 import os
-import shutil
 import subprocess
 import tempfile
+import threading
 
-from flask import current_app
+from flask import current_app, has_app_context
 
+from app.utils.azure_sessions import get_session_cache
+from app.utils.cli_workers import CLIWorkerDied, CLIWorkerTimeout, get_worker_pool
+from app.utils.providers import ProviderError
+from app.utils.rate_limit import get_rate_limiter
 
-class CLIError(Exception):
+STREAM_READ_SIZE = 64 * 1024
+
+
+class CLIError(ProviderError):
     def __init__(self, command, returncode, stderr):
         self.command = command
         self.returncode = returncode
@@ -21,49 +28,100 @@ def run_aws_command(args, credentials, timeout=None):
 
     aws_path = current_app.config['AWS_CLI_PATH']
     cmd = [aws_path] + args + ['--output', 'json']
+    env = _aws_env(credentials)
+    return get_rate_limiter(current_app.config).call(
+        _aws_limit_key(args, credentials), lambda: _execute(cmd, env, timeout)
+    )
 
-    env = _clean_env()
-    env['AWS_ACCESS_KEY_ID'] = credentials['aws_access_key_id']
-    env['AWS_SECRET_ACCESS_KEY'] = credentials['aws_secret_access_key']
-    env['AWS_DEFAULT_REGION'] = credentials.get('aws_default_region', 'us-east-1')
-    env['AWS_SHARED_CREDENTIALS_FILE'] = '/dev/null'
-    env['AWS_CONFIG_FILE'] = '/dev/null'
 
-    return _execute(cmd, env, timeout)
+def iter_aws_pages(args, credentials, page_size=None, timeout=None):
+    """Yield the JSON output of a paginated AWS command one page at a time.
+
+    The CLI is driven with --max-items/--starting-token, so neither the CLI
+    process nor this one ever holds more than page_size items. The timeout
+    applies to each page.
+    """
+    if timeout is None:
+        timeout = current_app.config['DISCOVERY_TIMEOUT_SECONDS']
+    if page_size is None:
+        page_size = current_app.config['DISCOVERY_PAGE_SIZE']
+
+    aws_path = current_app.config['AWS_CLI_PATH']
+    env = _aws_env(credentials)
+    limiter = get_rate_limiter(current_app.config)
+    key = _aws_limit_key(args, credentials)
+    token = None
+    while True:
+        cmd = [aws_path] + args + ['--max-items', str(page_size), '--output', 'json']
+        if token:
+            cmd += ['--starting-token', token]
+        # A throttled page is retried from the same token
+        page = limiter.call(key, lambda: _execute(cmd, env, timeout))
+        yield page
+        token = page.get('NextToken')
+        if not token:
+            return
 
 
 def run_azure_command(args, credentials, timeout=None):
     if timeout is None:
         timeout = current_app.config['DISCOVERY_TIMEOUT_SECONDS']
 
-    az_path = current_app.config['AZ_CLI_PATH']
+    cmd, login, sessions = _azure_command(args, credentials)
+    return get_rate_limiter(current_app.config).call(
+        _azure_limit_key(args, credentials),
+        lambda: _run_azure(cmd, credentials, login, sessions, timeout),
+    )
 
-    # Azure CLI needs its own config dir for login state.
-    # Use a temp directory so concurrent users don't conflict.
-    az_config_dir = tempfile.mkdtemp(prefix='nf-az-')
-    try:
-        env = _clean_env()
-        env['AZURE_CONFIG_DIR'] = az_config_dir
 
-        # Azure CLI does not authenticate via env vars like AWS.
-        # We must run 'az login --service-principal' first.
-        login_cmd = [
-            az_path, 'login', '--service-principal',
-            '--username', credentials['client_id'],
-            '--password', credentials['client_secret'],
-            '--tenant', credentials['tenant_id'],
-            '--output', 'none',
-        ]
-        _execute(login_cmd, env, timeout=30)
+def _run_azure(cmd, credentials, login, sessions, timeout):
+    for attempt in range(2):
+        with sessions.session(credentials, login) as az_config_dir:
+            env = _clean_env()
+            env['AZURE_CONFIG_DIR'] = az_config_dir
+            try:
+                return _execute(cmd, env, timeout)
+            except CLIError as e:
+                # A cached login can go stale (secret rotated, token revoked).
+                # Drop it and retry once with a fresh login.
+                if attempt == 0 and _is_azure_auth_error(e):
+                    sessions.invalidate(credentials)
+                    continue
+                raise
 
-        # Now run the actual command
-        cmd = [az_path] + args + [
-            '--subscription', credentials['subscription_id'],
-            '--output', 'json',
-        ]
-        return _execute(cmd, env, timeout)
-    finally:
-        shutil.rmtree(az_config_dir, ignore_errors=True)
+
+def iter_azure_items(args, credentials, timeout=None):
+    """Yield the elements of an Azure list command's JSON array as they are parsed.
+
+    stdout is decoded incrementally, so memory stays bounded by the largest
+    single item rather than the whole listing.
+    """
+    if timeout is None:
+        timeout = current_app.config['DISCOVERY_TIMEOUT_SECONDS']
+
+    cmd, login, sessions = _azure_command(args, credentials)
+    return get_rate_limiter(current_app.config).stream(
+        _azure_limit_key(args, credentials),
+        lambda: _stream_azure(cmd, credentials, login, sessions, timeout),
+    )
+
+
+def _stream_azure(cmd, credentials, login, sessions, timeout):
+    for attempt in range(2):
+        yielded = False
+        with sessions.session(credentials, login) as az_config_dir:
+            env = _clean_env()
+            env['AZURE_CONFIG_DIR'] = az_config_dir
+            try:
+                for item in _execute_stream(cmd, env, timeout):
+                    yielded = True
+                    yield item
+                return
+            except CLIError as e:
+                if attempt == 0 and not yielded and _is_azure_auth_error(e):
+                    sessions.invalidate(credentials)
+                    continue
+                raise
 
 
 def test_aws_connection(credentials):
@@ -82,6 +140,60 @@ def test_azure_connection(credentials):
         return False, str(e)
 
 
+def _aws_env(credentials):
+    env = _clean_env()
+    env['AWS_ACCESS_KEY_ID'] = credentials['aws_access_key_id']
+    env['AWS_SECRET_ACCESS_KEY'] = credentials['aws_secret_access_key']
+    env['AWS_DEFAULT_REGION'] = credentials.get('aws_default_region', 'us-east-1')
+    env['AWS_SHARED_CREDENTIALS_FILE'] = '/dev/null'
+    env['AWS_CONFIG_FILE'] = '/dev/null'
+    return env
+
+
+def _aws_limit_key(args, credentials):
+    """Rate limit per access key, region and service (e.g. 'ec2')."""
+    region = credentials.get('aws_default_region', 'us-east-1')
+    return ('aws', credentials['aws_access_key_id'], region, args[0])
+
+
+def _azure_limit_key(args, credentials):
+    # Azure Resource Manager limits are per subscription, not per region
+    return ('azure', credentials['subscription_id'], None, args[0])
+
+
+def _azure_command(args, credentials):
+    """Return (cmd, login, session_cache) for an Azure CLI command."""
+    az_path = current_app.config['AZ_CLI_PATH']
+    sessions = get_session_cache(current_app.config)
+
+    # Azure CLI does not authenticate via env vars like AWS.
+    # We must run 'az login --service-principal' first; the session cache
+    # keeps one isolated config dir per credential set so repeated commands
+    # reuse that login instead of repeating it.
+    def login(az_config_dir):
+        env = _clean_env()
+        env['AZURE_CONFIG_DIR'] = az_config_dir
+        login_cmd = [
+            az_path, 'login', '--service-principal',
+            '--username', credentials['client_id'],
+            '--password', credentials['client_secret'],
+            '--tenant', credentials['tenant_id'],
+            '--output', 'none',
+        ]
+        _execute(login_cmd, env, timeout=30)
+
+    cmd = [az_path] + args + [
+        '--subscription', credentials['subscription_id'],
+        '--output', 'json',
+    ]
+    return cmd, login, sessions
+
+
+def _is_azure_auth_error(error):
+    stderr = error.stderr.lower()
+    return 'az login' in stderr or 'aadsts' in stderr
+
+
 def _clean_env():
     """Build a restricted environment for CLI subprocesses.
 
@@ -89,7 +201,7 @@ def _clean_env():
     needed for CLI tools to function (Python paths, library paths, locale).
     """
     strip_keys = {
-        'SECRET_KEY', 'FERNET_KEY', 'DATABASE_URL', 'FLASK_ENV',
+        'SECRET_KEY', 'FERNET_KEY', 'FERNET_OLD_KEYS', 'DATABASE_URL', 'FLASK_ENV',
         'SESSION_COOKIE_SECURE', 'LDAP_BIND_USER_PASSWORD',
         'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY',
         'AZURE_CLIENT_ID', 'AZURE_CLIENT_SECRET', 'AZURE_TENANT_ID',
@@ -97,29 +209,200 @@ def _clean_env():
     return {k: v for k, v in os.environ.items() if k not in strip_keys}
 
 
-def _execute(cmd, env, timeout):
+def _validate_cmd(cmd):
     for arg in cmd:
         if not isinstance(arg, str):
             raise ValueError(f"Command argument must be a string, got {type(arg)}")
 
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            env=env,
-            shell=False,
-        )
-    except subprocess.TimeoutExpired:
-        raise CLIError(cmd[0], -1, f"Command timed out after {timeout} seconds")
-    except FileNotFoundError:
-        raise CLIError(cmd[0], -1, f"CLI executable not found: {cmd[0]}")
-
-    if result.returncode != 0:
-        raise CLIError(cmd[0], result.returncode, result.stderr)
-
-    if not result.stdout.strip():
+
+def _execute(cmd, env, timeout):
+    _validate_cmd(cmd)
+
+    call = _worker_call(cmd, env, timeout)
+    if call is not None:
+        stdout = ''.join(_worker_output(call, cmd, timeout))
+        returncode, stderr = call.returncode, call.stderr
+    else:
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                env=env,
+                shell=False,
+            )
+        except subprocess.TimeoutExpired:
+            raise CLIError(cmd[0], -1, f"Command timed out after {timeout} seconds")
+        except FileNotFoundError:
+            raise CLIError(cmd[0], -1, f"CLI executable not found: {cmd[0]}")
+        returncode, stdout, stderr = result.returncode, result.stdout, result.stderr
+
+    if returncode != 0:
+        raise CLIError(cmd[0], returncode, stderr)
+
+    if not stdout.strip():
         return {}
 
-    return json.loads(result.stdout)
+    return json.loads(stdout)
+
+
+def _execute_stream(cmd, env, timeout):
+    """Run a command whose stdout is a JSON array, yielding its elements."""
+    _validate_cmd(cmd)
+
+    call = _worker_call(cmd, env, timeout)
+    if call is not None:
+        chunks = _worker_output(call, cmd, timeout)
+        try:
+            yield from iter_json_array(_ChunkReader(chunks))
+        except json.JSONDecodeError:
+            for _ in chunks:
+                pass
+            if call.returncode == 0:
+                raise
+        for _ in chunks:
+            pass
+        if call.returncode != 0:
+            raise CLIError(cmd[0], call.returncode, call.stderr)
+        return
+
+    # stderr goes to a temp file so a chatty CLI can't fill the pipe and
+    # stall while we are still reading stdout.
+    with tempfile.TemporaryFile() as stderr_file:
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                text=True,
+                env=env,
+                shell=False,
+            )
+        except FileNotFoundError:
+            raise CLIError(cmd[0], -1, f"CLI executable not found: {cmd[0]}")
+
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            try:
+                yield from iter_json_array(proc.stdout)
+            except json.JSONDecodeError:
+                if not timed_out.is_set() and proc.wait() == 0:
+                    raise
+            proc.wait()
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
+        if timed_out.is_set():
+            raise CLIError(cmd[0], -1, f"Command timed out after {timeout} seconds")
+        if proc.returncode != 0:
+            stderr_file.seek(0)
+            raise CLIError(cmd[0], proc.returncode, stderr_file.read().decode('utf-8', 'replace'))
+
+
+def _worker_call(cmd, env, timeout):
+    """Start cmd on a persistent CLI worker if one is configured and free."""
+    if not has_app_context():
+        return None
+    pool = get_worker_pool(current_app.config)
+    if pool is None:
+        return None
+    tool = {
+        current_app.config['AWS_CLI_PATH']: 'aws',
+        current_app.config['AZ_CLI_PATH']: 'az',
+    }.get(cmd[0])
+    if tool is None:
+        return None
+    return pool.call(tool, cmd[1:], env, timeout)
+
+
+def _worker_output(call, cmd, timeout):
+    try:
+        yield from call
+    except CLIWorkerTimeout:
+        raise CLIError(cmd[0], -1, f"Command timed out after {timeout} seconds") from None
+    except CLIWorkerDied as e:
+        raise CLIError(cmd[0], -1, f"CLI worker failed: {e}") from None
+
+
+class _ChunkReader:
+    """Minimal read() over an iterator of text chunks, for iter_json_array."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def read(self, size=-1):
+        # An empty chunk is not EOF; only the end of the iterator is
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return ''
+
+
+def iter_json_array(stream, read_size=STREAM_READ_SIZE):
+    """Incrementally decode a top-level JSON array from a text stream.
+
+    Yields each element as soon as it is complete. Empty output yields
+    nothing; a top-level value that is not an array is ignored.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(read_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip(' \t\r\n')
+    if pos >= len(buf):
+        return
+    if buf[pos] != '[':
+        while not eof:
+            fill()
+        return
+    pos += 1
+
+    while True:
+        skip(' \t\r\n,')
+        if pos >= len(buf):
+            raise json.JSONDecodeError('Unterminated array', buf, pos)
+        if buf[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buf) and not eof:
+            # A number at the end of the buffer may be cut short; read on.
+            fill()
+            continue
+        pos = end
+        yield item
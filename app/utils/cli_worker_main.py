@@ -0,0 +1,118 @@
+"""Long-lived CLI worker process; started by app.utils.cli_workers.
+
+Runs under the CLI's own Python interpreter, so it imports nothing from
+the application:
+
+    python cli_worker_main.py aws|az|module:function
+
+The driver is imported once, then one JSON request per line is read from
+stdin: {"args": [...], "env": {...}}. The command runs with that
+environment, which is reset afterwards, and the answer is written to
+stdout as {"out": text} chunks followed by {"rc": code, "err": text}.
+At startup {"ready": true} (or {"ready": false, "err": ...}) is sent once
+the driver has been imported. The worker exits when stdin closes.
+"""
+import importlib
+import io
+import json
+import os
+import sys
+import traceback
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _aws_driver():
+    from awscli.clidriver import create_clidriver
+
+    def run(args):
+        # A new driver per command picks up this command's credentials
+        return create_clidriver().main(args)
+    return run
+
+
+def _az_driver():
+    from azure.cli.core import get_default_cli
+
+    def run(args):
+        return get_default_cli().invoke(args, out_file=sys.stdout)
+    return run
+
+
+def _load_driver(name):
+    if name == 'aws':
+        return _aws_driver()
+    if name == 'az':
+        return _az_driver()
+    module_name, _, function_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class _ChunkWriter(io.TextIOBase):
+    """Stands in for sys.stdout, forwarding output as {"out": ...} messages."""
+
+    def __init__(self, send):
+        self._send = send
+        self._parts = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= CHUNK_SIZE:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._parts:
+            self._send({'out': ''.join(self._parts)})
+            self._parts = []
+            self._size = 0
+
+
+def main():
+    # Answers go to a private copy of stdout; fd 1 is pointed at stderr so
+    # stray writes from libraries can't corrupt the protocol.
+    protocol = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    os.dup2(2, 1)
+
+    def send(message):
+        protocol.write(json.dumps(message) + '\n')
+        protocol.flush()
+
+    try:
+        run = _load_driver(sys.argv[1])
+    except BaseException:
+        send({'ready': False, 'err': traceback.format_exc()})
+        return 1
+    send({'ready': True})
+
+    base_env = dict(os.environ)
+    for line in sys.stdin:
+        request = json.loads(line)
+        out = _ChunkWriter(send)
+        err = io.StringIO()
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.stdout, sys.stderr = out, err
+        try:
+            rc = run(request['args'])
+        except SystemExit as e:
+            rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except BaseException:
+            err.write(traceback.format_exc())
+            rc = 255
+        finally:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            os.environ.clear()
+            os.environ.update(base_env)
+        out.flush()
+        send({'rc': rc or 0, 'err': err.getvalue()})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
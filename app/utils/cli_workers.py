@@ -0,0 +1,306 @@
+"""Long-lived CLI worker processes.
+
+Each `aws` / `az` call normally starts a new interpreter and re-imports
+botocore or azure-cli, which dominates the cost of short commands. With
+AWS_CLI_PYTHON / AZ_CLI_PYTHON set to the Python interpreter the CLI is
+installed in, commands go instead to warm helper processes
+(cli_worker_main.py) that import the CLI once and then run one command
+at a time, read from a pipe.
+
+AWS helpers are shared by every credential set: each command's
+environment is installed for that command only. The Azure CLI fixes its
+config dir at import, so an Azure helper serves a single AZURE_CONFIG_DIR,
+i.e. one login session (see azure_sessions).
+
+At most CLI_WORKER_MAX helpers run per application process; when none is
+free the command runs as an ordinary subprocess. Helpers idle for
+CLI_WORKER_IDLE_SECONDS are stopped. A helper that overruns the command
+timeout is killed; one that dies is replaced, and the command retried
+once on the new helper if it had not produced any output yet.
+"""
+import atexit
+import json
+import logging
+import os
+import select
+import subprocess
+import threading
+import time
+
+HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli_worker_main.py')
+READ_SIZE = 64 * 1024
+
+# Never left behind in a helper's own environment
+CREDENTIAL_ENV_KEYS = {'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'}
+
+logger = logging.getLogger(__name__)
+
+
+class CLIWorkerDied(Exception):
+    pass
+
+
+class CLIWorkerTimeout(Exception):
+    pass
+
+
+class _Worker:
+    def __init__(self, key, argv, env, start_timeout):
+        self.key = key
+        self.last_used = 0.0
+        self._buf = b''
+        self.proc = subprocess.Popen(
+            argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, env=env, shell=False,
+        )
+        try:
+            message = self.read(time.monotonic() + start_timeout)
+        except BaseException:
+            self.kill()
+            raise
+        if not message.get('ready'):
+            self.kill()
+            raise CLIWorkerDied(message.get('err') or 'CLI worker failed to start')
+
+    def send(self, request):
+        try:
+            self.proc.stdin.write(json.dumps(request).encode('utf-8') + b'\n')
+            self.proc.stdin.flush()
+        except OSError as e:
+            raise CLIWorkerDied(str(e)) from None
+
+    def read(self, deadline):
+        fd = self.proc.stdout.fileno()
+        while b'\n' not in self._buf:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CLIWorkerTimeout()
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, READ_SIZE)
+            if not chunk:
+                raise CLIWorkerDied('CLI worker exited unexpectedly')
+            self._buf += chunk
+        line, self._buf = self._buf.split(b'\n', 1)
+        return json.loads(line)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def stop(self):
+        # Closing stdin ends the worker's request loop
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        for pipe in (self.proc.stdin, self.proc.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+class CLIWorkerCall:
+    """One command on a helper. Iterate for its stdout, then read returncode and stderr."""
+
+    def __init__(self, pool, tool, worker, args, env, timeout):
+        self.returncode = None
+        self.stderr = ''
+        self._pool = pool
+        self._tool = tool
+        self._worker = worker
+        self._args = args
+        self._env = env
+        self._timeout = timeout
+
+    def __iter__(self):
+        deadline = time.monotonic() + self._timeout
+        produced = False
+        worker = self._worker
+        self._worker = None
+        try:
+            for attempt in range(2):
+                try:
+                    worker.send({'args': self._args, 'env': self._env})
+                    while True:
+                        message = worker.read(deadline)
+                        if 'out' in message:
+                            produced = True
+                            yield message['out']
+                            continue
+                        self.returncode = message['rc']
+                        self.stderr = message.get('err', '')
+                        self._pool._release(worker)
+                        worker = None
+                        return
+                except CLIWorkerDied:
+                    self._pool._discard(worker)
+                    worker = None
+                    if produced or attempt:
+                        raise
+                    worker = self._pool._replacement(self._tool, self._env)
+                    if worker is None:
+                        raise
+        finally:
+            # Timed out, failed, or abandoned mid-output: the helper's state
+            # is unknown, so it is not reused.
+            if worker is not None:
+                self._pool._discard(worker)
+
+
+class CLIWorkerPool:
+    def __init__(self, drivers, max_workers=4, idle_seconds=300, start_timeout=60,
+                 clock=time.monotonic):
+        """drivers maps a tool ('aws', 'az') to (python interpreter, driver name)."""
+        self.drivers = drivers
+        self.max_workers = max_workers
+        self.idle_seconds = idle_seconds
+        self.start_timeout = start_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._idle = []   # least recently used first
+        self._count = 0
+        self._unavailable_until = {}  # tool -> time; its helper failed to start
+        self._closed = threading.Event()
+        self._reaper = None
+        self.started = 0
+        self.reused = 0
+        self.fallbacks = 0
+
+    def call(self, tool, args, env, timeout):
+        """Return a CLIWorkerCall, or None to run the command as a plain subprocess."""
+        if tool not in self.drivers or self._closed.is_set():
+            return None
+        worker = self._checkout(tool, env)
+        if worker is None:
+            with self._lock:
+                self.fallbacks += 1
+            return None
+        return CLIWorkerCall(self, tool, worker, args, env, timeout)
+
+    def reap(self):
+        """Stop helpers idle for longer than idle_seconds."""
+        now = self._clock()
+        with self._lock:
+            expired = [w for w in self._idle if now - w.last_used > self.idle_seconds]
+            self._idle = [w for w in self._idle if w not in expired]
+            self._count -= len(expired)
+        for worker in expired:
+            worker.stop()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def _key(self, tool, env):
+        return (tool, env.get('AZURE_CONFIG_DIR')) if tool == 'az' else (tool,)
+
+    def _checkout(self, tool, env):
+        key = self._key(tool, env)
+        victim = None
+        with self._lock:
+            for worker in reversed(self._idle):
+                if worker.key == key:
+                    self._idle.remove(worker)
+                    if worker.alive():
+                        self.reused += 1
+                        return worker
+                    self._count -= 1
+                    worker.kill()
+                    break
+            if self._unavailable_until.get(tool, 0) > self._clock():
+                return None
+            if self._count >= self.max_workers:
+                if not self._idle:
+                    return None
+                # Hand the slot of the least recently used idle helper over
+                victim = self._idle.pop(0)
+                self._count -= 1
+            self._count += 1
+        if victim is not None:
+            victim.stop()
+        return self._spawn(tool, key, env)
+
+    def _replacement(self, tool, env):
+        with self._lock:
+            self._count += 1
+        return self._spawn(tool, self._key(tool, env), env)
+
+    def _spawn(self, tool, key, env):
+        # Caller has reserved a slot in self._count
+        python, driver = self.drivers[tool]
+        helper_env = {k: v for k, v in env.items() if k not in CREDENTIAL_ENV_KEYS}
+        try:
+            worker = _Worker(key, [python, HELPER, driver], helper_env, self.start_timeout)
+        except (CLIWorkerDied, CLIWorkerTimeout, OSError) as e:
+            logger.warning('Could not start %s CLI worker, running commands directly: %s', tool, e)
+            with self._lock:
+                self._count -= 1
+                self._unavailable_until[tool] = self._clock() + self.idle_seconds
+            return None
+        with self._lock:
+            self.started += 1
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name='nf-cli-reaper', daemon=True)
+                self._reaper.start()
+        return worker
+
+    def _release(self, worker):
+        worker.last_used = self._clock()
+        with self._lock:
+            if not self._closed.is_set():
+                self._idle.append(worker)
+                return
+            self._count -= 1
+        worker.stop()
+
+    def _discard(self, worker):
+        with self._lock:
+            self._count -= 1
+        worker.kill()
+
+    def _reap_loop(self):
+        interval = max(1.0, self.idle_seconds / 2)
+        while not self._closed.wait(interval):
+            self.reap()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool(config):
+    """Return the process-wide pool, or None if no CLI interpreter is configured."""
+    global _pool
+    drivers = {}
+    if config['AWS_CLI_PYTHON']:
+        drivers['aws'] = (config['AWS_CLI_PYTHON'], 'aws')
+    if config['AZ_CLI_PYTHON']:
+        drivers['az'] = (config['AZ_CLI_PYTHON'], 'az')
+    if not drivers:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = CLIWorkerPool(
+                drivers,
+                max_workers=config['CLI_WORKER_MAX'],
+                idle_seconds=config['CLI_WORKER_IDLE_SECONDS'],
+            )
+            atexit.register(_pool.close)
+        return _pool
@@ -1,37 +1,157 @@
+"""Credential and setting encryption.
+
+The cipher is a MultiFernet built once per process from FERNET_KEY (used
+to encrypt) and FERNET_OLD_KEYS (still accepted for decryption while
+values are re-encrypted after a key rotation).
+
+Decrypted secrets are kept in a small in-memory cache for
+CREDENTIAL_CACHE_SECONDS, keyed by owner (e.g. connection id) and a hash
+of the ciphertext, so a changed ciphertext never returns a stale secret.
+Entries are dropped when the owner's secret is changed in this process,
+evicted LRU-first beyond CREDENTIAL_CACHE_MAX_ENTRIES, and cleared at
+process exit.
+"""
+import atexit
+import copy
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from flask import current_app
 
+_fernets = {}
+_fernet_lock = threading.Lock()
+
+_secret_cache = None
+_secret_cache_lock = threading.Lock()
+
+
+def get_fernet():
+    """Return the process-wide MultiFernet for the current key configuration."""
+    return _fernet_for(_configured_keys(current_app.config))
+
 
-def _get_fernet():
-    key = current_app.config['FERNET_KEY']
-    if isinstance(key, str):
-        key = key.encode('utf-8')
-    return Fernet(key)
+def get_current_fernet():
+    """Return a cipher for FERNET_KEY alone, e.g. to tell if a token needs rotating."""
+    return _fernet_for(_configured_keys(current_app.config)[:1])
 
 
 def encrypt_credentials(credentials_dict):
-    f = _get_fernet()
+    f = get_fernet()
     json_bytes = json.dumps(credentials_dict).encode('utf-8')
     return f.encrypt(json_bytes).decode('utf-8')
 
 
-def decrypt_credentials(encrypted_str):
-    f = _get_fernet()
-    json_bytes = f.decrypt(encrypted_str.encode('utf-8'))
-    return json.loads(json_bytes.decode('utf-8'))
+def decrypt_credentials(encrypted_str, cache_key=None):
+    """Decrypt a credentials blob; pass cache_key to cache the result."""
+    def decrypt():
+        json_bytes = get_fernet().decrypt(encrypted_str.encode('utf-8'))
+        return json.loads(json_bytes.decode('utf-8'))
+
+    if cache_key is None:
+        return decrypt()
+    # Callers get their own copy so they can't alter the cached secret
+    return copy.deepcopy(get_secret_cache(current_app.config).get(cache_key, encrypted_str, decrypt))
 
 
 def encrypt_value(plaintext):
-    f = _get_fernet()
+    f = get_fernet()
     return f.encrypt(plaintext.encode('utf-8')).decode('utf-8')
 
 
-def decrypt_value(encrypted_str):
-    f = _get_fernet()
-    return f.decrypt(encrypted_str.encode('utf-8')).decode('utf-8')
+def decrypt_value(encrypted_str, cache_key=None):
+    """Decrypt a single value; pass cache_key to cache the result."""
+    def decrypt():
+        return get_fernet().decrypt(encrypted_str.encode('utf-8')).decode('utf-8')
+
+    if cache_key is None:
+        return decrypt()
+    return get_secret_cache(current_app.config).get(cache_key, encrypted_str, decrypt)
+
+
+def forget_secret(cache_key):
+    """Drop cached plaintext for cache_key, e.g. after its secret changed."""
+    with _secret_cache_lock:
+        cache = _secret_cache
+    if cache is not None:
+        cache.invalidate(cache_key)
 
 
 def generate_fernet_key():
     return Fernet.generate_key().decode('utf-8')
+
+
+def _fernet_for(keys):
+    keys = tuple(keys)
+    with _fernet_lock:
+        fernet = _fernets.get(keys)
+        if fernet is None:
+            fernet = MultiFernet([Fernet(key) for key in keys])
+            _fernets[keys] = fernet
+        return fernet
+
+
+def _configured_keys(config):
+    primary = config['FERNET_KEY']
+    old = config.get('FERNET_OLD_KEYS') or ''
+    if isinstance(old, str):
+        old = [k.strip() for k in old.split(',') if k.strip()]
+    keys = [primary] + [k for k in old if k != primary]
+    return [k.encode('utf-8') if isinstance(k, str) else k for k in keys]
+
+
+class SecretCache:
+    """Bounded TTL cache of decrypted secrets."""
+
+    def __init__(self, ttl, max_entries, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # cache_key -> (ciphertext hash, expires_at, value)
+
+    def get(self, cache_key, ciphertext, decrypt):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return decrypt()
+        digest = hashlib.sha256(ciphertext.encode('utf-8')).digest()
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == digest and entry[1] > now:
+                self._entries.move_to_end(cache_key)
+                return entry[2]
+
+        value = decrypt()
+        with self._lock:
+            self._entries[cache_key] = (digest, now + self.ttl, value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, cache_key):
+        with self._lock:
+            self._entries.pop(cache_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def get_secret_cache(config):
+    global _secret_cache
+    with _secret_cache_lock:
+        if _secret_cache is None:
+            _secret_cache = SecretCache(
+                ttl=config['CREDENTIAL_CACHE_SECONDS'],
+                max_entries=config['CREDENTIAL_CACHE_MAX_ENTRIES'],
+            )
+            atexit.register(_secret_cache.clear)
+        return _secret_cache
@@ -0,0 +1,96 @@
+"""Keyset (seek) pagination.
+
+Instead of OFFSET, each page is fetched with a WHERE clause comparing the
+sort key to the key of the last row seen, so deep pages cost the same as
+the first one. The sort key must be unique (end it with the primary key).
+Cursors are opaque, URL-safe strings encoding that key.
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def paginate_keyset(query, sort_columns, key_of, per_page,
+                    after=None, before=None, descending=False):
+    """Return one KeysetPage of query ordered by sort_columns.
+
+    key_of(row) must return the row's values for sort_columns, in order.
+    Pass the previous page's next_cursor as after, or its prev_cursor as
+    before. Invalid cursors are treated as absent.
+    """
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before) if after_key is None else None
+    backwards = before_key is not None
+    cursor_key = before_key if backwards else after_key
+
+    # Walking backwards means reading in the opposite order, then flipping.
+    reverse = descending != backwards
+    if cursor_key is not None:
+        key = tuple_(*sort_columns)
+        values = tuple_(*cursor_key)
+        query = query.filter(key < values if reverse else key > values)
+    query = query.order_by(*[c.desc() if reverse else c.asc() for c in sort_columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(key_of(rows[-1]))
+        if cursor_key is not None and (not backwards or has_more):
+            prev_cursor = encode_cursor(key_of(rows[0]))
+    return KeysetPage(rows, next_cursor, prev_cursor)
+
+
+def encode_cursor(values):
+    encoded = []
+    for value in values:
+        if isinstance(value, uuid.UUID):
+            encoded.append(['u', str(value)])
+        elif isinstance(value, datetime):
+            encoded.append(['d', value.isoformat()])
+        else:
+            encoded.append(['v', value])
+    raw = json.dumps(encoded, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = []
+        for tag, value in json.loads(raw):
+            if tag == 'u':
+                values.append(uuid.UUID(value))
+            elif tag == 'd':
+                values.append(datetime.fromisoformat(value))
+            else:
+                values.append(value)
+        return values
+    except (ValueError, TypeError, binascii.Error):
+        return None
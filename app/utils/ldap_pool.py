@@ -0,0 +1,315 @@
+"""Pooled LDAP connections for logins.
+
+Opening an LDAP connection costs a TCP (and usually TLS) handshake, so
+each process keeps two small pools of long-lived connections to LDAP_HOST:
+
+* search connections, bound once as the service account
+  (LDAP_BIND_USER_DN), used to look users up by their login attribute;
+* bind connections, rebound as each user to check their password and
+  then handed to the next login.
+
+At most LDAP_POOL_SIZE connections of each kind are open at once; callers
+wait up to LDAP_POOL_TIMEOUT seconds for a free one. On checkout a
+connection that has been closed, or sat idle longer than
+LDAP_POOL_IDLE_SECONDS, is replaced; a connection that fails mid-operation
+is discarded instead of returned, and the operation is retried once on a
+fresh one. LDAP_CONNECT_TIMEOUT and LDAP_RECEIVE_TIMEOUT keep an
+unresponsive directory from holding a worker indefinitely.
+
+Service-account lookups, including ones that found nothing, are cached
+for LDAP_LOOKUP_CACHE_SECONDS so a burst of logins for the same users
+doesn't repeat the same searches. Password binds are never cached.
+"""
+import atexit
+import copy
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import ldap3
+from ldap3.core.exceptions import LDAPBindError, LDAPCommunicationError, LDAPException
+
+
+LOOKUP_CACHE_MAX_ENTRIES = 1024
+
+
+class LdapPoolTimeout(LDAPException):
+    """No pooled connection became free within LDAP_POOL_TIMEOUT."""
+
+
+class _ConnectionPool:
+    def __init__(self, name, size, timeout, max_idle, connect, clock):
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._connect = connect
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, last used), most recently used last
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+        self.created = 0
+        self.reused = 0
+        self.expired = 0    # closed or idle too long when checked out
+        self.discarded = 0  # failed while in use
+        self.waits = 0
+        self.timeouts = 0
+
+    @contextmanager
+    def connection(self):
+        """Yield (connection, reused); the connection is dropped if the block raises."""
+        conn, reused = self._checkout()
+        try:
+            yield conn, reused
+        except BaseException:
+            self._release(conn, healthy=False)
+            raise
+        self._release(conn, healthy=True)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            _unbind(conn)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'expired': self.expired,
+                'discarded': self.discarded,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+            }
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            stale = None
+            with self._cond:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    if conn.closed or self._clock() - last_used > self.max_idle:
+                        self._open -= 1
+                        self.expired += 1
+                        stale = conn
+                    else:
+                        self.reused += 1
+                        self._in_use += 1
+                        return conn, True
+                elif self._open < self.size:
+                    self._open += 1
+                    self._in_use += 1
+                    break
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise LdapPoolTimeout(f'No free LDAP {self.name} connection')
+                    if not waited:
+                        self.waits += 1
+                        waited = True
+                    self._cond.wait(remaining)
+                    continue
+            _unbind(stale)
+
+        # Connect outside the lock; the slot is already reserved
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return conn, False
+
+    def _release(self, conn, healthy):
+        keep = healthy and not conn.closed
+        with self._cond:
+            self._in_use -= 1
+            if keep and not self._closed:
+                self._idle.append((conn, self._clock()))
+            else:
+                self._open -= 1
+                if not healthy:
+                    self.discarded += 1
+            self._cond.notify()
+        if not keep or self._closed:
+            _unbind(conn)
+
+
+class LdapPool:
+    """Service-account search and user bind connections to one directory."""
+
+    def __init__(self, host, port=389, use_ssl=False, bind_dn='', bind_password='',
+                 size=5, timeout=5, max_idle=300, connect_timeout=5, receive_timeout=10,
+                 lookup_ttl=0, connection_factory=None, clock=time.monotonic):
+        self.has_service_account = bool(bind_dn)
+        self._clock = clock
+        self._lookup_ttl = lookup_ttl
+        self._lookups = OrderedDict()  # (base, filter, attributes) -> (expires_at, entry)
+        self._lookups_lock = threading.Lock()
+        self.lookup_hits = 0
+        self.lookup_misses = 0
+        self._server = ldap3.Server(
+            host, port=port, use_ssl=use_ssl, get_info=ldap3.NONE,
+            connect_timeout=connect_timeout,
+        )
+        self._receive_timeout = receive_timeout
+        connect = connection_factory or self._connect
+        self._search = _ConnectionPool(
+            'search', size, timeout, max_idle, lambda: connect(bind_dn, bind_password), clock,
+        )
+        self._bind = _ConnectionPool(
+            'bind', size, timeout, max_idle, lambda: connect(None, None), clock,
+        )
+
+    def find_user(self, search_base, search_filter, attributes):
+        """Search as the service account; return the first entry as {'dn', 'attributes'} or None."""
+        key = (search_base, search_filter, tuple(attributes))
+        with self._lookups_lock:
+            cached = self._lookups.get(key)
+            if cached is not None and cached[0] > self._clock():
+                self._lookups.move_to_end(key)
+                self.lookup_hits += 1
+                return copy.deepcopy(cached[1])
+            self.lookup_misses += 1
+
+        entry = self._run(self._search, lambda conn: _first_entry(
+            conn, search_base, search_filter, attributes,
+        ))
+        if self._lookup_ttl > 0:
+            with self._lookups_lock:
+                self._lookups[key] = (self._clock() + self._lookup_ttl, copy.deepcopy(entry))
+                self._lookups.move_to_end(key)
+                while len(self._lookups) > LOOKUP_CACHE_MAX_ENTRIES:
+                    self._lookups.popitem(last=False)
+        return entry
+
+    def check_password(self, user_dn, password, lookup=None):
+        """Bind as user_dn; return (ok, entry).
+
+        lookup=(search_base, search_filter, attributes) runs that search
+        as the user once bound, for directories without a service account.
+        """
+        if not password:
+            # An empty password is an unauthenticated bind, which succeeds
+            return False, None
+
+        def bind(conn):
+            if not conn.rebind(user=user_dn, password=password):
+                return False, None
+            return True, _first_entry(conn, *lookup) if lookup else None
+
+        return self._run(self._bind, bind)
+
+    def metrics(self):
+        with self._lookups_lock:
+            lookups = {
+                'hits': self.lookup_hits,
+                'misses': self.lookup_misses,
+                'entries': len(self._lookups),
+            }
+        return {'search': self._search.metrics(), 'bind': self._bind.metrics(), 'lookups': lookups}
+
+    def close(self):
+        self._search.close()
+        self._bind.close()
+        with self._lookups_lock:
+            self._lookups.clear()
+
+    def _run(self, pool, operation):
+        reused = False
+        try:
+            with pool.connection() as (conn, reused):
+                return operation(conn)
+        except LDAPCommunicationError:
+            # The server may have dropped a pooled connection; a new one
+            # failing as well is a real outage.
+            if not reused:
+                raise
+        with pool.connection() as (conn, _):
+            return operation(conn)
+
+    def _connect(self, user, password):
+        conn = ldap3.Connection(
+            self._server, user=user, password=password,
+            receive_timeout=self._receive_timeout,
+        )
+        if user:
+            if not conn.bind():
+                _unbind(conn)
+                raise LDAPBindError(f'Service account bind failed: {conn.result}')
+        else:
+            conn.open()
+        return conn
+
+
+def _first_entry(conn, search_base, search_filter, attributes):
+    conn.search(search_base, search_filter, attributes=attributes, size_limit=1)
+    for entry in conn.response or []:
+        if entry.get('type') == 'searchResEntry':
+            return {'dn': entry['dn'], 'attributes': dict(entry.get('attributes', {}))}
+    return None
+
+
+def _unbind(conn):
+    try:
+        conn.unbind()
+    except LDAPException:
+        pass
+
+
+_pool = None
+_pool_settings = None
+_pool_lock = threading.Lock()
+
+
+def get_ldap_pool(config):
+    """Return the process-wide pool, rebuilt if the LDAP settings changed."""
+    global _pool, _pool_settings
+    settings = (
+        config['LDAP_HOST'], config['LDAP_PORT'], config['LDAP_USE_SSL'],
+        config['LDAP_BIND_USER_DN'], config['LDAP_BIND_USER_PASSWORD'],
+        config['LDAP_POOL_SIZE'], config['LDAP_POOL_TIMEOUT'], config['LDAP_POOL_IDLE_SECONDS'],
+        config['LDAP_CONNECT_TIMEOUT'], config['LDAP_RECEIVE_TIMEOUT'],
+        config['LDAP_LOOKUP_CACHE_SECONDS'],
+    )
+    with _pool_lock:
+        if _pool is None or _pool_settings != settings:
+            if _pool is not None:
+                _pool.close()
+            _pool = LdapPool(*settings)
+            _pool_settings = settings
+        return _pool
+
+
+def ldap_pool_metrics():
+    """Metrics for this process's pool, or None if no LDAP login has happened yet."""
+    with _pool_lock:
+        return _pool.metrics() if _pool is not None else None
+
+
+@atexit.register
+def close_ldap_pool():
+    global _pool, _pool_settings
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+        _pool_settings = None
@@ -0,0 +1,95 @@
+"""Per-username login failure counting and lockout.
+
+After LOGIN_MAX_FAILURES failed sign-ins for a username within
+LOGIN_FAILURE_WINDOW_SECONDS, further attempts for that username are
+refused for LOGIN_LOCKOUT_SECONDS without hashing the password or asking
+LDAP, so a credential-stuffing burst costs a dictionary lookup per
+request. A successful sign-in clears the username's record.
+
+Counts are kept in memory per worker process (at most
+LOGIN_THROTTLE_MAX_ENTRIES usernames, least recently seen dropped first),
+so with several workers the effective limit is that many times higher.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Record:
+    __slots__ = ('failures', 'locked_until')
+
+    def __init__(self):
+        self.failures = []  # timestamps within the window
+        self.locked_until = 0.0
+
+
+class LoginThrottle:
+    def __init__(self, max_failures, window, lockout, max_entries, clock=time.monotonic):
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+
+    def locked_for(self, username):
+        """Seconds until username may try again; 0 if it isn't locked out."""
+        if self.max_failures <= 0:
+            return 0
+        with self._lock:
+            record = self._records.get(_key(username))
+            if record is None:
+                return 0
+            return max(0, record.locked_until - self._clock())
+
+    def record_failure(self, username):
+        """Count a failed attempt; return True if it started a lockout."""
+        if self.max_failures <= 0:
+            return False
+        key = _key(username)
+        now = self._clock()
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                record = self._records[key] = _Record()
+            self._records.move_to_end(key)
+            record.failures = [t for t in record.failures if now - t < self.window]
+            record.failures.append(now)
+            started = False
+            if len(record.failures) >= self.max_failures:
+                record.locked_until = now + self.lockout
+                record.failures = []
+                started = True
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+            return started
+
+    def record_success(self, username):
+        with self._lock:
+            self._records.pop(_key(username), None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+def _key(username):
+    return (username or '').strip().lower()
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle(config):
+    global _throttle
+    with _throttle_lock:
+        if _throttle is None:
+            _throttle = LoginThrottle(
+                max_failures=config['LOGIN_MAX_FAILURES'],
+                window=config['LOGIN_FAILURE_WINDOW_SECONDS'],
+                lockout=config['LOGIN_LOCKOUT_SECONDS'],
+                max_entries=config['LOGIN_THROTTLE_MAX_ENTRIES'],
+            )
+        return _throttle
@@ -0,0 +1,69 @@
+"""Password hash checks on a bounded thread pool.
+
+Werkzeug's scrypt/pbkdf2 hashes are deliberately expensive. Running them
+on PASSWORD_HASH_WORKERS dedicated threads caps how much CPU a burst of
+sign-ins can take from the worker's other request threads; the hash
+functions release the GIL, so those threads keep serving pages meanwhile.
+At most PASSWORD_HASH_QUEUE checks wait for a hashing thread; beyond that,
+or after PASSWORD_HASH_TIMEOUT seconds, HashingBusy is raised so the
+caller can fail fast instead of stacking up blocked requests.
+"""
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash
+
+
+class HashingBusy(Exception):
+    """Too many password checks are already queued."""
+
+
+class HashingPool:
+    def __init__(self, workers, max_pending, timeout):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pw-hash')
+        # One slot per running or queued check
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def check(self, pwhash, password):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Password hashing queue is full')
+        try:
+            future = self._executor.submit(check_password_hash, pwhash, password)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy('Password check timed out') from None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool(config):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashingPool(
+                workers=config['PASSWORD_HASH_WORKERS'],
+                max_pending=config['PASSWORD_HASH_QUEUE'],
+                timeout=config['PASSWORD_HASH_TIMEOUT'],
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def verify_password(pwhash, password, config):
+    """check_password_hash, run on the hashing pool unless PASSWORD_HASH_WORKERS is 0."""
+    if config['PASSWORD_HASH_WORKERS'] <= 0:
+        return check_password_hash(pwhash, password)
+    return get_hashing_pool(config).check(pwhash, password)
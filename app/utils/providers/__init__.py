@@ -0,0 +1,85 @@
+"""Provider backends: how discovery talks to AWS and Azure.
+
+PROVIDER_BACKEND selects one per deployment:
+
+* ``cli`` (default) runs the aws / az CLIs as subprocesses through
+  app.utils.cli_runner.
+* ``sdk`` calls boto3 and the azure-mgmt libraries in-process, reusing
+  clients and their HTTP connection pools between calls. It needs the
+  packages in requirements-sdk.txt.
+
+Both return the JSON shapes the CLIs print, so discovery functions don't
+depend on which one is in use. Operations are named the boto3 way
+(service 'ec2', operation 'describe_instances'); Azure listings by
+resource kind ('vm', 'vnet', ...).
+"""
+import atexit
+import threading
+
+from flask import current_app
+
+
+class ProviderError(Exception):
+    """A provider call failed: bad credentials, an API error or a timeout."""
+
+
+class ProviderBackend:
+    name = None
+
+    def aws_call(self, service, operation, credentials, timeout=None):
+        """Return the response of a single, unpaginated AWS call."""
+        raise NotImplementedError
+
+    def aws_pages(self, service, operation, credentials):
+        """Yield the pages of a paginated AWS listing."""
+        raise NotImplementedError
+
+    def azure_items(self, resource, credentials):
+        """Yield the resources of one Azure kind in the subscription."""
+        raise NotImplementedError
+
+    def test_aws_connection(self, credentials):
+        """Return (True, caller identity) or (False, error message)."""
+        try:
+            return True, self.aws_call('sts', 'get_caller_identity', credentials, timeout=30)
+        except ProviderError as e:
+            return False, str(e)
+
+    def test_azure_connection(self, credentials):
+        """Return (True, subscription details) or (False, error message)."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(config=None):
+    """Return the process-wide backend named by PROVIDER_BACKEND."""
+    if config is None:
+        config = current_app.config
+    name = config['PROVIDER_BACKEND']
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            backend = _build_backend(name, config)
+            _backends[name] = backend
+            atexit.register(backend.close)
+        return backend
+
+
+def _build_backend(name, config):
+    if name == 'cli':
+        from app.utils.providers.cli import CliBackend
+        return CliBackend()
+    if name == 'sdk':
+        from app.utils.providers.sdk import SdkBackend
+        return SdkBackend(
+            timeout=config['DISCOVERY_TIMEOUT_SECONDS'],
+            max_pool_connections=config['DISCOVERY_MAX_WORKERS'],
+            cache_size=config['SDK_CLIENT_CACHE_SIZE'],
+        )
+    raise ValueError(f"Unknown PROVIDER_BACKEND: {name}")
@@ -0,0 +1,38 @@
+"""Provider backend that runs the aws and az CLIs as subprocesses."""
+from app.utils import cli_runner
+from app.utils.providers import ProviderBackend
+
+# boto3 service names whose CLI command group differs
+AWS_CLI_SERVICES = {'s3': 's3api'}
+
+AZURE_CLI_COMMANDS = {
+    'vm': ['vm', 'list'],
+    'storage_account': ['storage', 'account', 'list'],
+    'sql_server': ['sql', 'server', 'list'],
+    'function_app': ['functionapp', 'list'],
+    'vnet': ['network', 'vnet', 'list'],
+    'resource_group': ['group', 'list'],
+}
+
+
+def aws_cli_args(service, operation):
+    return [AWS_CLI_SERVICES.get(service, service), operation.replace('_', '-')]
+
+
+class CliBackend(ProviderBackend):
+    name = 'cli'
+
+    def aws_call(self, service, operation, credentials, timeout=None):
+        return cli_runner.run_aws_command(aws_cli_args(service, operation), credentials, timeout=timeout)
+
+    def aws_pages(self, service, operation, credentials):
+        return cli_runner.iter_aws_pages(aws_cli_args(service, operation), credentials)
+
+    def azure_items(self, resource, credentials):
+        return cli_runner.iter_azure_items(AZURE_CLI_COMMANDS[resource], credentials)
+
+    def test_aws_connection(self, credentials):
+        return cli_runner.test_aws_connection(credentials)
+
+    def test_azure_connection(self, credentials):
+        return cli_runner.test_azure_connection(credentials)
@@ -0,0 +1,267 @@
+"""In-process provider backend using boto3 and the azure-mgmt SDKs.
+
+Starting a CLI costs a Python interpreter per call; here clients are
+built once per credential set (and region, for AWS) and kept in an LRU of
+SDK_CLIENT_CACHE_SIZE entries, each holding its HTTP connection pool
+open between calls. Azure clients share one requests session, and one
+ClientSecretCredential per service principal so its token is reused.
+
+Responses are converted to the shapes the CLIs print: datetimes become
+ISO 8601 strings, AWS ResponseMetadata is dropped, and Azure models are
+serialized with their REST (camelCase) names plus the resourceGroup field
+the az CLI adds. DISCOVERY_TIMEOUT_SECONDS, or an aws_call's own timeout,
+bounds each HTTP read rather than a whole listing.
+"""
+import base64
+import datetime
+import hashlib
+import importlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from app.utils.azure_sessions import credential_fingerprint
+from app.utils.providers import ProviderBackend, ProviderError
+
+# kind -> (module, client class)
+AZURE_CLIENTS = {
+    'compute': ('azure.mgmt.compute', 'ComputeManagementClient'),
+    'storage': ('azure.mgmt.storage', 'StorageManagementClient'),
+    'sql': ('azure.mgmt.sql', 'SqlManagementClient'),
+    'web': ('azure.mgmt.web', 'WebSiteManagementClient'),
+    'network': ('azure.mgmt.network', 'NetworkManagementClient'),
+    'resource': ('azure.mgmt.resource', 'ResourceManagementClient'),
+    'subscription': ('azure.mgmt.resource', 'SubscriptionClient'),
+}
+
+# resource -> (client kind, listing call)
+AZURE_LISTINGS = {
+    'vm': ('compute', lambda client: client.virtual_machines.list_all()),
+    'storage_account': ('storage', lambda client: client.storage_accounts.list()),
+    'sql_server': ('sql', lambda client: client.servers.list()),
+    'function_app': ('web', lambda client: (
+        app for app in client.web_apps.list() if 'functionapp' in (app.kind or '')
+    )),
+    'vnet': ('network', lambda client: client.virtual_networks.list_all()),
+    'resource_group': ('resource', lambda client: client.resource_groups.list()),
+}
+
+SDK_REQUIREMENTS_HINT = 'install requirements-sdk.txt to use PROVIDER_BACKEND=sdk'
+
+
+class SDKError(ProviderError):
+    pass
+
+
+class SdkBackend(ProviderBackend):
+    name = 'sdk'
+
+    def __init__(self, timeout=120, max_pool_connections=10, cache_size=64,
+                 aws_client_factory=None, azure_client_factory=None):
+        self.timeout = timeout
+        self.max_pool_connections = max_pool_connections
+        self.cache_size = cache_size
+        self._aws_factory = aws_client_factory or self._make_aws_client
+        self._azure_factory = azure_client_factory or self._make_azure_client
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()
+        self._azure_credentials = {}
+        self._http_session = None
+
+    def aws_call(self, service, operation, credentials, timeout=None):
+        client = self._aws_client(service, credentials, timeout)
+        with _translate_errors():
+            response = getattr(client, operation)()
+        return _aws_json(response)
+
+    def aws_pages(self, service, operation, credentials):
+        client = self._aws_client(service, credentials)
+        # Operations only some botocore releases can paginate come back whole
+        if not client.can_paginate(operation):
+            yield self.aws_call(service, operation, credentials)
+            return
+        with _translate_errors():
+            for page in client.get_paginator(operation).paginate():
+                yield _aws_json(page)
+
+    def azure_items(self, resource, credentials):
+        kind, listing = AZURE_LISTINGS[resource]
+        client = self._azure_client(kind, credentials)
+        with _translate_errors():
+            for item in listing(client):
+                yield _azure_json(item, add_resource_group=resource != 'resource_group')
+
+    def test_azure_connection(self, credentials):
+        try:
+            client = self._azure_client('subscription', credentials)
+            with _translate_errors():
+                subscription = client.subscriptions.get(credentials['subscription_id'])
+            return True, _azure_json(subscription, add_resource_group=False)
+        except ProviderError as e:
+            return False, str(e)
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._azure_credentials.clear()
+            session, self._http_session = self._http_session, None
+        for client in clients:
+            _close(client)
+        if session is not None:
+            session.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+    def _aws_client(self, service, credentials, timeout=None):
+        # botocore fixes timeouts when a client is built, so a call with its
+        # own timeout gets (and caches) a client of its own
+        timeout = timeout or self.timeout
+        region = credentials.get('aws_default_region', 'us-east-1')
+        key = ('aws', _aws_fingerprint(credentials), region, service, timeout)
+        return self._cached(key, lambda: self._aws_factory(service, credentials, timeout))
+
+    def _azure_client(self, kind, credentials):
+        key = ('azure', credential_fingerprint(credentials), credentials.get('subscription_id'), kind)
+        return self._cached(key, lambda: self._azure_factory(kind, credentials))
+
+    def _cached(self, key, build):
+        # Built under the lock: boto3 sessions are not thread-safe to create
+        # clients from, and building twice would waste a connection pool.
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = build()
+                self._clients[key] = client
+            self._clients.move_to_end(key)
+            evicted = []
+            while len(self._clients) > self.cache_size:
+                evicted.append(self._clients.popitem(last=False)[1])
+        for old in evicted:
+            _close(old)
+        return client
+
+    def _make_aws_client(self, service, credentials, timeout):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise SDKError(f'boto3 is not installed; {SDK_REQUIREMENTS_HINT}') from None
+        session = boto3.session.Session(
+            aws_access_key_id=credentials['aws_access_key_id'],
+            aws_secret_access_key=credentials['aws_secret_access_key'],
+            region_name=credentials.get('aws_default_region', 'us-east-1'),
+        )
+        return session.client(service, config=Config(
+            max_pool_connections=self.max_pool_connections,
+            connect_timeout=min(30, timeout),
+            read_timeout=timeout,
+            retries={'mode': 'standard'},
+        ))
+
+    def _make_azure_client(self, kind, credentials):
+        # Called with self._lock held
+        module_name, class_name = AZURE_CLIENTS[kind]
+        try:
+            client_class = getattr(importlib.import_module(module_name), class_name)
+            from azure.core.pipeline.transport import RequestsTransport
+            from azure.identity import ClientSecretCredential
+        except ImportError:
+            raise SDKError(f'{module_name} is not installed; {SDK_REQUIREMENTS_HINT}') from None
+
+        if self._http_session is None:
+            import requests
+            self._http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_pool_connections)
+            self._http_session.mount('https://', adapter)
+
+        def transport():
+            return RequestsTransport(
+                session=self._http_session, session_owner=False,
+                connection_timeout=30, read_timeout=self.timeout,
+            )
+
+        fingerprint = credential_fingerprint(credentials)
+        credential = self._azure_credentials.get(fingerprint)
+        if credential is None:
+            credential = ClientSecretCredential(
+                credentials['tenant_id'], credentials['client_id'], credentials['client_secret'],
+                transport=transport(),
+            )
+            self._azure_credentials[fingerprint] = credential
+        if kind == 'subscription':
+            return client_class(credential, transport=transport())
+        return client_class(credential, credentials['subscription_id'], transport=transport())
+
+
+@contextmanager
+def _translate_errors():
+    """Re-raise SDK exceptions as SDKError, which discovery reports per service."""
+    error_types = _sdk_error_types()
+    try:
+        yield
+    except error_types as e:
+        raise SDKError(str(e)) from e
+
+
+def _sdk_error_types():
+    types = []
+    try:
+        from botocore.exceptions import BotoCoreError, ClientError
+        types += [BotoCoreError, ClientError]
+    except ImportError:
+        pass
+    try:
+        from azure.core.exceptions import AzureError
+        types.append(AzureError)
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+def _aws_fingerprint(credentials):
+    material = '\0'.join(
+        credentials.get(k, '') for k in ('aws_access_key_id', 'aws_secret_access_key')
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _aws_json(response):
+    response = dict(response)
+    response.pop('ResponseMetadata', None)
+    return _jsonable(response)
+
+
+def _azure_json(model, add_resource_group=True):
+    data = _jsonable(model.serialize(keep_readonly=True))
+    if add_resource_group and 'resourceGroup' not in data:
+        parts = (data.get('id') or '').split('/')
+        lowered = [p.lower() for p in parts]
+        if 'resourcegroups' in lowered:
+            index = lowered.index('resourcegroups') + 1
+            if index < len(parts):
+                data['resourceGroup'] = parts[index]
+    return data
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    return value
+
+
+def _close(client):
+    close = getattr(client, 'close', None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
@@ -0,0 +1,207 @@
+"""Client-side rate limiting and retry for throttled cloud API calls.
+
+Parallel discovery across services, regions and connections can exceed
+the providers' API rate limits: AWS answers Throttling /
+RequestLimitExceeded and Azure HTTP 429. Calls go through a RateLimiter
+keyed by (provider, account, region, service), each key with its own token
+bucket of CLI_RATE_LIMIT_PER_SECOND calls per second (bursts of up to
+CLI_RATE_LIMIT_BURST).
+
+A throttled call is retried up to CLI_THROTTLE_MAX_RETRIES times, after a
+randomly jittered, exponentially growing delay (CLI_THROTTLE_BACKOFF_SECONDS
+doubling up to CLI_THROTTLE_BACKOFF_MAX_SECONDS). The key's rate is also
+halved on each throttle and grows back by a tenth of the configured rate
+per successful call, so a busy account settles just under its limit
+instead of being throttled over and over. Other errors are raised at once.
+"""
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from app.utils.providers import ProviderError
+
+# Buckets kept per process; the least recently used are dropped beyond this
+BUCKETS_MAX_ENTRIES = 1024
+
+# An adaptive rate never drops below this fraction of the configured one
+MIN_RATE_FRACTION = 1 / 16
+
+THROTTLE_PATTERN = re.compile(
+    r'\((?:Throttling|ThrottlingException|ThrottledException|RequestLimitExceeded'
+    r'|TooManyRequestsException|RequestThrottled|RequestThrottledException|SlowDown'
+    r'|ProvisionedThroughputExceededException|PriorRequestNotComplete)\)'
+    r'|Rate exceeded'
+    r'|Too ?Many ?Requests'
+    r'|\b(?:Subscription|Tenant|Resource(?:Group|Collection)?)RequestsThrottled\b'
+    r'|\(429\)|status(?: code)?:? 429\b',
+    re.IGNORECASE,
+)
+
+
+def is_throttling_error(error):
+    """Whether a failed call was rejected for exceeding the provider's rate limit."""
+    stderr = getattr(error, 'stderr', None)
+    return bool(THROTTLE_PATTERN.search(stderr if stderr is not None else str(error)))
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.throttled = 0
+        self._clock = clock
+        self._updated = clock()
+
+    def reserve(self):
+        """Take a token, returning how long to wait before using it. Caller holds the lock."""
+        if self.rate <= 0:
+            return 0.0
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def slow_down(self):
+        self.throttled += 1
+        if self.rate > 0:
+            self.rate = max(self.base_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    def speed_up(self):
+        if self.rate > 0:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+
+class RateLimiter:
+    def __init__(self, rate=5.0, burst=10, max_retries=5, backoff=1.0, backoff_max=30.0,
+                 clock=time.monotonic, sleep=time.sleep, rng=random.random):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._stats = {
+            'calls': 0, 'throttled': 0, 'retries': 0, 'gave_up': 0,
+            'wait_seconds': 0.0, 'backoff_seconds': 0.0,
+        }
+
+    def call(self, key, fn):
+        """Return fn(), rate limited under key and retried while throttled."""
+        attempt = 0
+        while True:
+            self.acquire(key)
+            try:
+                result = fn()
+            except ProviderError as e:
+                if not self.should_retry(key, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            self.succeeded(key)
+            return result
+
+    def stream(self, key, make_iter):
+        """Yield from make_iter(), retried while throttled before its first item."""
+        attempt = 0
+        while True:
+            self.acquire(key)
+            yielded = False
+            try:
+                for item in make_iter():
+                    yielded = True
+                    yield item
+            except ProviderError as e:
+                # Items already handed out can't be taken back
+                if yielded or not self.should_retry(key, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            self.succeeded(key)
+            return
+
+    def acquire(self, key):
+        """Wait for a token for key."""
+        with self._lock:
+            self._stats['calls'] += 1
+            wait = self._bucket(key).reserve()
+            self._stats['wait_seconds'] += wait
+        if wait > 0:
+            self._sleep(wait)
+
+    def succeeded(self, key):
+        with self._lock:
+            self._bucket(key).speed_up()
+
+    def should_retry(self, key, error, attempt):
+        """Record a failed call; after a throttle, back off and return True to retry."""
+        if not is_throttling_error(error):
+            return False
+        with self._lock:
+            self._stats['throttled'] += 1
+            self._bucket(key).slow_down()
+            if attempt >= self.max_retries:
+                self._stats['gave_up'] += 1
+                return False
+            self._stats['retries'] += 1
+            delay = self._rng() * min(self.backoff_max, self.backoff * 2 ** attempt)
+            self._stats['backoff_seconds'] += delay
+        self._sleep(delay)
+        return True
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['buckets'] = len(self._buckets)
+            stats['throttled_keys'] = {
+                '/'.join(str(part) for part in key if part is not None): {
+                    'throttled': bucket.throttled, 'rate': round(bucket.rate, 3),
+                }
+                for key, bucket in self._buckets.items() if bucket.throttled
+            }
+        return stats
+
+    def _bucket(self, key):
+        # Caller holds self._lock
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, self._clock)
+            self._buckets[key] = bucket
+            while len(self._buckets) > BUCKETS_MAX_ENTRIES:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return bucket
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(config):
+    """Return the process-wide limiter."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                rate=config['CLI_RATE_LIMIT_PER_SECOND'],
+                burst=config['CLI_RATE_LIMIT_BURST'],
+                max_retries=config['CLI_THROTTLE_MAX_RETRIES'],
+                backoff=config['CLI_THROTTLE_BACKOFF_SECONDS'],
+                backoff_max=config['CLI_THROTTLE_BACKOFF_MAX_SECONDS'],
+            )
+        return _limiter
+
+
+def rate_limit_metrics():
+    """Counters for this worker process's limiter, or None before first use."""
+    with _limiter_lock:
+        limiter = _limiter
+    return limiter.metrics() if limiter is not None else None
@@ -0,0 +1,132 @@
+"""Which cloud connections a user can see.
+
+A user sees their own active connections plus the active server-wide
+defaults. Queries should filter with visible_connection_ids_query(), a
+subquery the database can plan as a join. Python-side checks use
+get_visible_connection_ids(), which is memoised for the request and
+cached per user for VISIBILITY_CACHE_SECONDS across requests. Any change
+to a CloudConnection drops the affected cache entries (its old and new
+owner's, or everyone's for a server default), so the TTL only bounds
+staleness in other worker processes.
+"""
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from flask_login import current_user
+from sqlalchemy import and_, event, inspect, or_, select
+from sqlalchemy.orm import Session, object_session
+
+from app.extensions import db
+from app.models.cloud_connection import CloudConnection
+
+ALL_USERS = object()
+
+# {user_id: (expires_at, frozenset of connection ids)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def visible_connection_filter(user=None):
+    user = user or current_user
+    return and_(
+        CloudConnection.is_active.is_(True),
+        or_(
+            CloudConnection.user_id == user.id,
+            and_(CloudConnection.user_id.is_(None), CloudConnection.is_default.is_(True)),
+        ),
+    )
+
+
+def visible_connection_ids_query(user=None):
+    """Select of the visible connection IDs, for use in .in_() filters."""
+    return select(CloudConnection.id).where(visible_connection_filter(user))
+
+
+def get_visible_connections(user=None):
+    """Visible connections, the user's own first, each group by name."""
+    return CloudConnection.query.filter(visible_connection_filter(user)).order_by(
+        CloudConnection.user_id.is_(None), CloudConnection.name
+    ).all()
+
+
+def get_visible_connection_ids(user=None):
+    """Return the frozenset of connection IDs visible to user."""
+    user = user or current_user
+    memo = g.setdefault('visible_connection_ids', {})
+    if user.id in memo:
+        return memo[user.id]
+
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(user.id)
+    if cached and cached[0] > now:
+        ids = cached[1]
+    else:
+        ids = frozenset(db.session.scalars(visible_connection_ids_query(user)))
+        ttl = current_app.config['VISIBILITY_CACHE_SECONDS']
+        if ttl > 0:
+            with _cache_lock:
+                _cache[user.id] = (now + ttl, ids)
+
+    memo[user.id] = ids
+    return ids
+
+
+def invalidate_visible_connections(user_id=ALL_USERS):
+    """Drop cached visibility for one user, or for everyone by default."""
+    with _cache_lock:
+        if user_id is ALL_USERS:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+    if has_app_context():
+        g.pop('visible_connection_ids', None)
+
+
+def _affected_users(target):
+    """IDs of the users whose visible set a change to target can alter.
+
+    Both the old and new owner are affected when a connection is
+    reassigned. Server defaults are visible to everyone, so changes to
+    one, or to is_default itself, affect all users.
+    """
+    state = inspect(target)
+    if state.attrs.is_default.history.has_changes() or target.is_default:
+        return {ALL_USERS}
+    user_ids = {target.user_id, *state.attrs.user_id.history.deleted}
+    if None in user_ids:
+        return {ALL_USERS}
+    return user_ids
+
+
+@event.listens_for(CloudConnection.user_id, 'set', active_history=True)
+def _load_previous_owner(target, value, oldvalue, initiator):
+    # active_history loads the old owner of an expired connection before it
+    # is replaced, so _affected_users() finds it in the attribute history
+    pass
+
+
+@event.listens_for(CloudConnection, 'after_insert')
+@event.listens_for(CloudConnection, 'after_update')
+@event.listens_for(CloudConnection, 'after_delete')
+def _connection_changed(mapper, connection, target):
+    user_ids = _affected_users(target)
+    for user_id in user_ids:
+        invalidate_visible_connections(user_id)
+    # Invalidate again once committed, in case another request re-cached
+    # the old state between this flush and the commit.
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('visibility_changed', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop('visibility_changed', ()):
+        invalidate_visible_connections(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('visibility_changed', None)
@@ -0,0 +1,126 @@
+"""Compare discovery latency and memory between the cli and sdk provider backends.
+
+Usage:
+    python benchmarks/bench_backends.py [--rounds 3] [--region us-east-1]
+    python benchmarks/bench_backends.py --offline [--rounds 20]
+
+Against AWS, credentials come from AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY
+and every AWS discovery function is run --rounds times with each backend
+(the sdk backend needs requirements-sdk.txt installed). Use a read-only
+account; nothing is written to the database.
+
+--offline needs no account: the CLI is replaced by a small Python script
+that prints a canned response and the SDK by a stub client. It measures
+only the fixed per-call cost of each backend, and since the real aws CLI
+is much heavier than the stand-in script, the cli figures are a lower
+bound.
+
+Memory is the peak RSS of CLI child processes for cli, and the growth of
+this process's peak RSS for sdk.
+"""
+import argparse
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.cloud.aws_service import AWS_DISCOVERY_FUNCTIONS  # noqa: E402
+from app.utils import providers  # noqa: E402
+from app.utils.providers.sdk import SdkBackend  # noqa: E402
+from config import BaseConfig  # noqa: E402
+
+STUB_RESPONSE = {
+    'Reservations': [], 'Buckets': [], 'DBInstances': [], 'Functions': [], 'Users': [],
+    'Vpcs': [{'VpcId': 'vpc-0bench', 'Tags': [{'Key': 'Name', 'Value': 'bench'}]}],
+}
+
+STUB_CLI = f"""import json
+print(json.dumps({STUB_RESPONSE!r}))
+"""
+
+
+class StubClient:
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self):
+        return iter([dict(STUB_RESPONSE)])
+
+
+def max_rss_mb(who):
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def bench(app, backend_name, credentials, rounds):
+    app.config['PROVIDER_BACKEND'] = backend_name
+    timings = []
+    self_before = max_rss_mb(resource.RUSAGE_SELF)
+    with app.app_context():
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for fn in AWS_DISCOVERY_FUNCTIONS:
+                for _resource in fn(credentials):
+                    pass
+            timings.append(time.perf_counter() - start)
+
+    if backend_name == 'cli':
+        memory = f'child peak {max_rss_mb(resource.RUSAGE_CHILDREN):7.1f} MB'
+    else:
+        memory = f'self growth {max_rss_mb(resource.RUSAGE_SELF) - self_before:6.1f} MB'
+    per_call = statistics.median(timings) / len(AWS_DISCOVERY_FUNCTIONS)
+    print(f'{backend_name:<4} median {statistics.median(timings):7.3f}s per discovery '
+          f'({per_call * 1000:7.1f} ms per service call, first {timings[0]:.3f}s)  {memory}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--offline', action='store_true')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+
+    class BenchConfig(BaseConfig):
+        SECRET_KEY = 'bench'
+        FERNET_KEY = Fernet.generate_key().decode('utf-8')
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmpdir.name}/bench.db'
+
+    if args.offline:
+        stub = os.path.join(tmpdir.name, 'aws')
+        with open(stub, 'w') as f:
+            f.write(f'#!{sys.executable}\n{STUB_CLI}')
+        os.chmod(stub, 0o755)
+        BenchConfig.AWS_CLI_PATH = stub
+        credentials = {'aws_access_key_id': 'AKIABENCH', 'aws_secret_access_key': 'bench'}
+    else:
+        try:
+            credentials = {
+                'aws_access_key_id': os.environ['AWS_ACCESS_KEY_ID'],
+                'aws_secret_access_key': os.environ['AWS_SECRET_ACCESS_KEY'],
+            }
+        except KeyError:
+            parser.error('set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY, or pass --offline')
+    credentials['aws_default_region'] = args.region
+
+    app = create_app(BenchConfig)
+    if args.offline:
+        providers._backends['sdk'] = SdkBackend(aws_client_factory=lambda service, creds: StubClient())
+
+    print(f'{len(AWS_DISCOVERY_FUNCTIONS)} AWS services, {args.rounds} rounds'
+          f'{" (offline stubs)" if args.offline else ""}')
+    bench(app, 'cli', credentials, args.rounds)
+    bench(app, 'sdk', credentials, args.rounds)
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
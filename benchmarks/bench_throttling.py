@@ -0,0 +1,136 @@
+"""Simulate many parallel AWS discoveries against a throttling API.
+
+Usage:
+    python benchmarks/bench_throttling.py [--connections 4] [--parallel 4]
+        [--calls 50] [--api-rate 20] [--api-burst 40] [--latency-ms 20] [--rate 5]
+
+No account is needed: the CLI is replaced by a stand-in that enforces a
+token bucket of --api-rate calls per second (bursting to --api-burst) per
+access key and service, like AWS's per-account API limits, and answers
+with a Throttling error once it is exhausted. For each of --connections
+access keys and three services, --parallel threads (as when regions or
+pages are fetched in parallel) each make --calls calls.
+
+Runs three times: with no limiting or retries (the old behaviour, where a
+throttled call failed its service), with retries only, and with the
+rate limiter at --rate calls per second (CLI_RATE_LIMIT_PER_SECOND by
+default), retries and adaptive backoff. Reports calls that still failed,
+throttles seen, retries and wall time. Backoff delays are scaled down 10x
+so the run stays short.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.utils import cli_runner, rate_limit  # noqa: E402
+from app.utils.cli_runner import CLIError  # noqa: E402
+from app.utils.rate_limit import RateLimiter, TokenBucket  # noqa: E402
+from config import BaseConfig  # noqa: E402
+
+SERVICES = ['ec2', 'rds', 'lambda']
+THROTTLED = 'An error occurred (Throttling) when calling the operation: Rate exceeded'
+
+
+class ThrottlingApi:
+    """Stands in for _execute: one token bucket per access key and service."""
+
+    def __init__(self, rate, burst, latency):
+        self.rate = rate
+        self.burst = burst
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def __call__(self, cmd, env, timeout):
+        key = (env['AWS_ACCESS_KEY_ID'], cmd[1])
+        with self.lock:
+            bucket = self.buckets.setdefault(key, TokenBucket(self.rate, self.burst))
+            allowed = bucket.reserve() == 0
+            if not allowed:
+                bucket.tokens += 1  # a rejected call does not use up capacity
+        time.sleep(self.latency)
+        if not allowed:
+            raise CLIError(cmd[0], 255, THROTTLED)
+        return {}
+
+
+def run(app, label, limiter, args):
+    rate_limit._limiter = limiter
+    cli_runner._execute = ThrottlingApi(args.api_rate, args.api_burst, args.latency_ms / 1000)
+    failed = 0
+    lock = threading.Lock()
+
+    def discover(index, service):
+        nonlocal failed
+        creds = {'aws_access_key_id': f'AKIABENCH{index:04d}', 'aws_secret_access_key': 'x'}
+        with app.app_context():
+            for _ in range(args.calls):
+                try:
+                    cli_runner.run_aws_command([service, 'describe'], creds)
+                except CLIError:
+                    with lock:
+                        failed += 1
+
+    start = time.perf_counter()
+    threads = args.connections * len(SERVICES) * args.parallel
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for i in range(args.connections):
+            for service in SERVICES:
+                for _ in range(args.parallel):
+                    pool.submit(discover, i, service)
+    elapsed = time.perf_counter() - start
+
+    total = threads * args.calls
+    metrics = limiter.metrics()
+    print(f'{label:<20} {failed:>6}/{total} calls failed  {metrics["throttled"]:>6} throttles  '
+          f'{metrics["retries"]:>6} retries  {elapsed:7.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--parallel', type=int, default=4)
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--api-rate', type=float, default=20)
+    parser.add_argument('--api-burst', type=int, default=40)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--rate', type=float)
+    args = parser.parse_args()
+
+    class BenchConfig(BaseConfig):
+        SECRET_KEY = 'bench'
+        FERNET_KEY = Fernet.generate_key().decode('utf-8')
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+    app = create_app(BenchConfig)
+    config = app.config
+    backoff = config['CLI_THROTTLE_BACKOFF_SECONDS'] / 10
+    backoff_max = config['CLI_THROTTLE_BACKOFF_MAX_SECONDS'] / 10
+
+    rate = config['CLI_RATE_LIMIT_PER_SECOND'] if args.rate is None else args.rate
+
+    print(f'{args.connections} access keys x {len(SERVICES)} services x {args.parallel} threads '
+          f'x {args.calls} calls, API limit {args.api_rate:g}/s (burst {args.api_burst}), '
+          f'client limit {rate:g}/s')
+    run(app, 'no limit, no retry', RateLimiter(rate=0, max_retries=0), args)
+    run(app, 'retry only', RateLimiter(
+        rate=0, max_retries=config['CLI_THROTTLE_MAX_RETRIES'],
+        backoff=backoff, backoff_max=backoff_max,
+    ), args)
+    run(app, 'limit + retry', RateLimiter(
+        rate=rate, burst=config['CLI_RATE_LIMIT_BURST'],
+        max_retries=config['CLI_THROTTLE_MAX_RETRIES'],
+        backoff=backoff, backoff_max=backoff_max,
+    ), args)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,11 @@ class BaseConfig:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     FERNET_KEY = os.environ.get('FERNET_KEY')
+    # Comma-separated previous keys, still accepted for decryption after a rotation
+    FERNET_OLD_KEYS = os.environ.get('FERNET_OLD_KEYS', '')
+    # Decrypted credentials are cached in memory per worker for this long
+    CREDENTIAL_CACHE_SECONDS = int(os.environ.get('CREDENTIAL_CACHE_SECONDS', 300))
+    CREDENTIAL_CACHE_MAX_ENTRIES = int(os.environ.get('CREDENTIAL_CACHE_MAX_ENTRIES', 256))
 
     # Session security (set to True once TLS is configured)
     SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'false').lower() == 'true'
@@ -33,13 +38,94 @@ class BaseConfig:
     LDAP_USER_LOGIN_ATTR = os.environ.get('LDAP_USER_LOGIN_ATTR', 'sAMAccountName')
     LDAP_BIND_USER_DN = os.environ.get('LDAP_BIND_USER_DN', '')
     LDAP_BIND_USER_PASSWORD = os.environ.get('LDAP_BIND_USER_PASSWORD', '')
+    # Per-process pools of search and bind connections; see app.utils.ldap_pool
+    LDAP_POOL_SIZE = int(os.environ.get('LDAP_POOL_SIZE', 5))
+    LDAP_POOL_TIMEOUT = float(os.environ.get('LDAP_POOL_TIMEOUT', 5))
+    LDAP_POOL_IDLE_SECONDS = int(os.environ.get('LDAP_POOL_IDLE_SECONDS', 300))
+    LDAP_CONNECT_TIMEOUT = float(os.environ.get('LDAP_CONNECT_TIMEOUT', 5))
+    LDAP_RECEIVE_TIMEOUT = float(os.environ.get('LDAP_RECEIVE_TIMEOUT', 10))
+    LDAP_LOOKUP_CACHE_SECONDS = int(os.environ.get('LDAP_LOOKUP_CACHE_SECONDS', 60))
+
+    # Login throttling (per username, per worker); see app.utils.login_throttle
+    LOGIN_MAX_FAILURES = int(os.environ.get('LOGIN_MAX_FAILURES', 5))
+    LOGIN_FAILURE_WINDOW_SECONDS = int(os.environ.get('LOGIN_FAILURE_WINDOW_SECONDS', 300))
+    LOGIN_LOCKOUT_SECONDS = int(os.environ.get('LOGIN_LOCKOUT_SECONDS', 900))
+    LOGIN_THROTTLE_MAX_ENTRIES = int(os.environ.get('LOGIN_THROTTLE_MAX_ENTRIES', 10000))
+
+    # Password hash checks run on a bounded pool; see app.utils.password_hashing
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+    # How discovery reaches the providers: 'cli' (aws/az subprocesses) or
+    # 'sdk' (boto3/azure-mgmt in-process; see requirements-sdk.txt)
+    PROVIDER_BACKEND = os.environ.get('PROVIDER_BACKEND', 'cli')
+    SDK_CLIENT_CACHE_SIZE = int(os.environ.get('SDK_CLIENT_CACHE_SIZE', 64))
 
     # CLI paths
     AWS_CLI_PATH = os.environ.get('AWS_CLI_PATH', '/usr/local/bin/aws')
     AZ_CLI_PATH = os.environ.get('AZ_CLI_PATH', '/usr/bin/az')
 
+    # Persistent CLI workers: the Python interpreter each CLI is installed
+    # in (empty = start a new CLI process per command); see app.utils.cli_workers
+    AWS_CLI_PYTHON = os.environ.get('AWS_CLI_PYTHON', '')
+    AZ_CLI_PYTHON = os.environ.get('AZ_CLI_PYTHON', '')
+    CLI_WORKER_MAX = int(os.environ.get('CLI_WORKER_MAX', 4))
+    CLI_WORKER_IDLE_SECONDS = int(os.environ.get('CLI_WORKER_IDLE_SECONDS', 300))
+
+    # CLI calls per second per account, region and service, and retries of
+    # throttled calls with jittered exponential backoff; see app.utils.rate_limit
+    CLI_RATE_LIMIT_PER_SECOND = float(os.environ.get('CLI_RATE_LIMIT_PER_SECOND', 5))
+    CLI_RATE_LIMIT_BURST = int(os.environ.get('CLI_RATE_LIMIT_BURST', 10))
+    CLI_THROTTLE_MAX_RETRIES = int(os.environ.get('CLI_THROTTLE_MAX_RETRIES', 5))
+    CLI_THROTTLE_BACKOFF_SECONDS = float(os.environ.get('CLI_THROTTLE_BACKOFF_SECONDS', 1))
+    CLI_THROTTLE_BACKOFF_MAX_SECONDS = float(os.environ.get('CLI_THROTTLE_BACKOFF_MAX_SECONDS', 30))
+
+    # Azure CLI login sessions are reused per credential set until they expire
+    AZURE_SESSION_TTL_SECONDS = int(os.environ.get('AZURE_SESSION_TTL_SECONDS', 2700))
+    AZURE_SESSION_MAX_ENTRIES = int(os.environ.get('AZURE_SESSION_MAX_ENTRIES', 32))
+
+    # Per-user cache of visible connection IDs, per worker process
+    VISIBILITY_CACHE_SECONDS = int(os.environ.get('VISIBILITY_CACHE_SECONDS', 30))
+
+    # How often each worker checks whether system settings changed elsewhere
+    SETTINGS_VERSION_CHECK_SECONDS = float(os.environ.get('SETTINGS_VERSION_CHECK_SECONDS', 2))
+
+    # Resource list pagination
+    RESOURCE_PAGE_SIZE = int(os.environ.get('RESOURCE_PAGE_SIZE', 50))
+    RESOURCE_PAGE_SIZE_MAX = int(os.environ.get('RESOURCE_PAGE_SIZE_MAX', 500))
+
     # Discovery
     DISCOVERY_TIMEOUT_SECONDS = int(os.environ.get('DISCOVERY_TIMEOUT_SECONDS', 120))
+    DISCOVERY_MAX_WORKERS = int(os.environ.get('DISCOVERY_MAX_WORKERS', 6))
+    DISCOVERY_JOB_WORKERS = int(os.environ.get('DISCOVERY_JOB_WORKERS', 2))
+    DISCOVERY_JOB_HEARTBEAT_SECONDS = int(os.environ.get('DISCOVERY_JOB_HEARTBEAT_SECONDS', 30))
+    DISCOVERY_JOB_STALE_SECONDS = int(os.environ.get('DISCOVERY_JOB_STALE_SECONDS', 120))
+    AWS_REGION_CACHE_SECONDS = int(os.environ.get('AWS_REGION_CACHE_SECONDS', 86400))
+    DISCOVERY_PAGE_SIZE = int(os.environ.get('DISCOVERY_PAGE_SIZE', 1000))
+    DISCOVERY_INSERT_BATCH_SIZE = int(os.environ.get('DISCOVERY_INSERT_BATCH_SIZE', 1000))
+    DISCOVERY_USE_PG_COPY = os.environ.get('DISCOVERY_USE_PG_COPY', 'true').lower() == 'true'
+
+    # Scheduled discovery; see app.cloud.scheduler
+    DISCOVERY_SCHEDULER_ENABLED = os.environ.get('DISCOVERY_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    DISCOVERY_SCHEDULE_MINUTES = int(os.environ.get('DISCOVERY_SCHEDULE_MINUTES', 360))
+    DISCOVERY_SCHEDULE_JITTER_SECONDS = int(os.environ.get('DISCOVERY_SCHEDULE_JITTER_SECONDS', 600))
+    DISCOVERY_SCHEDULE_MAX_CONCURRENT = int(os.environ.get('DISCOVERY_SCHEDULE_MAX_CONCURRENT', 4))
+    DISCOVERY_SCHEDULE_MAX_PER_PROVIDER = int(os.environ.get('DISCOVERY_SCHEDULE_MAX_PER_PROVIDER', 2))
+    DISCOVERY_SCHEDULER_TICK_SECONDS = int(os.environ.get('DISCOVERY_SCHEDULER_TICK_SECONDS', 30))
+    DISCOVERY_SCHEDULER_LEASE_SECONDS = int(os.environ.get('DISCOVERY_SCHEDULER_LEASE_SECONDS', 120))
+
+    # Audit log: 'async' batches routine entries through a background writer,
+    # 'sync' writes every entry in the request. See app.utils.audit.
+    AUDIT_MODE = os.environ.get('AUDIT_MODE', 'async')
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 100))
+    AUDIT_FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS', 1.0))
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+    # Entries older than this are archived (or deleted) by `flask admin
+    # audit-maintain`; 0 keeps everything
+    AUDIT_RETENTION_DAYS = int(os.environ.get('AUDIT_RETENTION_DAYS', 365))
+    AUDIT_ARCHIVE = os.environ.get('AUDIT_ARCHIVE', 'true').lower() == 'true'
+    AUDIT_RETENTION_BATCH_SIZE = int(os.environ.get('AUDIT_RETENTION_BATCH_SIZE', 5000))
 
 
 class DevelopmentConfig(BaseConfig):
@@ -56,4 +142,7 @@ class TestingConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     SESSION_COOKIE_SECURE = False
+    AUDIT_MODE = 'sync'
+    DISCOVERY_SCHEDULER_ENABLED = False
+    CLI_RATE_LIMIT_PER_SECOND = 0
     FERNET_KEY = 'dGVzdC1rZXktZm9yLXRlc3RpbmctMDEyMzQ1Njc4OQ=='
@@ -4,10 +4,28 @@ bind = "127.0.0.1:8000"
 workers = multiprocessing.cpu_count() * 2 + 1
 worker_class = "gthread"
 threads = 4
-timeout = 300
+timeout = 60
 max_requests = 1000
 max_requests_jitter = 50
 accesslog = "/var/log/native-form/gunicorn-access.log"
 errorlog = "/var/log/native-form/gunicorn-error.log"
 loglevel = "info"
 preload_app = True
+
+
+def post_worker_init(worker):
+    # Every worker runs a scheduler thread; only the lease holder acts, but
+    # each one checks the lease (one or two small queries) every tick
+    from app.cloud.scheduler import start_scheduler
+    start_scheduler(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    # Hand the scheduler lease over, fail this worker's unfinished discovery
+    # jobs and write out queued audit entries before a recycled worker exits
+    from app.cloud.jobs import shutdown_discovery_jobs
+    from app.cloud.scheduler import stop_scheduler
+    from app.utils.audit import shutdown_audit_writer
+    stop_scheduler()
+    shutdown_discovery_jobs()
+    shutdown_audit_writer()
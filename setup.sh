@@ -94,6 +94,12 @@ if [ -f "$APP_DIR/deploy/native-form.service" ]; then
     sudo systemctl enable native-form
 fi
 
+if [ -f "$APP_DIR/deploy/native-form-audit.timer" ]; then
+    sudo cp "$APP_DIR/deploy/native-form-audit.service" "$APP_DIR/deploy/native-form-audit.timer" /etc/systemd/system/
+    sudo systemctl daemon-reload
+    sudo systemctl enable native-form-audit.timer
+fi
+
 # Firewall
 sudo firewall-cmd --permanent --add-service=http 2>/dev/null || true
 sudo firewall-cmd --permanent --add-service=https 2>/dev/null || true
@@ -112,6 +118,8 @@ echo "  4. Add SECRET_KEY and FERNET_KEY to $APP_DIR/.env"
 echo "  5. Change the PostgreSQL password in .env"
 echo "  6. Initialize the database:"
 echo "     cd $APP_DIR && sudo -u $APP_USER venv/bin/flask db upgrade"
+echo "     cd $APP_DIR && sudo -u $APP_USER venv/bin/flask cloud init-search"
+echo "     cd $APP_DIR && sudo -u $APP_USER venv/bin/flask admin audit-partition"
 echo "  7. Start the service:"
 echo "     sudo systemctl start native-form"
 echo "  8. Set up TLS certificates for Nginx"
@@ -1,10 +1,20 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
 import pytest
 from cryptography.fernet import Fernet
+from sqlalchemy import event
 
 from app import create_app
 from app.extensions import db as _db
+from app.models.cloud_connection import CloudConnection
+from app.models.user import User
+from app.utils.login_throttle import get_login_throttle
 from config import TestingConfig
 
+TEST_USERNAME = 'testuser'
+TEST_PASSWORD = 'securepassword123'
+
 
 @pytest.fixture(scope='session')
 def app():
@@ -25,9 +35,80 @@ def db(app):
 
 @pytest.fixture
 def client(app, db):
+    # Failed sign-ins from earlier tests must not lock these ones out
+    get_login_throttle(app.config).clear()
     return app.test_client()
 
 
+@pytest.fixture
+def registered_user(client):
+    """Register TEST_USERNAME; as the first user it is also an admin."""
+    client.post('/auth/register', data={
+        'username': TEST_USERNAME,
+        'email': 'test@example.com',
+        'password': TEST_PASSWORD,
+        'password_confirm': TEST_PASSWORD,
+    })
+    return User.query.filter_by(username=TEST_USERNAME).first()
+
+
+@pytest.fixture
+def logged_in_user(client, registered_user):
+    client.post('/auth/login', data={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+    return registered_user
+
+
+@pytest.fixture
+def make_connection(db):
+    """Factory for saved connections with test AWS credentials.
+
+        conn = make_connection('nightly', provider='azure', discovery_interval_minutes=0)
+    """
+    def make(name='test-aws', provider='aws', **columns):
+        conn = CloudConnection(name=name, provider=provider, credentials_encrypted='', **columns)
+        conn.set_credentials({
+            'aws_access_key_id': 'AKIATEST',
+            'aws_secret_access_key': 'secret',
+            'aws_default_region': 'us-east-1',
+        })
+        db.session.add(conn)
+        db.session.commit()
+        return conn
+
+    return make
+
+
+@pytest.fixture
+def aws_connection(make_connection, logged_in_user):
+    """An AWS connection owned by logged_in_user."""
+    return make_connection(user_id=logged_in_user.id)
+
+
 @pytest.fixture
 def runner(app, db):
     return app.test_cli_runner()
+
+
+@pytest.fixture
+def count_queries(db):
+    """Context manager counting the SQL statements executed inside it.
+
+        with count_queries() as queries:
+            client.get('/some/page')
+        assert queries.count == 3
+    """
+    @contextmanager
+    def counting():
+        counter = SimpleNamespace(count=0, statements=[])
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            counter.count += 1
+            counter.statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield counter
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counting
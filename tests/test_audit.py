@@ -0,0 +1,87 @@
+import threading
+
+from app.models.audit_log import AuditLog
+from app.utils import audit
+from app.utils.audit import AuditWriter, flush_audit_log, log_action, shutdown_audit_writer
+
+
+def _entry(action):
+    return {'action': action, 'details': {'n': 1}}
+
+
+def _record_batches(monkeypatch):
+    batches = []
+    written = threading.Event()
+    original = AuditWriter._write
+
+    def write(self, batch):
+        if batch:
+            batches.append([e['action'] for e in batch])
+            written.set()
+        original(self, batch)
+
+    monkeypatch.setattr(AuditWriter, '_write', write)
+    return batches, written
+
+
+def test_writer_batches_by_size(app, db, monkeypatch):
+    batches, _ = _record_batches(monkeypatch)
+    writer = AuditWriter(app, batch_size=3, flush_interval=60)
+    for i in range(7):
+        assert writer.submit(_entry(f'a{i}'))
+    writer.flush(timeout=5)
+    writer.shutdown(timeout=5)
+
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert AuditLog.query.count() == 7
+
+
+def test_writer_flushes_after_interval(app, db, monkeypatch):
+    batches, written = _record_batches(monkeypatch)
+    writer = AuditWriter(app, batch_size=100, flush_interval=0.05)
+    writer.submit(_entry('timed'))
+    assert written.wait(timeout=5)
+    writer.shutdown(timeout=5)
+    assert batches == [['timed']]
+
+
+def test_shutdown_drains_queue(app, db):
+    writer = AuditWriter(app, batch_size=100, flush_interval=60)
+    for i in range(5):
+        writer.submit(_entry(f'drain{i}'))
+    writer.shutdown(timeout=5)
+
+    assert AuditLog.query.count() == 5
+    assert not writer.submit(_entry('late'))
+
+
+def test_log_action_durability(app, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUDIT_MODE', 'async')
+    monkeypatch.setitem(app.config, 'AUDIT_FLUSH_SECONDS', 60)
+    try:
+        with app.test_request_context():
+            log_action('export_csv', details={'count': 1})
+            log_action('login')
+            # Security-critical actions are written immediately
+            assert [e.action for e in AuditLog.query] == ['login']
+
+            flush_audit_log(timeout=5)
+            assert {e.action for e in AuditLog.query} == {'login', 'export_csv'}
+
+            log_action('export_json', sync=True)
+            assert AuditLog.query.filter_by(action='export_json').count() == 1
+    finally:
+        shutdown_audit_writer()
+
+
+def test_full_queue_falls_back_to_sync(app, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUDIT_MODE', 'async')
+
+    class FullWriter:
+        def submit(self, entry):
+            return False
+
+    monkeypatch.setattr(audit, 'get_audit_writer', lambda app: FullWriter())
+    with app.test_request_context():
+        log_action('export_csv')
+    assert AuditLog.query.filter_by(action='export_csv').count() == 1
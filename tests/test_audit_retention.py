@@ -0,0 +1,97 @@
+import re
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.audit_log import AuditLog, AuditLogArchive
+from app.utils import audit_retention
+from app.utils.audit_retention import (
+    AuditPartitioningError, apply_audit_retention, check_audit_partitioning, ensure_audit_partitions,
+)
+
+
+def _add_entries(db, count, days_ago=0, **fields):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for i in range(count):
+        db.session.add(AuditLog(
+            action=fields.get('action', 'test'),
+            user_id=fields.get('user_id'),
+            target_type=fields.get('target_type'),
+            created_at=now - timedelta(days=days_ago, seconds=i),
+        ))
+    db.session.commit()
+
+
+def test_retention_archives_old_entries(app, db):
+    _add_entries(db, 3, days_ago=400, action='old')
+    _add_entries(db, 2, days_ago=1, action='recent')
+
+    result = apply_audit_retention(365, archive=True, batch_size=2)
+    assert result == {'partitions': 0, 'rows': 3}
+    assert {e.action for e in AuditLog.query} == {'recent'}
+    assert AuditLogArchive.query.filter_by(action='old').count() == 3
+
+
+def test_retention_can_delete_or_keep_everything(app, db):
+    _add_entries(db, 3, days_ago=400)
+
+    assert apply_audit_retention(0) == {'partitions': 0, 'rows': 0}
+    assert AuditLog.query.count() == 3
+
+    apply_audit_retention(30, archive=False)
+    assert AuditLog.query.count() == 0
+    assert AuditLogArchive.query.count() == 0
+
+
+def test_partitions_are_postgresql_only(app, db):
+    assert ensure_audit_partitions(db.session.connection()) == []
+
+
+def test_unpartitioned_postgresql_tables_are_refused(monkeypatch):
+    partitioned = {'audit_log'}
+    monkeypatch.setattr(audit_retention, 'is_partitioned', lambda conn, name: name in partitioned)
+    connection = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+
+    check_audit_partitioning(connection, archive=False)
+    with pytest.raises(AuditPartitioningError, match='audit_log_archive not partitioned'):
+        check_audit_partitioning(connection)
+    partitioned.clear()
+    with pytest.raises(AuditPartitioningError, match='audit-partition'):
+        check_audit_partitioning(connection, archive=False)
+
+
+def test_audit_partition_command_is_postgresql_only(app, db, runner):
+    result = runner.invoke(args=['admin', 'audit-partition'])
+    assert 'already partitioned, or the database is not PostgreSQL' in result.output
+
+
+def test_audit_maintain_command(app, db, runner, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUDIT_RETENTION_DAYS', 90)
+    _add_entries(db, 4, days_ago=100)
+
+    result = runner.invoke(args=['admin', 'audit-maintain'])
+    assert 'Archived 0 monthly partitions and 4 entries older than 90 days.' in result.output
+    assert AuditLogArchive.query.count() == 4
+
+
+def test_audit_view_filters_and_pages(client, db, logged_in_user):
+    AuditLog.query.delete()
+    db.session.commit()
+    _add_entries(db, 60, action='export_csv', user_id=logged_in_user.id)
+    _add_entries(db, 5, action='test_connection_failed', target_type='cloud_connection')
+
+    resp = client.get('/admin/audit-log')
+    assert resp.status_code == 200
+    assert resp.data.count(b'<span class="badge bg-secondary">') == 50
+
+    next_cursor = re.search(rb'after=([\w-]+)', resp.data).group(1).decode()
+    resp = client.get(f'/admin/audit-log?after={next_cursor}')
+    assert resp.data.count(b'<span class="badge bg-secondary">') == 15
+
+    resp = client.get('/admin/audit-log?action=test_connection_failed')
+    assert resp.data.count(b'<span class="badge bg-secondary">') == 5
+    resp = client.get(f'/admin/audit-log?user_id={logged_in_user.id}&target_type=cloud_connection')
+    assert resp.data.count(b'<span class="badge bg-secondary">') == 0
+    resp = client.get('/admin/audit-log?target_id=not-a-uuid')
+    assert resp.status_code == 302
@@ -0,0 +1,86 @@
+import os
+import threading
+
+import pytest
+
+from app.utils.azure_sessions import AzureSessionCache
+
+CREDS_A = {'tenant_id': 't', 'client_id': 'a', 'client_secret': 's'}
+CREDS_B = {'tenant_id': 't', 'client_id': 'b', 'client_secret': 's'}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_session_reused_until_ttl():
+    clock = FakeClock()
+    cache = AzureSessionCache(ttl=100, max_entries=4, clock=clock)
+    logins = []
+
+    with cache.session(CREDS_A, logins.append) as first:
+        pass
+    with cache.session(CREDS_A, logins.append) as second:
+        pass
+    assert first == second
+    assert logins == [first]
+
+    clock.now = 100
+    with cache.session(CREDS_A, logins.append) as third:
+        pass
+    assert third != first
+    assert not os.path.exists(first)
+    assert len(logins) == 2
+    cache.clear()
+    assert not os.path.exists(third)
+
+
+def test_lru_eviction_removes_directory():
+    cache = AzureSessionCache(ttl=100, max_entries=1)
+    with cache.session(CREDS_A, lambda d: None) as dir_a:
+        pass
+    with cache.session(CREDS_B, lambda d: None) as dir_b:
+        assert not os.path.exists(dir_a)
+    assert len(cache) == 1
+    cache.clear()
+    assert not os.path.exists(dir_b)
+
+
+def test_concurrent_callers_share_one_login():
+    cache = AzureSessionCache(ttl=100, max_entries=4)
+    logins = []
+    started = threading.Event()
+
+    def slow_login(config_dir):
+        started.set()
+        logins.append(config_dir)
+        threading.Event().wait(0.1)
+
+    def worker():
+        with cache.session(CREDS_A, slow_login):
+            pass
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(logins) == 1
+    cache.clear()
+
+
+def test_failed_login_is_not_cached():
+    cache = AzureSessionCache(ttl=100, max_entries=4)
+
+    def bad_login(config_dir):
+        raise RuntimeError('AADSTS7000215: Invalid client secret')
+
+    with pytest.raises(RuntimeError):
+        with cache.session(CREDS_A, bad_login):
+            pass
+    assert len(cache) == 0
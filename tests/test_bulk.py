@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime
+
+from app.extensions import db as _db
+from app.models.cached_resource import CachedResource
+from app.models.cloud_connection import CloudConnection
+from app.utils.bulk import bulk_insert, _copy_value, _with_defaults
+
+
+def test_bulk_insert_batches_and_applies_defaults(db):
+    conn = CloudConnection(name='bulk', provider='aws', credentials_encrypted='')
+    db.session.add(conn)
+    db.session.commit()
+
+    rows = ({
+        'connection_id': conn.id,
+        'resource_type': 'vpc',
+        'resource_id': f'vpc-{i}',
+        'raw_data': {'i': i},
+    } for i in range(2500))
+
+    assert bulk_insert(CachedResource.__table__, rows, batch_size=1000) == 2500
+    db.session.commit()
+
+    assert CachedResource.query.count() == 2500
+    sample = CachedResource.query.filter_by(resource_id='vpc-42').one()
+    assert sample.raw_data == {'i': 42}
+    assert sample.discovered_at is not None
+
+
+def test_copy_encoding(db):
+    row = _with_defaults(CachedResource.__table__, {'resource_id': 'x'})
+    assert isinstance(row['id'], uuid.UUID)
+    assert isinstance(row['discovered_at'], datetime)
+
+    assert _copy_value(None, _db.String()) == r'\N'
+    assert _copy_value('a\tb\nc\\d', _db.String()) == 'a\\tb\\nc\\\\d'
+    assert _copy_value({'k': 'v\n'}, _db.JSON()) == '{"k": "v\\\\n"}'
+    assert _copy_value(True, _db.Boolean()) == 't'
+
+
+def test_copy_encodes_json_none_like_executemany(db):
+    assert _copy_value(None, _db.JSON()) == 'null'
+    assert _copy_value(None, _db.JSON(none_as_null=True)) == r'\N'
+
+    conn = CloudConnection(name='bulk', provider='aws', credentials_encrypted='')
+    db.session.add(conn)
+    db.session.commit()
+    bulk_insert(CachedResource.__table__, [{
+        'connection_id': conn.id, 'resource_type': 'vpc', 'resource_id': 'vpc-1', 'raw_data': None,
+    }])
+    raw = db.session.execute(_db.select(CachedResource.__table__.c.raw_data.is_(None))).scalar()
+    assert raw is False
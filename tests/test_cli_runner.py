@@ -0,0 +1,90 @@
+import io
+import json
+import sys
+
+import pytest
+
+from app.utils import cli_runner
+from app.utils.cli_runner import CLIError, iter_json_array, _execute_stream
+
+CREDS = {
+    'aws_access_key_id': 'AKIATEST',
+    'aws_secret_access_key': 'secret',
+    'aws_default_region': 'us-east-1',
+}
+
+
+def test_iter_json_array_small_reads():
+    items = [{'id': i, 'tags': {'n': str(i) * 50}} for i in range(20)] + [12345, 'x']
+    stream = io.StringIO(json.dumps(items))
+    assert list(iter_json_array(stream, read_size=7)) == items
+
+
+def test_iter_json_array_skips_empty_chunks():
+    reader = cli_runner._ChunkReader(iter(['[{"a": 1}', '', '', ', {"b": 2}]']))
+    assert list(iter_json_array(reader)) == [{'a': 1}, {'b': 2}]
+
+
+def test_iter_json_array_empty_and_non_array():
+    assert list(iter_json_array(io.StringIO(''))) == []
+    assert list(iter_json_array(io.StringIO('[ ]'))) == []
+    assert list(iter_json_array(io.StringIO('{"a": 1}'))) == []
+
+
+def test_iter_aws_pages_follows_tokens(app, monkeypatch):
+    calls = []
+    pages = [
+        {'Users': [{'UserName': 'a'}], 'NextToken': 't1'},
+        {'Users': [{'UserName': 'b'}], 'NextToken': 't2'},
+        {'Users': [{'UserName': 'c'}]},
+    ]
+
+    def fake_execute(cmd, env, timeout):
+        calls.append(cmd)
+        return pages[len(calls) - 1]
+
+    monkeypatch.setattr(cli_runner, '_execute', fake_execute)
+    with app.app_context():
+        result = list(cli_runner.iter_aws_pages(['iam', 'list-users'], CREDS, page_size=1))
+
+    assert [p['Users'][0]['UserName'] for p in result] == ['a', 'b', 'c']
+    assert '--starting-token' not in calls[0]
+    assert calls[1][-2:] == ['--starting-token', 't1']
+    assert calls[2][-2:] == ['--starting-token', 't2']
+    assert calls[0][calls[0].index('--max-items') + 1] == '1'
+
+
+def test_s3_buckets_are_listed_without_paging(app, monkeypatch):
+    from app.cloud.aws_service import discover_s3_buckets
+    calls = []
+
+    def fake_execute(cmd, env, timeout):
+        calls.append(cmd)
+        return {'Buckets': [{'Name': 'logs'}, {'Name': 'assets', 'BucketRegion': 'eu-west-1'}]}
+
+    monkeypatch.setattr(cli_runner, '_execute', fake_execute)
+    with app.app_context():
+        buckets = list(discover_s3_buckets(CREDS))
+
+    assert [(b['resource_id'], b['region']) for b in buckets] == [('logs', 'global'), ('assets', 'eu-west-1')]
+    assert len(calls) == 1
+    assert calls[0][1:3] == ['s3api', 'list-buckets']
+    assert '--max-items' not in calls[0]
+
+
+def test_execute_stream_yields_items():
+    script = 'import json; print(json.dumps([{"name": "vm%d" % i} for i in range(3)]))'
+    items = list(_execute_stream([sys.executable, '-c', script], None, timeout=30))
+    assert items == [{'name': 'vm0'}, {'name': 'vm1'}, {'name': 'vm2'}]
+
+
+def test_execute_stream_reports_failure():
+    script = 'import sys; sys.stderr.write("AuthorizationFailed"); sys.exit(1)'
+    with pytest.raises(CLIError, match='AuthorizationFailed'):
+        list(_execute_stream([sys.executable, '-c', script], None, timeout=30))
+
+
+def test_execute_stream_times_out():
+    script = 'import sys, time; sys.stdout.write("["); sys.stdout.flush(); time.sleep(10)'
+    with pytest.raises(CLIError, match='timed out'):
+        list(_execute_stream([sys.executable, '-c', script], None, timeout=0.5))
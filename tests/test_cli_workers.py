@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+import textwrap
+
+import pytest
+
+from app.utils import cli_runner
+from app.utils.cli_workers import CLIWorkerDied, CLIWorkerPool, CLIWorkerTimeout
+
+FAKE_CLI = textwrap.dedent('''
+    import json, os, sys, time
+
+    def main(args):
+        cmd = args[0]
+        if cmd == 'whoami':
+            print(json.dumps({'pid': os.getpid(), 'key': os.environ.get('AWS_ACCESS_KEY_ID')}))
+        elif cmd == 'list':
+            print(json.dumps([{'n': i} for i in range(int(args[1]))]))
+        elif cmd == 'fail':
+            sys.stderr.write('AccessDenied')
+            return 254
+        elif cmd == 'sleep':
+            time.sleep(float(args[1]))
+        elif cmd == 'crash-once':
+            if not os.path.exists(args[1]):
+                open(args[1], 'w').close()
+                os._exit(3)
+            print('{}')
+        elif cmd == 'crash':
+            os._exit(3)
+        return 0
+''')
+
+
+@pytest.fixture
+def env(tmp_path):
+    (tmp_path / 'fakecli.py').write_text(FAKE_CLI)
+    return {**os.environ, 'PYTHONPATH': str(tmp_path)}
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(driver='fakecli:main', **kwargs):
+        pool = CLIWorkerPool({'aws': (sys.executable, driver)}, **kwargs)
+        pools.append(pool)
+        return pool
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def _run(pool, args, env, timeout=30):
+    call = pool.call('aws', args, env, timeout)
+    out = ''.join(call)
+    return call.returncode, out, call.stderr
+
+
+def test_worker_is_reused_with_per_call_env(make_pool, env):
+    pool = make_pool()
+    _, first, _ = _run(pool, ['whoami'], {**env, 'AWS_ACCESS_KEY_ID': 'AKIA1'})
+    _, second, _ = _run(pool, ['whoami'], env)
+
+    assert json.loads(first)['key'] == 'AKIA1'
+    # Credentials from the previous command don't leak into the next
+    assert json.loads(second) == {'pid': json.loads(first)['pid'], 'key': None}
+    assert pool.started == 1
+    assert pool.reused == 1
+
+
+def test_worker_reports_failures(make_pool, env):
+    pool = make_pool()
+    assert _run(pool, ['fail'], env) == (254, '', 'AccessDenied')
+    assert _run(pool, ['list', '2'], env)[0] == 0
+    assert pool.started == 1
+
+
+def test_timed_out_worker_is_killed(make_pool, env):
+    pool = make_pool()
+    with pytest.raises(CLIWorkerTimeout):
+        _run(pool, ['sleep', '10'], env, timeout=0.5)
+    assert len(pool) == 0
+    assert _run(pool, ['list', '1'], env)[0] == 0
+    assert pool.started == 2
+
+
+def test_crashed_worker_is_restarted(make_pool, env, tmp_path):
+    pool = make_pool()
+    # Dies before producing output, so the command is retried on a new worker
+    assert _run(pool, ['crash-once', str(tmp_path / 'marker')], env) == (0, '{}\n', '')
+    assert pool.started == 2
+
+    with pytest.raises(CLIWorkerDied):
+        _run(pool, ['crash'], env)
+    assert len(pool) == 0
+
+
+def test_idle_workers_are_stopped(make_pool, env):
+    now = [0.0]
+    pool = make_pool(idle_seconds=60, clock=lambda: now[0])
+    _run(pool, ['list', '1'], env)
+    worker = pool._idle[0]
+
+    now[0] = 61
+    pool.reap()
+    assert len(pool) == 0
+    assert worker.proc.poll() is not None
+
+
+def test_busy_pool_falls_back_to_subprocess(make_pool, env):
+    pool = make_pool(max_workers=1)
+    held = pool.call('aws', ['list', '1'], env, 30)
+    assert pool.call('aws', ['list', '1'], env, 30) is None
+    assert pool.fallbacks == 1
+    ''.join(held)
+    assert pool.call('aws', ['list', '1'], env, 30) is not None
+
+
+def test_broken_driver_falls_back(make_pool, env):
+    pool = make_pool(driver='no_such_module:main')
+    assert pool.call('aws', ['list', '1'], env, 30) is None
+    assert len(pool) == 0
+
+
+def test_cli_runner_uses_workers(app, monkeypatch, make_pool, env):
+    pool = make_pool()
+    monkeypatch.setattr(cli_runner, 'get_worker_pool', lambda config: pool)
+    aws = app.config['AWS_CLI_PATH']
+
+    with app.app_context():
+        assert cli_runner._execute([aws, 'whoami'], env, 30)['pid'] != os.getpid()
+        items = list(cli_runner._execute_stream([aws, 'list', '3'], env, 30))
+        with pytest.raises(cli_runner.CLIError, match='AccessDenied'):
+            cli_runner._execute([aws, 'fail'], env, 30)
+
+    assert items == [{'n': 0}, {'n': 1}, {'n': 2}]
+    assert pool.started == 1
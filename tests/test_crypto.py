@@ -1,4 +1,7 @@
-from app.utils.crypto import encrypt_credentials, decrypt_credentials, encrypt_value, decrypt_value
+from app.utils.crypto import (
+    SecretCache, decrypt_credentials, decrypt_value, encrypt_credentials, encrypt_value,
+    generate_fernet_key, get_fernet,
+)
 
 
 def test_encrypt_decrypt_credentials(app):
@@ -22,3 +25,77 @@ def test_encrypt_decrypt_value(app):
         assert encrypted != original
         decrypted = decrypt_value(encrypted)
         assert decrypted == original
+
+
+def test_cipher_is_built_once(app):
+    with app.app_context():
+        assert get_fernet() is get_fernet()
+
+
+def test_old_keys_still_decrypt(app, monkeypatch):
+    with app.app_context():
+        encrypted = encrypt_value('before-rotation')
+        old_key = app.config['FERNET_KEY']
+        monkeypatch.setitem(app.config, 'FERNET_KEY', generate_fernet_key())
+        monkeypatch.setitem(app.config, 'FERNET_OLD_KEYS', old_key)
+
+        assert decrypt_value(encrypted) == 'before-rotation'
+        rotated = encrypt_value('after-rotation')
+        monkeypatch.setitem(app.config, 'FERNET_OLD_KEYS', '')
+        assert decrypt_value(rotated) == 'after-rotation'
+
+
+def test_secret_cache_reuses_and_refreshes():
+    now = [0.0]
+    cache = SecretCache(ttl=60, max_entries=2, clock=lambda: now[0])
+    calls = []
+
+    def decrypt(value):
+        def inner():
+            calls.append(value)
+            return value.upper()
+        return inner
+
+    assert cache.get('a', 'one', decrypt('one')) == 'ONE'
+    assert cache.get('a', 'one', decrypt('one')) == 'ONE'
+    assert calls == ['one']
+
+    # A new ciphertext for the same owner is never served from the cache
+    assert cache.get('a', 'two', decrypt('two')) == 'TWO'
+    now[0] = 61
+    cache.get('a', 'two', decrypt('two'))
+    assert calls == ['one', 'two', 'two']
+
+    cache.get('b', 'x', decrypt('x'))
+    cache.get('c', 'y', decrypt('y'))
+    assert len(cache) == 2
+    cache.invalidate('c')
+    assert len(cache) == 1
+
+
+def test_connection_credentials_are_cached(app, db, monkeypatch):
+    from app.models.cloud_connection import CloudConnection
+    from app.utils import crypto
+
+    conn = CloudConnection(name='cached', provider='aws', credentials_encrypted='')
+    db.session.add(conn)
+    db.session.flush()
+    conn.set_credentials({'aws_access_key_id': 'AKIA1'})
+
+    decrypts = []
+    original = crypto.MultiFernet.decrypt
+
+    def counting_decrypt(self, token):
+        decrypts.append(token)
+        return original(self, token)
+
+    monkeypatch.setattr(crypto.MultiFernet, 'decrypt', counting_decrypt)
+
+    creds = conn.get_credentials()
+    creds['aws_access_key_id'] = 'tampered'
+    assert conn.get_credentials() == {'aws_access_key_id': 'AKIA1'}
+    assert len(decrypts) == 1
+
+    conn.set_credentials({'aws_access_key_id': 'AKIA2'})
+    assert conn.get_credentials() == {'aws_access_key_id': 'AKIA2'}
+    assert len(decrypts) == 2
@@ -0,0 +1,226 @@
+import threading
+import time
+
+import pytest
+
+from app.cloud import discovery
+from app.models.cached_resource import CachedResource
+from app.utils.cli_runner import CLIError
+
+
+def _fake_discover(resource_type, count=1, delay=0):
+    def discover(credentials):
+        time.sleep(delay)
+        return [{
+            'resource_type': resource_type,
+            'resource_id': f"{resource_type}-{credentials['aws_default_region']}-{i}",
+            'resource_name': f'{resource_type} {i}',
+            'region': credentials['aws_default_region'],
+            'raw_data': {'n': i},
+        } for i in range(count)]
+    discover.__name__ = f'discover_{resource_type}'
+    return discover
+
+
+def test_run_discovery_runs_functions_concurrently(app, make_connection, monkeypatch):
+    functions = [_fake_discover(f'type{i}', count=2, delay=0.2) for i in range(4)]
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', functions)
+    monkeypatch.setitem(app.config, 'DISCOVERY_MAX_WORKERS', 4)
+    conn = make_connection()
+
+    start = time.monotonic()
+    stats = discovery.run_discovery(conn)
+    elapsed = time.monotonic() - start
+
+    assert stats['total'] == 8
+    assert CachedResource.query.filter_by(connection_id=conn.id).count() == 8
+    assert elapsed < 0.6
+
+
+def test_run_discovery_respects_max_workers(app, make_connection, monkeypatch):
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def make(i):
+        def discover(credentials):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+            return []
+        discover.__name__ = f'discover_{i}'
+        return discover
+
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', [make(i) for i in range(6)])
+    monkeypatch.setitem(app.config, 'DISCOVERY_MAX_WORKERS', 2)
+    conn = make_connection()
+
+    discovery.run_discovery(conn)
+    assert peak <= 2
+
+
+def test_run_discovery_collects_errors(app, make_connection, monkeypatch):
+    def failing(credentials):
+        raise CLIError('aws', 255, 'AccessDenied')
+
+    monkeypatch.setattr(
+        'app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS',
+        [failing, _fake_discover('vpc', count=3)],
+    )
+    conn = make_connection()
+
+    assert discovery.run_discovery(conn)['total'] == 3
+
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', [failing])
+    with pytest.raises(RuntimeError, match='failing: CLI command failed'):
+        discovery.run_discovery(conn)
+
+
+def test_aws_regional_functions_fan_out(app, make_connection, monkeypatch):
+    from app.cloud import aws_service
+
+    def discover_global(credentials):
+        return [{'resource_type': 'iam_user', 'resource_id': 'u', 'region': 'global', 'raw_data': {}}]
+
+    regional = _fake_discover('vpc')
+    monkeypatch.setattr(aws_service, 'AWS_DISCOVERY_FUNCTIONS', [regional, discover_global])
+    monkeypatch.setattr(aws_service, 'AWS_GLOBAL_DISCOVERY_FUNCTIONS', {discover_global})
+    conn = make_connection()
+    conn.set_discovery_regions('us-east-1, eu-west-1, ap-southeast-2')
+
+    planned = []
+    assert discovery.run_discovery(conn, on_plan=planned.extend)['total'] == 4
+    assert planned == [
+        'discover_vpc[us-east-1]', 'discover_vpc[eu-west-1]',
+        'discover_vpc[ap-southeast-2]', 'discover_global',
+    ]
+    regions = {r.region for r in CachedResource.query.filter_by(resource_type='vpc')}
+    assert regions == {'us-east-1', 'eu-west-1', 'ap-southeast-2'}
+
+
+def test_all_regions_uses_cached_enabled_regions(app, make_connection, monkeypatch):
+    from app.cloud import aws_service
+    from app.utils import cli_runner
+
+    calls = []
+
+    def fake_run(args, credentials, timeout=None):
+        calls.append(args)
+        return {'Regions': [{'RegionName': 'us-west-2'}, {'RegionName': 'eu-north-1'}]}
+
+    monkeypatch.setattr(cli_runner, 'run_aws_command', fake_run)
+    monkeypatch.setattr(aws_service, '_enabled_regions_cache', {})
+    conn = make_connection()
+    conn.set_discovery_regions('all')
+    creds = conn.get_credentials()
+
+    assert aws_service.get_discovery_regions(conn, creds) == ['eu-north-1', 'us-west-2']
+    assert aws_service.get_discovery_regions(conn, creds) == ['eu-north-1', 'us-west-2']
+    assert calls == [['ec2', 'describe-regions']]
+
+
+def test_rediscovery_upserts_in_place(app, make_connection, monkeypatch):
+    state = {'vpc-1': {'cidr': '10.0.0.0/16'}, 'vpc-2': {'cidr': '10.1.0.0/16'}}
+
+    @discovery.discovers('vpc')
+    def discover_vpcs(credentials):
+        return [{
+            'resource_type': 'vpc', 'resource_id': rid, 'resource_name': rid,
+            'region': 'us-east-1', 'raw_data': raw,
+        } for rid, raw in state.items()]
+
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', [discover_vpcs])
+    conn = make_connection()
+
+    assert discovery.run_discovery(conn) == {'total': 2, 'added': 2, 'changed': 0, 'removed': 0}
+    ids = {r.resource_id: r.id for r in CachedResource.query}
+
+    state['vpc-2'] = {'cidr': '10.2.0.0/16'}
+    del state['vpc-1']
+    state['vpc-3'] = {'cidr': '10.3.0.0/16'}
+    assert discovery.run_discovery(conn) == {'total': 2, 'added': 1, 'changed': 1, 'removed': 1}
+
+    rows = {r.resource_id: r for r in CachedResource.query}
+    assert set(rows) == {'vpc-2', 'vpc-3'}
+    assert rows['vpc-2'].id == ids['vpc-2']
+    assert rows['vpc-2'].raw_data == {'cidr': '10.2.0.0/16'}
+
+
+def test_failed_service_keeps_previous_resources(app, make_connection, monkeypatch):
+    fail = {'on': False}
+
+    @discovery.discovers('lambda_function')
+    def discover_lambdas(credentials):
+        if fail['on']:
+            raise CLIError('aws', 255, 'Throttling')
+        return [{'resource_type': 'lambda_function', 'resource_id': 'fn-1', 'raw_data': {}}]
+
+    monkeypatch.setattr(
+        'app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS',
+        [discover_lambdas, _fake_discover('vpc')],
+    )
+    conn = make_connection()
+    discovery.run_discovery(conn)
+
+    fail['on'] = True
+    stats = discovery.run_discovery(conn)
+    assert stats['removed'] == 0
+    assert CachedResource.query.filter_by(resource_type='lambda_function').count() == 1
+
+
+def test_selective_discovery_replaces_only_its_types(app, make_connection, monkeypatch):
+    from app.cloud import aws_service
+    from app.models.resource_stat import ResourceStat
+
+    state = {'vpc': ['vpc-1', 'vpc-2'], 'lambda_function': ['fn-1']}
+    calls = []
+
+    def make(resource_type):
+        @discovery.discovers(resource_type)
+        def discover(credentials):
+            calls.append(resource_type)
+            return [{'resource_type': resource_type, 'resource_id': rid, 'region': 'us-east-1',
+                     'raw_data': {}} for rid in state[resource_type]]
+        discover.__name__ = f'discover_{resource_type}'
+        return discover
+
+    monkeypatch.setattr(aws_service, 'AWS_DISCOVERY_FUNCTIONS', [make('vpc'), make('lambda_function')])
+    conn = make_connection()
+    discovery.run_discovery(conn)
+
+    state['vpc'] = []
+    state['lambda_function'] = ['fn-2']
+    calls.clear()
+    stats = discovery.run_discovery(conn, resource_types={'lambda_function'})
+
+    assert calls == ['lambda_function']
+    assert stats == {'total': 1, 'added': 1, 'changed': 0, 'removed': 1}
+    assert sorted(r.resource_id for r in CachedResource.query) == ['fn-2', 'vpc-1', 'vpc-2']
+    counts = {s.resource_type: s.count for s in ResourceStat.query.filter_by(connection_id=conn.id)}
+    assert counts == {'vpc': 2, 'lambda_function': 1}
+
+
+def test_global_only_discovery_skips_region_lookup(app, make_connection, monkeypatch):
+    from app.cloud import aws_service
+
+    @discovery.discovers('s3_bucket')
+    def discover_buckets(credentials):
+        return [{'resource_type': 's3_bucket', 'resource_id': 'b', 'region': 'global', 'raw_data': {}}]
+
+    def no_lookup(connection, credentials):
+        raise AssertionError('regions looked up for a global-only refresh')
+
+    monkeypatch.setattr(aws_service, 'AWS_DISCOVERY_FUNCTIONS', [_fake_discover('vpc'), discover_buckets])
+    monkeypatch.setattr(aws_service, 'AWS_GLOBAL_DISCOVERY_FUNCTIONS', {discover_buckets})
+    monkeypatch.setattr(aws_service, 'get_discovery_regions', no_lookup)
+    conn = make_connection()
+
+    planned = []
+    discovery.run_discovery(conn, resource_types=['s3_bucket'], on_plan=planned.extend)
+    assert planned == ['discover_buckets']
+    with pytest.raises(ValueError):
+        discovery.run_discovery(conn, resource_types=['azure_vm'])
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+
+from app.export import routes as export_routes
+from app.models.audit_log import AuditLog
+from app.models.cached_resource import CachedResource
+from app.models.cloud_connection import CloudConnection
+
+
+def _seed(db, user, count):
+    conn = CloudConnection(name='export-aws', provider='aws', user_id=user.id, credentials_encrypted='')
+    other = CloudConnection(name='other-aws', provider='aws', user_id=None, credentials_encrypted='')
+    db.session.add_all([conn, other])
+    db.session.flush()
+    for i in range(count):
+        db.session.add(CachedResource(
+            connection_id=conn.id,
+            resource_type='ec2_instance',
+            resource_id=f'i-{i:04d}',
+            resource_name=f'name-{i}',
+            region='us-east-1',
+            raw_data={'InstanceId': f'i-{i:04d}', 'Tags': []},
+        ))
+    # Not visible: owned by nobody and not a default connection
+    db.session.add(CachedResource(
+        connection_id=other.id, resource_type='vpc', resource_id='vpc-hidden', raw_data={},
+    ))
+    db.session.commit()
+    return conn
+
+
+def test_csv_export_streams_all_rows(client, db, monkeypatch, logged_in_user):
+    monkeypatch.setattr(export_routes, 'EXPORT_CHUNK_SIZE', 256)
+    _seed(db, logged_in_user, 40)
+
+    resp = client.get('/export/csv')
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    assert resp.headers['X-Accel-Buffering'] == 'no'
+
+    rows = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+    assert rows[0] == export_routes.CSV_HEADER
+    assert sorted(r[1] for r in rows[1:]) == [f'i-{i:04d}' for i in range(40)]
+    assert rows[1][4:6] == ['export-aws', 'aws']
+
+    entry = AuditLog.query.filter_by(action='export_csv').one()
+    assert entry.details == {'count': 40}
+
+
+def test_json_export_matches_json_dumps_layout(client, db, monkeypatch, logged_in_user):
+    monkeypatch.setattr(export_routes, 'EXPORT_CHUNK_SIZE', 256)
+    conn = _seed(db, logged_in_user, 5)
+
+    resp = client.get(f'/export/json?connection_id={conn.id}')
+    assert resp.status_code == 200
+    body = resp.get_data(as_text=True)
+    data = json.loads(body)
+    assert body == json.dumps(data, indent=2)
+    assert sorted(d['resource_id'] for d in data) == [f'i-{i:04d}' for i in range(5)]
+    assert data[0]['connection'] == 'export-aws'
+
+    resp = client.get('/export/json?resource_type=nothing')
+    assert resp.get_data(as_text=True) == '[]'
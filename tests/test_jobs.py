@@ -0,0 +1,202 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from app.cloud import jobs
+from app.models.audit_log import AuditLog
+from app.models.discovery_job import DiscoveryJob
+
+
+class _InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def _discover_vpcs(credentials):
+    return [{
+        'resource_type': 'vpc',
+        'resource_id': 'vpc-1',
+        'resource_name': 'main',
+        'region': 'us-east-1',
+        'raw_data': {},
+    }]
+
+
+def test_discover_returns_job_and_status(client, db, monkeypatch, logged_in_user, aws_connection):
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', [_discover_vpcs])
+    monkeypatch.setattr(jobs, '_get_executor', lambda app: _InlineExecutor())
+
+    resp = client.post('/cloud/resources/discover', json={'connection_id': str(aws_connection.id)})
+    assert resp.status_code == 202
+    job_id = resp.get_json()['job_id']
+
+    resp = client.get(f'/cloud/jobs/{job_id}')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['status'] == 'succeeded'
+    assert data['resources_found'] == 1
+    assert data['progress'] == {'_discover_vpcs': 'succeeded'}
+    assert AuditLog.query.filter_by(action='discover_resources', user_id=logged_in_user.id).count() == 1
+
+
+def test_discover_reuses_active_job(client, db, monkeypatch, aws_connection):
+    submitted = []
+
+    class _RecordingExecutor:
+        def submit(self, fn, *args):
+            submitted.append(args)
+
+    monkeypatch.setattr(jobs, '_get_executor', lambda app: _RecordingExecutor())
+
+    first = client.post('/cloud/resources/discover', json={'connection_id': str(aws_connection.id)})
+    second = client.post('/cloud/resources/discover', json={'connection_id': str(aws_connection.id)})
+
+    assert first.get_json()['job_id'] == second.get_json()['job_id']
+    assert len(submitted) == 1
+    assert DiscoveryJob.query.count() == 1
+
+
+def test_failed_job_records_errors(client, db, monkeypatch, aws_connection):
+    from app.utils.cli_runner import CLIError
+
+    def discover_broken(credentials):
+        raise CLIError('aws', 255, 'AccessDenied')
+
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', [discover_broken])
+    monkeypatch.setattr(jobs, '_get_executor', lambda app: _InlineExecutor())
+
+    resp = client.post('/cloud/resources/discover', json={'connection_id': str(aws_connection.id)})
+    data = client.get(resp.get_json()['job_url']).get_json()
+
+    assert data['status'] == 'failed'
+    assert data['progress'] == {'discover_broken': 'failed'}
+    assert any('AccessDenied' in e for e in data['errors'])
+
+
+def test_discover_selected_types(client, db, monkeypatch, aws_connection):
+    submitted = []
+
+    class _RecordingExecutor:
+        def submit(self, fn, *args):
+            submitted.append(args)
+
+    monkeypatch.setattr(jobs, '_get_executor', lambda app: _RecordingExecutor())
+
+    def discover(resource_types):
+        return client.post('/cloud/resources/discover', json={
+            'connection_id': str(aws_connection.id), 'resource_types': resource_types,
+        })
+
+    resp = discover(['azure_vm'])
+    assert resp.status_code == 400
+    assert 'azure_vm' in resp.get_json()['message']
+
+    lambdas = discover(['lambda_function']).get_json()['job_id']
+    # Disjoint types get their own job; a request an active job covers shares it
+    vpcs = discover(['vpc']).get_json()['job_id']
+    assert vpcs != lambdas
+    assert discover(['lambda_function']).get_json()['job_id'] == lambdas
+    # Overlapping but not covered: a new job, queued behind the others
+    everything = discover(None).get_json()['job_id']
+    assert everything not in (lambdas, vpcs)
+    assert discover(['lambda_function', 'vpc']).get_json()['job_id'] == everything
+    assert len(submitted) == 3
+    assert client.get(f'/cloud/jobs/{everything}').get_json()['resource_types'] is None
+
+    job = client.get(f'/cloud/jobs/{lambdas}').get_json()
+    assert job['resource_types'] == ['lambda_function']
+
+
+def test_resources_page_offers_type_refresh(client, db, aws_connection):
+    page = client.get('/cloud/resources?resource_type=lambda_function').get_data(as_text=True)
+    assert f'data-conn-id="{aws_connection.id}" data-resource-type="lambda_function"' in page
+    page = client.get('/cloud/resources?resource_type=azure_vm').get_data(as_text=True)
+    assert 'data-resource-type' not in page
+
+
+def test_job_waits_for_overlapping_jobs(app, db, monkeypatch, aws_connection):
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', [_discover_vpcs])
+    requeued = []
+    monkeypatch.setattr(jobs, '_requeue', lambda app, job_id: requeued.append(job_id))
+
+    older = DiscoveryJob(connection_id=aws_connection.id, resource_types=['vpc'], progress={}, errors=[])
+    disjoint = DiscoveryJob(connection_id=aws_connection.id, resource_types=['s3_bucket'],
+                            progress={}, errors=[])
+    db.session.add_all([older, disjoint])
+    db.session.commit()
+    job = DiscoveryJob(connection_id=aws_connection.id, resource_types=None, progress={}, errors=[])
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    def finish(other):
+        other.status = DiscoveryJob.STATUS_SUCCEEDED
+        db.session.commit()
+
+    # Put back on the queue, without holding a pool thread, while any older job overlaps
+    jobs._run_job(app, job_id)
+    finish(older)
+    jobs._run_job(app, job_id)
+    assert requeued == [job_id, job_id]
+    assert db.session.get(DiscoveryJob, job_id).status == DiscoveryJob.STATUS_QUEUED
+
+    finish(disjoint)
+    jobs._run_job(app, job_id)
+    assert len(requeued) == 2
+    assert db.session.get(DiscoveryJob, job_id).status == DiscoveryJob.STATUS_SUCCEEDED
+
+    # Jobs for other types, and jobs whose process died, do not block
+    stale = datetime.now(timezone.utc) - timedelta(seconds=app.config['DISCOVERY_JOB_STALE_SECONDS'] + 1)
+    orphan = DiscoveryJob(connection_id=aws_connection.id, progress={}, errors=[], heartbeat_at=stale)
+    lambdas = DiscoveryJob(connection_id=aws_connection.id, resource_types=['lambda_function'],
+                           progress={}, errors=[])
+    db.session.add_all([orphan, lambdas])
+    db.session.commit()
+    narrow = DiscoveryJob(connection_id=aws_connection.id, resource_types=['vpc'],
+                          progress={}, errors=[])
+    db.session.add(narrow)
+    db.session.commit()
+    assert jobs._blocking_jobs(narrow) == []
+
+
+def test_orphaned_job_is_failed_instead_of_reused(app, client, db, monkeypatch, aws_connection):
+    submitted = []
+
+    class _RecordingExecutor:
+        def submit(self, fn, *args):
+            submitted.append(args)
+
+    monkeypatch.setattr(jobs, '_get_executor', lambda app: _RecordingExecutor())
+    stale = datetime.now(timezone.utc) - timedelta(seconds=app.config['DISCOVERY_JOB_STALE_SECONDS'] + 1)
+    orphan = DiscoveryJob(connection_id=aws_connection.id, progress={}, errors=[],
+                          owner='old-host:1', heartbeat_at=stale)
+    db.session.add(orphan)
+    db.session.commit()
+
+    resp = client.post('/cloud/resources/discover', json={'connection_id': str(aws_connection.id)})
+    assert resp.get_json()['job_id'] != str(orphan.id)
+    assert len(submitted) == 1
+    data = client.get(f'/cloud/jobs/{orphan.id}').get_json()
+    assert data['status'] == 'failed'
+    assert data['errors'] == ['The worker process running this job stopped']
+
+
+def test_shutdown_fails_this_process_jobs(app, db, monkeypatch, aws_connection):
+    ours = DiscoveryJob(connection_id=aws_connection.id, progress={}, errors=[],
+                        owner=jobs.job_owner())
+    theirs = DiscoveryJob(connection_id=aws_connection.id, resource_types=['vpc'],
+                          progress={}, errors=[], owner='other-host:1')
+    db.session.add_all([ours, theirs])
+    db.session.commit()
+
+    heartbeat = jobs.JobHeartbeat(app)
+    heartbeat.beat()
+    assert db.session.get(DiscoveryJob, ours.id).heartbeat_at is not None
+    assert db.session.get(DiscoveryJob, theirs.id).heartbeat_at is None
+    monkeypatch.setattr(jobs, '_executor', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(jobs, '_heartbeat', heartbeat)
+
+    jobs.shutdown_discovery_jobs()
+    db.session.expire_all()
+    assert db.session.get(DiscoveryJob, ours.id).status == DiscoveryJob.STATUS_FAILED
+    assert db.session.get(DiscoveryJob, theirs.id).status == DiscoveryJob.STATUS_QUEUED
+    assert jobs._executor is None
@@ -0,0 +1,136 @@
+import pytest
+from ldap3.core.exceptions import LDAPSessionTerminatedByServerError
+
+from app.utils.ldap_pool import LdapPool, LdapPoolTimeout
+
+PASSWORDS = {'cn=alice,ou=Users,dc=example,dc=com': 'right'}
+
+
+class FakeConnection:
+    def __init__(self, user):
+        self.user = user
+        self.closed = False
+        self.response = []
+        self.fail_next = False
+
+    def rebind(self, user=None, password=None):
+        self.user = user
+        return PASSWORDS.get(user) == password
+
+    def search(self, base, search_filter, attributes=None, size_limit=0):
+        if self.fail_next:
+            self.closed = True
+            raise LDAPSessionTerminatedByServerError('connection reset')
+        login = search_filter.strip('()').split('=', 1)[1]
+        self.response = [{
+            'type': 'searchResEntry',
+            'dn': f'cn={login},ou=Users,dc=example,dc=com',
+            'attributes': {'mail': f'{login}@example.com', 'cn': [login.title()]},
+        }] if login == 'alice' else []
+
+    def unbind(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections():
+    return []
+
+
+@pytest.fixture
+def make_pool(connections):
+    def make(**kwargs):
+        def factory(user, password):
+            conn = FakeConnection(user)
+            connections.append(conn)
+            return conn
+        kwargs.setdefault('bind_dn', 'cn=svc,dc=example,dc=com')
+        return LdapPool('ldap.example.com', connection_factory=factory, **kwargs)
+    return make
+
+
+def test_connections_are_reused(make_pool, connections):
+    pool = make_pool()
+    for _ in range(3):
+        entry = pool.find_user('ou=Users,dc=example,dc=com', '(sAMAccountName=alice)', ['mail'])
+        assert pool.check_password(entry['dn'], 'right') == (True, None)
+
+    assert len(connections) == 2
+    metrics = pool.metrics()
+    assert metrics['search']['created'] == 1
+    assert metrics['search']['reused'] == 2
+    assert metrics['bind']['open'] == 1
+    assert metrics['bind']['in_use'] == 0
+
+
+def test_bad_and_empty_passwords_fail(make_pool):
+    pool = make_pool()
+    dn = 'cn=alice,ou=Users,dc=example,dc=com'
+    assert pool.check_password(dn, 'wrong') == (False, None)
+    assert pool.check_password(dn, '') == (False, None)
+    assert pool.check_password(dn, 'right') == (True, None)
+    assert pool.metrics()['bind']['created'] == 1
+
+
+def test_idle_connections_are_replaced(make_pool, connections):
+    now = [0.0]
+    pool = make_pool(max_idle=60, clock=lambda: now[0])
+    pool.find_user('ou=Users', '(uid=alice)', [])
+    now[0] = 61
+    pool.find_user('ou=Users', '(uid=alice)', [])
+
+    assert connections[0].closed
+    assert len(connections) == 2
+    assert pool.metrics()['search']['expired'] == 1
+
+
+def test_dropped_connection_is_retried_once(make_pool, connections):
+    pool = make_pool()
+    pool.find_user('ou=Users', '(uid=alice)', [])
+    connections[0].fail_next = True
+
+    entry = pool.find_user('ou=Users', '(uid=alice)', [])
+    assert entry['dn'] == 'cn=alice,ou=Users,dc=example,dc=com'
+    assert len(connections) == 2
+    assert pool.metrics()['search']['discarded'] == 1
+
+
+def test_exhausted_pool_times_out(make_pool):
+    pool = make_pool(size=1, timeout=0)
+    with pool._search.connection():
+        with pytest.raises(LdapPoolTimeout):
+            pool.find_user('ou=Users', '(uid=alice)', [])
+    assert pool.metrics()['search']['timeouts'] == 1
+
+
+def test_login_searches_as_service_account(app, monkeypatch, make_pool):
+    from app.auth import ldap_auth
+
+    pool = make_pool()
+    monkeypatch.setattr(ldap_auth, 'get_ldap_pool', lambda config: pool)
+    monkeypatch.setitem(app.config, 'LDAP_USER_DN', 'ou=Users')
+    monkeypatch.setitem(app.config, 'LDAP_BASE_DN', 'dc=example,dc=com')
+
+    with app.app_context():
+        assert ldap_auth.try_ldap_login('alice', 'right') == {
+            'username': 'alice', 'email': 'alice@example.com', 'display_name': 'Alice',
+        }
+        assert ldap_auth.try_ldap_login('alice', 'wrong') is None
+        assert ldap_auth.try_ldap_login('bob', 'right') is None
+
+
+def test_lookups_are_cached_briefly(make_pool, connections):
+    now = [0.0]
+    pool = make_pool(lookup_ttl=60, clock=lambda: now[0])
+    searches = []
+    pool.find_user('ou=Users', '(uid=alice)', ['mail'])
+    connections[0].search = lambda *args, **kwargs: searches.append(args)
+
+    entry = pool.find_user('ou=Users', '(uid=alice)', ['mail'])
+    assert entry['dn'] == 'cn=alice,ou=Users,dc=example,dc=com'
+    assert searches == []
+    assert pool.metrics()['lookups']['hits'] == 1
+
+    now[0] = 61
+    pool.find_user('ou=Users', '(uid=alice)', ['mail'])
+    assert len(searches) == 1
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from app.utils import password_hashing
+from app.utils.login_throttle import LoginThrottle
+from app.utils.password_hashing import HashingBusy, HashingPool
+
+
+def _sign_in(client, user, password):
+    return client.post('/auth/login', data={'username': user.username, 'password': password})
+
+
+def test_throttle_locks_after_repeated_failures():
+    now = [0.0]
+    throttle = LoginThrottle(max_failures=3, window=60, lockout=300, max_entries=10, clock=lambda: now[0])
+
+    assert not throttle.record_failure('alice')
+    now[0] = 61
+    # The first failure has left the window
+    assert not throttle.record_failure('Alice')
+    assert not throttle.record_failure('alice')
+    assert throttle.record_failure('alice ')
+    assert throttle.locked_for('alice') == 300
+    assert throttle.locked_for('bob') == 0
+
+    now[0] += 301
+    assert throttle.locked_for('alice') == 0
+
+
+def test_throttle_success_clears_and_size_is_bounded():
+    throttle = LoginThrottle(max_failures=2, window=60, lockout=300, max_entries=2)
+    throttle.record_failure('alice')
+    throttle.record_success('alice')
+    assert not throttle.record_failure('alice')
+
+    throttle.record_failure('bob')
+    throttle.record_failure('carol')
+    assert len(throttle._records) == 2
+
+
+def test_locked_out_login_skips_password_check(client, monkeypatch, registered_user):
+    from app.models.user import User
+
+    for _ in range(5):
+        assert b'Invalid username or password' in _sign_in(client, registered_user, 'wrong').data
+
+    checks = []
+    original = User.check_password
+    monkeypatch.setattr(User, 'check_password', lambda self, pw: checks.append(pw) or original(self, pw))
+
+    resp = _sign_in(client, registered_user, 'securepassword123')
+    assert resp.status_code == 429
+    assert b'Too many failed sign-in attempts' in resp.data
+    assert checks == []
+
+
+def test_failed_local_login_does_not_try_ldap(app, client, monkeypatch, registered_user):
+    from app.auth import ldap_auth
+
+    def unexpected(*args):
+        raise AssertionError('LDAP should not be asked about a local account')
+
+    monkeypatch.setitem(app.config, 'LDAP_ENABLED', True)
+    monkeypatch.setattr(ldap_auth, 'try_ldap_login', unexpected)
+    assert b'Invalid username or password' in _sign_in(client, registered_user, 'wrong').data
+
+
+def test_busy_hashing_pool_refuses_login(client, monkeypatch, registered_user):
+    from app.models.user import User
+
+    def busy(self, password):
+        raise HashingBusy('queue full')
+
+    monkeypatch.setattr(User, 'check_password', busy)
+    resp = _sign_in(client, registered_user, 'securepassword123')
+    assert resp.status_code == 503
+    assert b'server is busy' in resp.data
+
+
+def test_busy_hashing_pool_refuses_password_change(client, monkeypatch, logged_in_user):
+    from app.models.user import User
+
+    def busy(self, password):
+        raise HashingBusy('queue full')
+
+    monkeypatch.setattr(User, 'check_password', busy)
+    resp = client.post('/auth/change-password', data={
+        'current_password': 'securepassword123',
+        'new_password': 'anotherpassword456',
+        'confirm_password': 'anotherpassword456',
+    })
+    assert resp.status_code == 503
+    assert b'server is busy' in resp.data
+
+
+def test_hashing_pool_bounds_pending_checks(monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_check(pwhash, password):
+        started.set()
+        release.wait(5)
+        return pwhash == password
+
+    monkeypatch.setattr(password_hashing, 'check_password_hash', slow_check)
+    pool = HashingPool(workers=1, max_pending=0, timeout=5)
+    try:
+        result = []
+        worker = threading.Thread(target=lambda: result.append(pool.check('x', 'x')))
+        worker.start()
+        started.wait(5)
+        with pytest.raises(HashingBusy):
+            pool.check('y', 'y')
+        release.set()
+        worker.join(5)
+        assert result == [True]
+        assert pool.check('a', 'b') is False
+    finally:
+        release.set()
+        pool.shutdown()
@@ -0,0 +1,221 @@
+import importlib.util
+from datetime import datetime, timezone
+
+import pytest
+
+from app.cloud import discovery
+from app.models.cached_resource import CachedResource
+from app.models.cloud_connection import CloudConnection
+from app.utils import cli_runner, providers
+from app.utils.providers import get_backend
+from app.utils.providers.cli import CliBackend
+from app.utils.providers.sdk import SDKError, SdkBackend
+
+AWS_CREDS = {
+    'aws_access_key_id': 'AKIATEST',
+    'aws_secret_access_key': 'secret',
+    'aws_default_region': 'us-east-1',
+}
+AZURE_CREDS = {
+    'tenant_id': 'tenant', 'client_id': 'client', 'client_secret': 'secret',
+    'subscription_id': 'sub-1',
+}
+LAUNCHED = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class StubPaginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self):
+        return iter(self.pages)
+
+
+class StubAwsClient:
+    def __init__(self, pages):
+        self.pages = pages
+        self.closed = False
+
+    def can_paginate(self, operation):
+        return operation in self.pages
+
+    def get_paginator(self, operation):
+        return StubPaginator(self.pages[operation])
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': 'logs', 'CreationDate': LAUNCHED}], 'ResponseMetadata': {}}
+
+    def describe_regions(self):
+        return {'Regions': [{'RegionName': 'us-east-1'}], 'ResponseMetadata': {'RequestId': 'x'}}
+
+    def close(self):
+        self.closed = True
+
+
+class StubModel:
+    def __init__(self, **data):
+        self.data = data
+        self.kind = data.get('kind')
+
+    def serialize(self, keep_readonly=False):
+        return dict(self.data)
+
+
+class StubApiError(Exception):
+    pass
+
+
+@pytest.fixture
+def aws_clients():
+    built = []
+
+    def factory(service, credentials, timeout):
+        client = StubAwsClient({
+            'describe_vpcs': [
+                {'Vpcs': [{'VpcId': 'vpc-1', 'Tags': [{'Key': 'Name', 'Value': 'main'}]}],
+                 'ResponseMetadata': {'RequestId': 'a'}},
+                {'Vpcs': [{'VpcId': 'vpc-2', 'CreatedAt': LAUNCHED}]},
+            ],
+        })
+        built.append((service, credentials['aws_default_region'], client))
+        factory.timeouts.append(timeout)
+        return client
+    factory.built = built
+    factory.timeouts = []
+    return factory
+
+
+def test_default_backend_is_cli(app):
+    with app.app_context():
+        assert isinstance(get_backend(), CliBackend)
+        with pytest.raises(ValueError):
+            get_backend({**app.config, 'PROVIDER_BACKEND': 'carrier-pigeon'})
+
+
+def test_cli_backend_maps_operations_to_commands(app, monkeypatch):
+    commands = []
+
+    def fake_execute(cmd, env, timeout):
+        commands.append(cmd)
+        return {'Buckets': []}
+
+    monkeypatch.setattr(cli_runner, '_execute', fake_execute)
+    monkeypatch.setattr(cli_runner, 'iter_azure_items', lambda args, creds: iter([args]))
+    backend = CliBackend()
+    with app.app_context():
+        list(backend.aws_pages('s3', 'list_buckets', AWS_CREDS))
+        backend.aws_call('ec2', 'describe_regions', AWS_CREDS)
+        assert list(backend.azure_items('vnet', AZURE_CREDS)) == [['network', 'vnet', 'list']]
+
+    assert commands[0][1:3] == ['s3api', 'list-buckets']
+    assert commands[1][1:3] == ['ec2', 'describe-regions']
+
+
+def test_sdk_backend_returns_cli_shaped_pages(aws_clients):
+    backend = SdkBackend(aws_client_factory=aws_clients)
+    pages = list(backend.aws_pages('ec2', 'describe_vpcs', AWS_CREDS))
+
+    assert pages[0] == {'Vpcs': [{'VpcId': 'vpc-1', 'Tags': [{'Key': 'Name', 'Value': 'main'}]}]}
+    assert pages[1]['Vpcs'][0]['CreatedAt'] == '2024-05-01T12:00:00+00:00'
+    assert backend.aws_call('ec2', 'describe_regions', AWS_CREDS) == {
+        'Regions': [{'RegionName': 'us-east-1'}],
+    }
+
+
+def test_sdk_backend_returns_unpageable_operations_whole(aws_clients):
+    backend = SdkBackend(aws_client_factory=aws_clients)
+    assert list(backend.aws_pages('s3', 'list_buckets', AWS_CREDS)) == [
+        {'Buckets': [{'Name': 'logs', 'CreationDate': '2024-05-01T12:00:00+00:00'}]},
+    ]
+
+
+def test_sdk_backend_reuses_clients(aws_clients):
+    backend = SdkBackend(aws_client_factory=aws_clients, cache_size=2)
+    for _ in range(3):
+        list(backend.aws_pages('ec2', 'describe_vpcs', AWS_CREDS))
+    assert len(aws_clients.built) == 1
+
+    # A new region, and a rotated secret, each need their own client
+    list(backend.aws_pages('ec2', 'describe_vpcs', {**AWS_CREDS, 'aws_default_region': 'eu-west-1'}))
+    list(backend.aws_pages('ec2', 'describe_vpcs', {**AWS_CREDS, 'aws_secret_access_key': 'new'}))
+    assert len(aws_clients.built) == 3
+    assert len(backend) == 2
+    assert aws_clients.built[0][2].closed
+
+    backend.close()
+    assert all(client.closed for _, _, client in aws_clients.built)
+
+
+def test_sdk_backend_applies_call_timeout(aws_clients):
+    backend = SdkBackend(timeout=120, aws_client_factory=aws_clients)
+    backend.aws_call('ec2', 'describe_regions', AWS_CREDS)
+    backend.aws_call('ec2', 'describe_regions', AWS_CREDS, timeout=30)
+    backend.aws_call('ec2', 'describe_regions', AWS_CREDS, timeout=30)
+    assert aws_clients.timeouts == [120, 30]
+
+
+def test_sdk_backend_lists_azure_resources():
+    calls = []
+
+    class WebClient:
+        class web_apps:
+            @staticmethod
+            def list():
+                return [
+                    StubModel(id='/subscriptions/sub-1/resourceGroups/rg-a/providers/Microsoft.Web/sites/fn',
+                              name='fn', kind='functionapp,linux'),
+                    StubModel(id='/subscriptions/sub-1/resourceGroups/rg-a/providers/Microsoft.Web/sites/web',
+                              name='web', kind='app'),
+                ]
+
+    def factory(kind, credentials):
+        calls.append(kind)
+        return WebClient()
+
+    backend = SdkBackend(azure_client_factory=factory)
+    items = list(backend.azure_items('function_app', AZURE_CREDS))
+    list(backend.azure_items('function_app', AZURE_CREDS))
+
+    assert [item['name'] for item in items] == ['fn']
+    assert items[0]['resourceGroup'] == 'rg-a'
+    assert calls == ['web']
+
+
+def test_sdk_errors_are_provider_errors(monkeypatch):
+    from app.utils.providers import sdk
+
+    class FailingClient(StubAwsClient):
+        def describe_regions(self):
+            raise StubApiError('AccessDenied')
+
+        get_caller_identity = describe_regions
+
+    monkeypatch.setattr(sdk, '_sdk_error_types', lambda: (StubApiError,))
+    backend = SdkBackend(aws_client_factory=lambda service, creds, timeout: FailingClient({}))
+    with pytest.raises(SDKError, match='AccessDenied'):
+        backend.aws_call('ec2', 'describe_regions', AWS_CREDS)
+    assert backend.test_aws_connection(AWS_CREDS) == (False, 'AccessDenied')
+
+
+@pytest.mark.skipif(importlib.util.find_spec('boto3') is not None, reason='boto3 is installed')
+def test_sdk_backend_without_boto3_reports_error():
+    with pytest.raises(SDKError, match='requirements-sdk.txt'):
+        SdkBackend().aws_call('sts', 'get_caller_identity', AWS_CREDS)
+
+
+def test_discovery_through_sdk_backend(app, db, monkeypatch, aws_clients):
+    from app.cloud import aws_service
+
+    monkeypatch.setitem(app.config, 'PROVIDER_BACKEND', 'sdk')
+    monkeypatch.setitem(providers._backends, 'sdk', SdkBackend(aws_client_factory=aws_clients))
+    monkeypatch.setattr(aws_service, 'AWS_DISCOVERY_FUNCTIONS', [aws_service.discover_vpcs])
+
+    conn = CloudConnection(name='sdk', provider='aws', credentials_encrypted='')
+    conn.set_credentials(AWS_CREDS)
+    db.session.add(conn)
+    db.session.commit()
+
+    result = discovery.run_discovery(conn)
+    assert result['total'] == 2
+    names = {r.resource_id: r.resource_name for r in CachedResource.query.filter_by(connection_id=conn.id)}
+    assert names == {'vpc-1': 'main', 'vpc-2': 'vpc-2'}
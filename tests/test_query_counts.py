@@ -0,0 +1,60 @@
+"""Endpoints must issue a fixed number of SQL statements, however many rows they show."""
+from app.models.audit_log import AuditLog
+from app.models.cached_resource import CachedResource
+from app.models.cloud_connection import CloudConnection
+from app.models.user import User
+
+ENDPOINTS = [
+    '/cloud/resources',
+    '/cloud/resources?provider=aws&sort=name',
+    '/cloud/resources/search?q=vm',
+    '/export/csv',
+    '/export/json',
+    '/dashboard',
+    '/admin/audit-log',
+]
+
+
+def _add_rows(db, user, start, count):
+    connections = []
+    for i in range(start, start + count):
+        conn = CloudConnection(name=f'conn-{i}', provider='aws', user_id=user.id, credentials_encrypted='')
+        db.session.add(conn)
+        db.session.flush()
+        connections.append(conn)
+        db.session.add(CachedResource(
+            connection_id=conn.id,
+            resource_type='ec2_instance',
+            resource_id=f'i-{i}',
+            resource_name=f'vm-{i}',
+            search_text=f'ec2_instance i-{i} vm',
+            raw_data={},
+        ))
+        actor = User(username=f'actor-{i}', email=f'actor-{i}@example.com')
+        db.session.add(actor)
+        db.session.flush()
+        db.session.add(AuditLog(user_id=actor.id, action='test', details={'i': i}))
+    db.session.commit()
+
+
+def _query_counts(client, db, count_queries):
+    counts = {}
+    for url in ENDPOINTS:
+        # The test shares one session with the app; start every request cold
+        db.session.expire_all()
+        with count_queries() as queries:
+            resp = client.get(url)
+            resp.get_data()  # drain streamed responses inside the counter
+        assert resp.status_code == 200, url
+        counts[url] = queries.count
+    return counts
+
+
+def test_query_count_does_not_grow_with_rows(client, db, count_queries, logged_in_user):
+    _add_rows(db, logged_in_user, 0, 2)
+    _query_counts(client, db, count_queries)  # warm per-process caches
+    small = _query_counts(client, db, count_queries)
+    _add_rows(db, logged_in_user, 2, 20)
+    large = _query_counts(client, db, count_queries)
+
+    assert large == small
@@ -0,0 +1,189 @@
+import pytest
+
+from app.utils import cli_runner, rate_limit
+from app.utils.cli_runner import CLIError
+from app.utils.rate_limit import RateLimiter, TokenBucket, is_throttling_error
+
+CREDS = {
+    'aws_access_key_id': 'AKIATEST',
+    'aws_secret_access_key': 'secret',
+    'aws_default_region': 'us-east-1',
+}
+
+AWS_THROTTLED = ('An error occurred (Throttling) when calling the DescribeInstances '
+                 'operation (reached max retries: 4): Rate exceeded')
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _limiter(fake, **kwargs):
+    kwargs.setdefault('rate', 0)
+    return RateLimiter(clock=fake.clock, sleep=fake.sleep, rng=lambda: 1.0, **kwargs)
+
+
+@pytest.mark.parametrize('stderr', [
+    AWS_THROTTLED,
+    'An error occurred (RequestLimitExceeded) when calling the DescribeVpcs operation',
+    'An error occurred (TooManyRequestsException) when calling the ListFunctions operation',
+    "(TooManyRequests) Number of 'read' requests for subscription exceeded the limit",
+    "ERROR: (SubscriptionRequestsThrottled) Number of read requests exceeded",
+    'Operation returned an invalid status code 429',
+])
+def test_throttling_errors_are_recognised(stderr):
+    assert is_throttling_error(CLIError('aws', 255, stderr))
+
+
+@pytest.mark.parametrize('stderr', [
+    'An error occurred (AccessDenied) when calling the ListUsers operation',
+    'An error occurred (UnauthorizedOperation) when calling the DescribeInstances operation',
+    "ERROR: (AuthorizationFailed) The client does not have authorization",
+    'Command timed out after 120 seconds',
+])
+def test_other_errors_are_not_throttling(stderr):
+    assert not is_throttling_error(CLIError('az', 1, stderr))
+
+
+def test_token_bucket_spaces_calls_after_burst():
+    fake = FakeTime()
+    bucket = TokenBucket(rate=2, burst=3, clock=fake.clock)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    fake.now += 10
+    assert bucket.reserve() == 0
+
+
+def test_throttled_calls_retry_with_growing_backoff():
+    fake = FakeTime()
+    limiter = _limiter(fake, max_retries=5, backoff=1, backoff_max=4)
+    attempts = []
+
+    def flaky():
+        attempts.append(fake.now)
+        if len(attempts) <= 4:
+            raise CLIError('aws', 255, AWS_THROTTLED)
+        return {'ok': True}
+
+    assert limiter.call('key', flaky) == {'ok': True}
+    assert fake.sleeps == [1, 2, 4, 4]
+    metrics = limiter.metrics()
+    assert (metrics['calls'], metrics['throttled'], metrics['retries'], metrics['gave_up']) == (5, 4, 4, 0)
+
+
+def test_backoff_is_jittered():
+    fake = FakeTime()
+    limiter = RateLimiter(rate=0, backoff=8, clock=fake.clock, sleep=fake.sleep, rng=lambda: 0.25)
+    calls = []
+
+    def once_throttled():
+        calls.append(1)
+        if len(calls) == 1:
+            raise CLIError('aws', 255, AWS_THROTTLED)
+
+    limiter.call('key', once_throttled)
+    assert fake.sleeps == [2]
+
+
+def test_gives_up_after_max_retries_and_other_errors_are_not_retried():
+    fake = FakeTime()
+    limiter = _limiter(fake, max_retries=2)
+
+    def throttled():
+        raise CLIError('aws', 255, AWS_THROTTLED)
+
+    with pytest.raises(CLIError, match='Throttling'):
+        limiter.call('key', throttled)
+    assert limiter.metrics()['gave_up'] == 1
+
+    calls = []
+
+    def denied():
+        calls.append(1)
+        raise CLIError('aws', 255, 'An error occurred (AccessDenied)')
+
+    with pytest.raises(CLIError, match='AccessDenied'):
+        limiter.call('key', denied)
+    assert len(calls) == 1
+
+
+def test_rate_adapts_per_key():
+    fake = FakeTime()
+    limiter = _limiter(fake, rate=8, burst=1)
+    failures = iter([True, True])
+
+    def call():
+        if next(failures, False):
+            raise CLIError('aws', 255, AWS_THROTTLED)
+
+    limiter.call(('aws', 'AKIATEST', 'us-east-1', 'ec2'), call)
+    limiter.call(('aws', 'AKIATEST', 'us-east-1', 'iam'), lambda: None)
+
+    keys = limiter.metrics()['throttled_keys']
+    # Halved twice, then one success adds back a tenth of the configured rate
+    assert keys == {'aws/AKIATEST/us-east-1/ec2': {'throttled': 2, 'rate': 2.8}}
+
+
+def test_stream_retries_only_before_first_item():
+    fake = FakeTime()
+    limiter = _limiter(fake)
+    runs = []
+
+    def listing():
+        runs.append(1)
+        if len(runs) == 1:
+            raise CLIError('az', 1, '(TooManyRequests) Too many requests')
+        yield 'a'
+        if len(runs) == 2:
+            raise CLIError('az', 1, '(TooManyRequests) Too many requests')
+        yield 'b'
+
+    received = []
+    with pytest.raises(CLIError):
+        for item in limiter.stream('key', listing):
+            received.append(item)
+    assert received == ['a']
+    assert len(runs) == 2
+
+
+def test_aws_pages_retry_throttled_page(app, monkeypatch):
+    fake = FakeTime()
+    limiter = _limiter(fake)
+    monkeypatch.setattr(rate_limit, '_limiter', limiter)
+    calls = []
+
+    def fake_execute(cmd, env, timeout):
+        calls.append(cmd)
+        if len(calls) == 2:
+            raise CLIError('aws', 255, AWS_THROTTLED)
+        if '--starting-token' in cmd:
+            return {'Vpcs': [{'VpcId': 'vpc-2'}]}
+        return {'Vpcs': [{'VpcId': 'vpc-1'}], 'NextToken': 't1'}
+
+    monkeypatch.setattr(cli_runner, '_execute', fake_execute)
+    with app.app_context():
+        pages = list(cli_runner.iter_aws_pages(['ec2', 'describe-vpcs'], CREDS, page_size=1))
+
+    assert [p['Vpcs'][0]['VpcId'] for p in pages] == ['vpc-1', 'vpc-2']
+    assert calls[1] == calls[2]
+    assert limiter.metrics()['throttled_keys'] == {
+        'aws/AKIATEST/us-east-1/ec2': {'throttled': 1, 'rate': 0},
+    }
+
+
+def test_rate_limit_metrics_endpoint(client, monkeypatch, logged_in_user):
+    monkeypatch.setattr(rate_limit, '_limiter', _limiter(FakeTime()))
+
+    resp = client.get('/admin/rate-limits')
+    assert resp.status_code == 200
+    assert resp.get_json()['rate_limits']['calls'] == 0
@@ -0,0 +1,76 @@
+import re
+
+from app.cloud.routes import RESOURCE_SORTS
+from app.models.cached_resource import CachedResource
+from app.models.cloud_connection import CloudConnection
+from app.utils.keyset import paginate_keyset
+
+
+def _seed(db, user, count):
+    conn = CloudConnection(name='res-aws', provider='aws', user_id=user.id, credentials_encrypted='')
+    db.session.add(conn)
+    db.session.flush()
+    for i in range(count):
+        db.session.add(CachedResource(
+            connection_id=conn.id,
+            resource_type='vpc' if i % 2 else 'ec2_instance',
+            resource_id=f'res-{i}',
+            resource_name=None if i % 5 == 0 else f'name-{i % 3}',
+            region='us-east-1',
+            raw_data={},
+        ))
+    db.session.commit()
+    return conn
+
+
+def _walk(sort, descending, per_page):
+    columns, key_of = RESOURCE_SORTS[sort]
+    query = CachedResource.query
+    seen = []
+    pages = []
+    cursor = None
+    while True:
+        page = paginate_keyset(query, columns, key_of, per_page, after=cursor, descending=descending)
+        pages.append(page)
+        seen.extend(r.resource_id for r in page.items)
+        if not page.has_next:
+            return seen, pages
+        cursor = page.next_cursor
+
+
+def test_keyset_pagination_visits_every_row_once(client, db, logged_in_user):
+    _seed(db, logged_in_user, 23)
+
+    for sort in RESOURCE_SORTS:
+        for descending in (False, True):
+            seen, pages = _walk(sort, descending, per_page=5)
+            assert sorted(seen) == sorted(f'res-{i}' for i in range(23))
+            assert len(pages) == 5
+            assert not pages[0].has_prev
+
+    columns, key_of = RESOURCE_SORTS['type']
+    _, pages = _walk('type', False, per_page=5)
+    back = paginate_keyset(CachedResource.query, columns, key_of, 5, before=pages[2].prev_cursor)
+    assert [r.id for r in back.items] == [r.id for r in pages[1].items]
+    assert back.has_next and back.has_prev
+
+
+def test_resource_list_pages(client, db, logged_in_user):
+    _seed(db, logged_in_user, 12)
+
+    resp = client.get('/cloud/resources?per_page=5&sort=name')
+    assert resp.status_code == 200
+    assert resp.data.count(b'class="resource-id"') == 5
+    next_link = re.search(rb'href="([^"]*after=[^"]*)"', resp.data).group(1).decode().replace('&amp;', '&')
+
+    resp = client.get(next_link)
+    assert resp.status_code == 200
+    assert resp.data.count(b'class="resource-id"') == 5
+    assert b'before=' in resp.data
+
+
+def test_invalid_cursor_and_connection_filter_are_ignored(client, db, logged_in_user):
+    _seed(db, logged_in_user, 3)
+    resp = client.get('/cloud/resources?after=not-a-cursor&connection_id=nope')
+    assert resp.status_code == 200
+    assert resp.data.count(b'class="resource-id"') == 3
@@ -0,0 +1,215 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.cloud import jobs
+from app.cloud.scheduler import LEASE_NAME, DiscoveryScheduler
+from app.models.cloud_connection import CloudConnection
+from app.models.discovery_job import DiscoveryJob
+from app.models.scheduler_lease import SchedulerLease
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime.now(timezone.utc)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+
+
+class _HoldingExecutor:
+    """Accepts jobs without running them, so they stay queued."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    holding = _HoldingExecutor()
+    monkeypatch.setattr(jobs, '_get_executor', lambda app: holding)
+    return holding
+
+
+@pytest.fixture
+def schedule_config(app):
+    overrides = {
+        'DISCOVERY_SCHEDULE_MINUTES': 60,
+        'DISCOVERY_SCHEDULE_JITTER_SECONDS': 0,
+        'DISCOVERY_SCHEDULE_MAX_CONCURRENT': 10,
+        'DISCOVERY_SCHEDULE_MAX_PER_PROVIDER': 10,
+        'DISCOVERY_SCHEDULER_LEASE_SECONDS': 120,
+        'DISCOVERY_JOB_WORKERS': 100,
+    }
+    saved = {key: app.config[key] for key in overrides}
+    app.config.update(overrides)
+    yield app.config
+    app.config.update(saved)
+
+
+def _make_connections(make_connection, provider, count, **columns):
+    return [make_connection(f'{provider}-{i}', provider, **columns) for i in range(count)]
+
+
+def _finish(db, started, at):
+    for job in started:
+        job = db.session.get(DiscoveryJob, job.id)
+        job.status = DiscoveryJob.STATUS_SUCCEEDED
+        job.created_at = at
+    db.session.commit()
+
+
+def test_only_one_scheduler_holds_the_lease(app, db, make_connection, clock, executor, schedule_config):
+    _make_connections(make_connection, 'aws', 1)
+    first = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+    second = DiscoveryScheduler(app, clock=clock, holder='worker-2')
+
+    assert len(first.tick()) == 1
+    assert second.tick() == []
+    assert first.is_leader and not second.is_leader
+
+    # The holder renews on every pass
+    clock.advance(seconds=100)
+    first.tick()
+    clock.advance(seconds=100)
+    second.tick()
+    assert not second.is_leader
+
+    # ...and loses the lease once it stops renewing
+    clock.advance(seconds=121)
+    second.tick()
+    assert second.is_leader
+    assert db.session.get(SchedulerLease, LEASE_NAME).holder == 'worker-2'
+    first.tick()
+    assert not first.is_leader
+
+
+def test_stop_hands_the_lease_over(app, db, clock, executor, schedule_config):
+    first = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+    second = DiscoveryScheduler(app, clock=clock, holder='worker-2')
+    first.tick()
+    first.stop()
+    second.tick()
+    assert second.is_leader
+
+
+def test_connections_rediscovered_after_their_interval(app, db, make_connection, clock, executor,
+                                                       schedule_config):
+    hourly, daily = _make_connections(make_connection, 'aws', 2)
+    daily.discovery_interval_minutes = 24 * 60
+    manual, = _make_connections(make_connection, 'azure', 1, discovery_interval_minutes=0)
+    _make_connections(make_connection, 'azure', 1, is_active=False)
+    scheduler = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+
+    started = scheduler.tick()
+    assert {job.connection_id for job in started} == {hourly.id, daily.id}
+    _finish(db, started, clock.now)
+
+    clock.advance(minutes=59)
+    assert scheduler.tick() == []
+    clock.advance(minutes=1)
+    assert [job.connection_id for job in scheduler.tick()] == [hourly.id]
+    assert all(job.connection_id != manual.id for job in DiscoveryJob.query)
+
+
+def test_in_flight_connections_are_skipped(app, db, make_connection, clock, executor, schedule_config):
+    conn, = _make_connections(make_connection, 'aws', 1, discovery_interval_minutes=30)
+    scheduler = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+    assert len(scheduler.tick()) == 1
+
+    # Still queued an interval later: not started again
+    clock.advance(minutes=31)
+    assert scheduler.tick() == []
+    assert DiscoveryJob.query.filter_by(connection_id=conn.id).count() == 1
+
+
+def test_concurrency_caps(app, db, make_connection, clock, executor, schedule_config):
+    schedule_config['DISCOVERY_SCHEDULE_MAX_CONCURRENT'] = 3
+    schedule_config['DISCOVERY_SCHEDULE_MAX_PER_PROVIDER'] = 2
+    _make_connections(make_connection, 'aws', 4)
+    _make_connections(make_connection, 'azure', 2)
+    scheduler = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+
+    started = scheduler.tick()
+    providers = sorted(db.session.get(CloudConnection, job.connection_id).provider for job in started)
+    assert providers == ['aws', 'aws', 'azure']
+
+    # Full until something finishes
+    assert scheduler.tick() == []
+    _finish(db, started[:1], clock.now)
+    assert len(scheduler.tick()) == 1
+
+
+def test_leader_does_not_queue_more_than_its_pool_runs(app, db, make_connection, clock, executor,
+                                                       schedule_config):
+    schedule_config['DISCOVERY_JOB_WORKERS'] = 2
+    _make_connections(make_connection, 'aws', 2)
+    _make_connections(make_connection, 'azure', 2)
+    scheduler = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+
+    started = scheduler.tick()
+    assert len(started) == 2
+    assert scheduler.tick() == []
+    _finish(db, started[:1], clock.now)
+    assert len(scheduler.tick()) == 1
+
+
+def test_jitter_spreads_first_runs(app, db, make_connection, clock, executor, schedule_config):
+    schedule_config['DISCOVERY_SCHEDULE_JITTER_SECONDS'] = 600
+    schedule_config['DISCOVERY_SCHEDULE_MAX_CONCURRENT'] = 100
+    schedule_config['DISCOVERY_SCHEDULE_MAX_PER_PROVIDER'] = 100
+    conns = _make_connections(make_connection, 'aws', 20)
+    scheduler = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+
+    first = len(scheduler.tick())
+    clock.advance(seconds=300)
+    second = len(scheduler.tick())
+    clock.advance(seconds=300)
+    third = len(scheduler.tick())
+
+    assert first < second + third
+    assert second > 0 and third > 0
+    assert first + second + third == len(conns)
+
+    # Later runs stay spread out, within the jitter either side of the interval
+    offsets = {conn.id: scheduler.due_at(conn, clock.now) - clock.now for conn in conns}
+    assert len(set(offsets.values())) == len(conns)
+    assert all(timedelta(minutes=50) <= d < timedelta(minutes=70) for d in offsets.values())
+    assert offsets[conns[0].id] == scheduler.due_at(conns[0], clock.now) - clock.now
+
+
+def test_jitter_does_not_drift(app, db, make_connection, clock, executor, schedule_config):
+    schedule_config['DISCOVERY_SCHEDULE_JITTER_SECONDS'] = 600
+    conn, = _make_connections(make_connection, 'aws', 1, id=uuid.UUID(int=1))
+    scheduler = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+
+    started = clock.now
+    for _ in range(1000):
+        clock.now = scheduler.due_at(conn, clock.now)
+    average = (clock.now - started) / 1000
+    assert abs(average - timedelta(minutes=60)) < timedelta(minutes=1)
+
+
+def test_type_refresh_does_not_reset_schedule(app, db, make_connection, clock, executor, schedule_config):
+    conn, = _make_connections(make_connection, 'aws', 1)
+    scheduler = DiscoveryScheduler(app, clock=clock, holder='worker-1')
+    _finish(db, scheduler.tick(), clock.now)
+
+    clock.advance(minutes=50)
+    refresh = jobs.submit_discovery_job(conn, None, ['vpc'])
+    _finish(db, [refresh], clock.now)
+
+    clock.advance(minutes=10)
+    assert [job.connection_id for job in scheduler.tick()] == [conn.id]
@@ -0,0 +1,124 @@
+from app.cloud import search
+from app.cloud.search import build_search_text, search_filter
+from app.models.cached_resource import CachedResource
+from app.models.cloud_connection import CloudConnection
+
+
+def _add(db, conn, resource_id, name, raw_data, resource_type='ec2_instance'):
+    res_data = {
+        'resource_type': resource_type,
+        'resource_id': resource_id,
+        'resource_name': name,
+        'region': 'us-east-1',
+        'raw_data': raw_data,
+    }
+    db.session.add(CachedResource(
+        connection_id=conn.id, search_text=build_search_text(res_data), **res_data
+    ))
+
+
+def _seed(db, user):
+    conn = CloudConnection(name='search-aws', provider='aws', user_id=user.id, credentials_encrypted='')
+    db.session.add(conn)
+    db.session.flush()
+    _add(db, conn, 'i-pay', 'payments-api', {
+        'InstanceType': 't3.large',
+        'PrivateIpAddress': '10.2.3.4',
+        'Tags': [{'Key': 'team', 'Value': 'payments'}, {'Key': 'Name', 'Value': 'payments-api'}],
+    })
+    _add(db, conn, 'i-web', 'web', {
+        'InstanceType': 't3.small',
+        'PrivateIpAddress': '10.2.3.40',
+        'Tags': [{'Key': 'team', 'Value': 'frontend'}],
+    })
+    _add(db, conn, 'vnet-1', 'core-vnet', {
+        'location': 'westeurope',
+        'tags': {'team': 'payments'},
+        'addressSpace': {'addressPrefixes': ['10.0.0.0/16']},
+    }, resource_type='azure_vnet')
+    db.session.commit()
+    return conn
+
+
+def _matches(query_text):
+    return sorted(
+        r.resource_id for r in CachedResource.query.filter(search_filter(query_text))
+    )
+
+
+def test_build_search_text():
+    text = build_search_text({
+        'resource_type': 'ec2_instance',
+        'resource_id': 'i-1',
+        'resource_name': 'api',
+        'region': 'eu-west-1',
+        'raw_data': {
+            'Tags': [{'Key': 'env', 'Value': 'prod'}],
+            'NetworkInterfaces': [{'PrivateIpAddresses': [{'PrivateIpAddress': '10.9.9.9'}]}],
+            'Monitoring': {'State': 'disabled'},
+        },
+    })
+    assert 'env=prod' in text
+    assert '10.9.9.9' in text
+    assert 'disabled' not in text
+
+
+def test_search_matches_tags_ips_and_names(client, db, logged_in_user):
+    _seed(db, logged_in_user)
+
+    assert _matches('team=payments') == ['i-pay', 'vnet-1']
+    assert _matches('10.2.3.4') == ['i-pay']
+    assert _matches('t3.small') == ['i-web']
+    assert _matches('team=payments westeurope') == ['vnet-1']
+    assert _matches('nothing-like-this') == []
+    assert search_filter('   ') is None
+
+
+def test_resource_list_and_api_search(client, db, logged_in_user):
+    _seed(db, logged_in_user)
+
+    resp = client.get('/cloud/resources?q=team%3Dpayments')
+    assert resp.status_code == 200
+    assert resp.data.count(b'class="resource-id"') == 2
+
+    resp = client.get('/cloud/resources/search?q=10.2.3.4')
+    assert resp.status_code == 200
+    assert [r['resource_id'] for r in resp.get_json()['results']] == ['i-pay']
+    assert client.get('/cloud/resources/search?q=').status_code == 400
+    assert client.get('/cloud/resources/search?q=%22%22').status_code == 400
+
+    resp = client.get('/cloud/resources?q=%22%22')
+    assert resp.status_code == 200
+    assert b'class="resource-id"' not in resp.data
+
+
+def test_rebuild_search_index(client, db, runner, logged_in_user):
+    _seed(db, logged_in_user)
+    CachedResource.query.update({'search_text': None})
+    db.session.commit()
+    assert _matches('10.2.3.4') == []
+
+    result = runner.invoke(args=['cloud', 'rebuild-search-index'])
+    assert 'Reindexed 3 resources.' in result.output
+    assert _matches('10.2.3.4') == ['i-pay']
+
+
+def test_init_search_builds_missing_index(client, db, runner, logged_in_user):
+    _seed(db, logged_in_user)
+    # As for a database whose tables were not made by create_all()
+    for name in ('fts_insert', 'fts_delete', 'fts_update'):
+        db.session.execute(db.text(f'DROP TRIGGER cached_resources_{name}'))
+    db.session.execute(db.text('DROP TABLE cached_resources_fts'))
+    db.session.commit()
+    search._sqlite_fts_cache.clear()
+
+    for _ in range(2):
+        result = runner.invoke(args=['cloud', 'init-search'])
+        assert 'indexed 3 resources' in result.output
+    assert search._sqlite_has_fts()
+    assert _matches('10.2.3.4') == ['i-pay']
+
+    # The triggers keep new rows indexed
+    _add(db, CachedResource.query.first().connection, 'i-new', 'new', {'PrivateIpAddress': '10.7.7.7'})
+    db.session.commit()
+    assert _matches('10.7.7.7') == ['i-new']
@@ -0,0 +1,75 @@
+from app.cloud import discovery
+from app.cloud.stats import refresh_resource_stats, resource_type_counts
+from app.models.cached_resource import CachedResource
+from app.models.cloud_connection import CloudConnection
+from app.models.resource_stat import ResourceStat
+
+
+def _stats():
+    return {(s.resource_type, s.count) for s in ResourceStat.query}
+
+
+def test_discovery_maintains_stats(app, db, monkeypatch):
+    state = {'vpc': ['vpc-1', 'vpc-2'], 'subnet': ['subnet-1']}
+
+    def make(resource_type):
+        @discovery.discovers(resource_type)
+        def discover(credentials):
+            return [{
+                'resource_type': resource_type, 'resource_id': rid, 'region': 'us-east-1', 'raw_data': {},
+            } for rid in state[resource_type]]
+        discover.__name__ = f'discover_{resource_type}'
+        return discover
+
+    monkeypatch.setattr('app.cloud.aws_service.AWS_DISCOVERY_FUNCTIONS', [make('vpc'), make('subnet')])
+    conn = CloudConnection(name='stats-aws', provider='aws', credentials_encrypted='')
+    conn.set_credentials({'aws_access_key_id': 'AKIATEST', 'aws_secret_access_key': 'secret'})
+    db.session.add(conn)
+    db.session.commit()
+
+    discovery.run_discovery(conn)
+    assert _stats() == {('vpc', 2), ('subnet', 1)}
+
+    state['vpc'] = ['vpc-3']
+    state['subnet'] = []
+    discovery.run_discovery(conn)
+    assert _stats() == {('vpc', 1)}
+
+
+def test_recompute_command_and_dashboard(client, db, runner, logged_in_user):
+    conn = CloudConnection(name='stats-aws', provider='aws', user_id=logged_in_user.id,
+                           credentials_encrypted='')
+    db.session.add(conn)
+    db.session.flush()
+    for i in range(3):
+        db.session.add(CachedResource(
+            connection_id=conn.id, resource_type='ec2_instance', resource_id=f'i-{i}', raw_data={},
+        ))
+    db.session.add(CachedResource(
+        connection_id=conn.id, resource_type='vpc', resource_id='vpc-1', raw_data={},
+    ))
+    db.session.commit()
+    assert ResourceStat.query.count() == 0
+
+    result = runner.invoke(args=['cloud', 'recompute-stats'])
+    assert 'Recomputed 2 resource stats.' in result.output
+    assert resource_type_counts([conn.id]) == [('ec2_instance', 3), ('vpc', 1)]
+
+    resp = client.get('/dashboard')
+    assert resp.status_code == 200
+    assert b'Ec2 Instance' in resp.data
+
+
+def test_refresh_single_connection(app, db):
+    first = CloudConnection(name='a', provider='aws', credentials_encrypted='')
+    second = CloudConnection(name='b', provider='aws', credentials_encrypted='')
+    db.session.add_all([first, second])
+    db.session.flush()
+    db.session.add(ResourceStat(connection_id=second.id, resource_type='vpc', count=7))
+    db.session.add(CachedResource(connection_id=first.id, resource_type='vpc', resource_id='v', raw_data={}))
+    db.session.commit()
+
+    assert refresh_resource_stats(first.id) == 1
+    db.session.commit()
+    assert resource_type_counts([first.id]) == [('vpc', 1)]
+    assert resource_type_counts([second.id]) == [('vpc', 7)]
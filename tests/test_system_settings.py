@@ -0,0 +1,74 @@
+from app.models.system_setting import VERSION_KEY, SystemSetting
+
+
+def _write_elsewhere(db, key, value, version):
+    """Change a setting the way another worker would, bypassing this process's cache."""
+    table = SystemSetting.__table__
+    db.session.execute(table.update().where(table.c.key == key).values(value=value))
+    db.session.execute(table.update().where(table.c.key == VERSION_KEY).values(value=version))
+    db.session.commit()
+
+
+def test_settings_are_read_in_one_query(db, count_queries):
+    SystemSetting.set_many({'ldap_host': 'ldap.example.com', 'ldap_port': '636'})
+
+    with count_queries() as queries:
+        assert SystemSetting.get('ldap_host') == 'ldap.example.com'
+        assert SystemSetting.get('ldap_port') == '636'
+        assert SystemSetting.get('missing', 'fallback') == 'fallback'
+    assert queries.count == 1
+
+
+def test_version_change_reloads_snapshot(app, db, monkeypatch):
+    SystemSetting.set('ldap_host', 'old.example.com')
+    assert SystemSetting.get('ldap_host') == 'old.example.com'
+
+    _write_elsewhere(db, 'ldap_host', 'new.example.com', 'other-worker')
+    # Within the check interval the snapshot is trusted as is
+    assert SystemSetting.get('ldap_host') == 'old.example.com'
+
+    monkeypatch.setitem(app.config, 'SETTINGS_VERSION_CHECK_SECONDS', 0)
+    assert SystemSetting.get('ldap_host') == 'new.example.com'
+
+
+def test_unchanged_version_keeps_snapshot(app, db, monkeypatch, count_queries):
+    monkeypatch.setitem(app.config, 'SETTINGS_VERSION_CHECK_SECONDS', 0)
+    SystemSetting.set('ldap_host', 'ldap.example.com')
+    SystemSetting.get('ldap_host')
+
+    with count_queries() as queries:
+        SystemSetting.get('ldap_host')
+    assert queries.count == 1
+    assert 'WHERE system_settings."key"' in queries.statements[0]
+
+
+def test_set_many_commits_once(db, count_queries):
+    SystemSetting.set('ldap_host', 'before')
+
+    commits = []
+    from sqlalchemy import event
+    listener = lambda session: commits.append(session)  # noqa: E731
+    event.listen(db.session, 'after_commit', listener)
+    try:
+        SystemSetting.set_many(
+            {'ldap_host': 'after', 'ldap_bind_user_password': 's3cret'},
+            encrypted=['ldap_bind_user_password'],
+        )
+    finally:
+        event.remove(db.session, 'after_commit', listener)
+
+    assert len(commits) == 1
+    assert SystemSetting.get('ldap_host') == 'after'
+    assert SystemSetting.get('ldap_bind_user_password') == 's3cret'
+    stored = db.session.get(SystemSetting, 'ldap_bind_user_password')
+    assert stored.is_encrypted and stored.value != 's3cret'
+
+
+def test_admin_settings_page_reads_snapshot(client, db, count_queries, logged_in_user):
+    client.get('/admin/settings')
+
+    db.session.expire_all()
+    with count_queries() as queries:
+        response = client.get('/admin/settings')
+    assert response.status_code == 200
+    assert sum('FROM system_settings' in s for s in queries.statements) <= 1
@@ -0,0 +1,104 @@
+from app.models.cloud_connection import CloudConnection
+from app.models.user import User
+from app.utils import visibility
+from app.utils.visibility import (
+    get_visible_connection_ids, get_visible_connections, visible_connection_ids_query,
+)
+
+
+def _setup(db):
+    alice = User(username='alice', email='alice@example.com')
+    bob = User(username='bob', email='bob@example.com')
+    db.session.add_all([alice, bob])
+    db.session.flush()
+    own = CloudConnection(name='alice-aws', provider='aws', user_id=alice.id, credentials_encrypted='')
+    other = CloudConnection(name='bob-aws', provider='aws', user_id=bob.id, credentials_encrypted='')
+    default = CloudConnection(
+        name='default-azure', provider='azure', user_id=None, is_default=True, credentials_encrypted='',
+    )
+    inactive = CloudConnection(
+        name='old', provider='aws', user_id=alice.id, is_active=False, credentials_encrypted='',
+    )
+    db.session.add_all([own, other, default, inactive])
+    db.session.commit()
+    return alice, own, default
+
+
+def _prime(app, *users):
+    with app.app_context():
+        for user in users:
+            get_visible_connection_ids(user)
+
+
+def test_visible_connections(app, db):
+    alice, own, default = _setup(db)
+    with app.app_context():
+        assert get_visible_connection_ids(alice) == {own.id, default.id}
+        assert [c.name for c in get_visible_connections(alice)] == ['alice-aws', 'default-azure']
+        assert set(db.session.scalars(visible_connection_ids_query(alice))) == {own.id, default.id}
+
+
+def test_visible_ids_are_cached_until_connections_change(app, db, count_queries):
+    alice, own, default = _setup(db)
+    expected = {own.id, default.id}
+    with app.app_context():
+        get_visible_connection_ids(alice)
+    with app.app_context(), count_queries() as queries:
+        assert get_visible_connection_ids(alice) == expected
+    assert queries.count == 0
+
+    added = CloudConnection(name='alice-2', provider='azure', user_id=alice.id, credentials_encrypted='')
+    db.session.add(added)
+    db.session.commit()
+    with app.app_context():
+        assert added.id in get_visible_connection_ids(alice)
+
+    # A change to a server default affects every user
+    default.is_active = False
+    db.session.commit()
+    with app.app_context():
+        assert default.id not in get_visible_connection_ids(alice)
+
+
+def test_cache_expires(app, db, monkeypatch):
+    alice, own, default = _setup(db)
+    own_id = own.id
+    with app.app_context():
+        get_visible_connection_ids(alice)
+    # Simulate a change made by another worker process
+    db.session.execute(db.update(CloudConnection).where(CloudConnection.id == own_id).values(is_active=False))
+    db.session.commit()
+    with app.app_context():
+        assert own_id in get_visible_connection_ids(alice)
+
+    clock = visibility.time.monotonic() + app.config['VISIBILITY_CACHE_SECONDS'] + 1
+    monkeypatch.setattr(visibility.time, 'monotonic', lambda: clock)
+    with app.app_context():
+        assert own_id not in get_visible_connection_ids(alice)
+
+
+def test_reassigning_a_connection_updates_both_owners(app, db):
+    alice, own, default = _setup(db)
+    bob = User.query.filter_by(username='bob').one()
+    _prime(app, alice, bob)
+
+    own.user_id = bob.id
+    db.session.commit()
+    with app.app_context():
+        assert own.id not in get_visible_connection_ids(alice)
+        assert own.id in get_visible_connection_ids(bob)
+
+
+def test_sharing_a_connection_updates_every_user(app, db):
+    alice, own, default = _setup(db)
+    bob = User.query.filter_by(username='bob').one()
+    shared = CloudConnection(name='shared', provider='aws', user_id=None, credentials_encrypted='')
+    db.session.add(shared)
+    db.session.commit()
+    _prime(app, alice, bob)
+
+    shared.is_default = True
+    db.session.commit()
+    with app.app_context():
+        assert shared.id in get_visible_connection_ids(alice)
+        assert shared.id in get_visible_connection_ids(bob)